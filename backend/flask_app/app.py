@@ -3,39 +3,147 @@ from flask_pymongo import PyMongo
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 import os
 from dotenv import load_dotenv
+from write_behind import WriteBehindBuffer
+from indexes import start_index_build
+from json_provider import OrjsonProvider
+from metrics import init_app as init_metrics
+from profiler import create_profiler
+from rate_limit import default_table_path, init_app as init_rate_limit
+from thumbnails import create_thumbnail_service, default_cache_dir
+from catalog_snapshot import CatalogSnapshot
+from inventory_stream import InventoryHub
+from read_routing import init_app as init_read_routing
 
 # Load environment variables
 load_dotenv()
 
-def create_app():
+def create_app(preload=False):
+    """Build the app; preload=True when a pre-fork server builds it in its master
+    
+    A preloaded app opens no MongoDB connections and starts no threads, so
+    every worker forked from it starts clean (see server.py)
+    """
     app = Flask(__name__)
     
+    # orjson-backed JSON encoding that understands ObjectId and datetime
+    app.json = OrjsonProvider(app)
+    
     # Configuration
     app.config['MONGO_URI'] = os.getenv('MONGO_URI', 'mongodb://localhost:27017/grocerstock')
     app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'your-super-secret-jwt-key-change-in-production')
     app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
     app.config['OPEN_FOOD_FACTS_API_URL'] = os.getenv('OPEN_FOOD_FACTS_API_URL', 'https://world.openfoodfacts.org/api/v0')
+    app.config['WRITE_BEHIND_FLUSH_INTERVAL'] = float(os.getenv('WRITE_BEHIND_FLUSH_INTERVAL', '5'))
+    app.config['WRITE_BEHIND_MAX_ENTRIES'] = int(os.getenv('WRITE_BEHIND_MAX_ENTRIES', '500'))
+    app.config['ENSURE_INDEXES'] = os.getenv('ENSURE_INDEXES', 'true').lower() == 'true'
+    app.config['METRICS_ENABLED'] = os.getenv('METRICS_ENABLED', 'false').lower() == 'true'
+    app.config['PROFILER_ENABLED'] = os.getenv('PROFILER_ENABLED', 'false').lower() == 'true'
+    app.config['PROFILER_SLOW_MS'] = float(os.getenv('PROFILER_SLOW_MS', '100'))
+    app.config['PROFILER_SAMPLE_RATE'] = float(os.getenv('PROFILER_SAMPLE_RATE', '0.1'))
+    app.config['PROFILER_MAX_PER_MINUTE'] = int(os.getenv('PROFILER_MAX_PER_MINUTE', '6'))
+    app.config['PROFILER_SHAPE_TTL'] = float(os.getenv('PROFILER_SHAPE_TTL', '600'))
+    app.config['RATE_LIMIT_ENABLED'] = os.getenv('RATE_LIMIT_ENABLED', 'false').lower() == 'true'
+    app.config['RATE_LIMIT_TABLE_PATH'] = os.getenv('RATE_LIMIT_TABLE_PATH', default_table_path())
+    app.config['RATE_LIMIT_SLOTS'] = int(os.getenv('RATE_LIMIT_SLOTS', '65536'))
+    app.config['RATE_LIMIT_CAPACITY'] = float(os.getenv('RATE_LIMIT_CAPACITY', '60'))
+    app.config['RATE_LIMIT_REFILL_PER_SEC'] = float(os.getenv('RATE_LIMIT_REFILL_PER_SEC', '1'))
+    app.config['RATE_LIMIT_EXPENSIVE_CONCURRENCY'] = int(os.getenv('RATE_LIMIT_EXPENSIVE_CONCURRENCY', '4'))
+    app.config['EXPORT_PARTITIONS'] = int(os.getenv('EXPORT_PARTITIONS', '4'))
+    app.config['THUMBNAIL_CACHE_DIR'] = os.getenv('THUMBNAIL_CACHE_DIR', default_cache_dir())
+    app.config['THUMBNAIL_CACHE_MAX_MB'] = int(os.getenv('THUMBNAIL_CACHE_MAX_MB', '256'))
+    app.config['THUMBNAIL_WORKERS'] = int(os.getenv('THUMBNAIL_WORKERS', '2'))
+    app.config['THUMBNAIL_SOURCE_DIR'] = os.getenv('THUMBNAIL_SOURCE_DIR')
+    app.config['THUMBNAIL_ALLOWED_HOSTS'] = [
+        host.strip().lower() for host in os.getenv('THUMBNAIL_ALLOWED_HOSTS', 'openfoodfacts.org').split(',') if host.strip()
+    ]
+    app.config['BATCH_MAX_REQUESTS'] = int(os.getenv('BATCH_MAX_REQUESTS', '20'))
+    app.config['BATCH_WORKERS'] = int(os.getenv('BATCH_WORKERS', '4'))
+    app.config['SCAN_SESSION_MAX_SCANS'] = int(os.getenv('SCAN_SESSION_MAX_SCANS', '500'))
+    app.config['SCAN_SESSION_MAX_LOOKUPS'] = int(os.getenv('SCAN_SESSION_MAX_LOOKUPS', '20'))
+    app.config['SCAN_SESSION_LOOKUP_BUDGET'] = float(os.getenv('SCAN_SESSION_LOOKUP_BUDGET', '3'))
+    app.config['SCAN_LOOKUP_WORKERS'] = int(os.getenv('SCAN_LOOKUP_WORKERS', '4'))
+    app.config['CATALOG_SNAPSHOT_PATH'] = os.getenv('CATALOG_SNAPSHOT_PATH', '')
+    app.config['INVENTORY_STREAM_HISTORY'] = int(os.getenv('INVENTORY_STREAM_HISTORY', '1000'))
+    app.config['INVENTORY_STREAM_QUEUE_SIZE'] = int(os.getenv('INVENTORY_STREAM_QUEUE_SIZE', '100'))
+    app.config['INVENTORY_STREAM_HEARTBEAT'] = float(os.getenv('INVENTORY_STREAM_HEARTBEAT', '15'))
+    app.config['READ_ROUTING_ENABLED'] = os.getenv('READ_ROUTING_ENABLED', 'false').lower() == 'true'
+    app.config['MONGO_MAX_STALENESS_SECONDS'] = int(os.getenv('MONGO_MAX_STALENESS_SECONDS', '90'))
+    
+    # Command listeners (metrics, slow query profiler) must be attached when
+    # the Mongo client is created
+    event_listeners = []
+    if app.config['METRICS_ENABLED']:
+        event_listeners.append(init_metrics(app))
+    profiler = create_profiler(app)
+    if profiler:
+        event_listeners.append(profiler)
     
-    # Initialize extensions
-    mongo = PyMongo(app)
+    # Initialize extensions; the client connects on first use, so each
+    # worker forked before that opens its own pool
+    mongo = PyMongo(app, event_listeners=event_listeners, connect=False)
+    # async_app attaches the same listeners to its Motor client
+    app.mongo_listeners = event_listeners
+    if profiler:
+        profiler.attach(mongo.cx)
     jwt = JWTManager(app)
     CORS(app)
     
-    # Make mongo available to routes
-    app.mongo = mongo
+    # Make mongo available to routes, with reads sent to the primary or a
+    # secondary depending on the endpoint (read_routing.ENDPOINT_CONSISTENCY)
+    app.mongo = init_read_routing(app, mongo)
+    
+    # Token-bucket rate limiting shared across worker processes
+    if app.config['RATE_LIMIT_ENABLED']:
+        init_rate_limit(app)
+    
+    # Buffer for non-critical writes (last_login, popularity counters)
+    app.write_behind = WriteBehindBuffer(
+        mongo.db,
+        flush_interval=app.config['WRITE_BEHIND_FLUSH_INTERVAL'],
+        max_entries=app.config['WRITE_BEHIND_MAX_ENTRIES']
+    )
+    
+    # Resized product images, fetched once and cached on disk
+    app.thumbnails = create_thumbnail_service(app)
+    
+    # mmap'd product catalog shared by all workers (built by catalog_snapshot.py)
+    app.catalog = CatalogSnapshot(app.config['CATALOG_SNAPSHOT_PATH']) if app.config['CATALOG_SNAPSHOT_PATH'] else None
+    
+    # Runs the read sub-requests of POST /api/batch concurrently
+    app.batch_executor = ThreadPoolExecutor(max_workers=app.config['BATCH_WORKERS'], thread_name_prefix='batch')
+    
+    # Open Food Facts lookups for unknown barcodes in a scanning session; a
+    # pool of its own, since a session may itself run as a batch sub-request
+    app.lookup_executor = ThreadPoolExecutor(max_workers=app.config['SCAN_LOOKUP_WORKERS'], thread_name_prefix='off-lookup')
+    
+    # Fans inventory writes out to open GET /api/inventory/stream connections
+    # in every worker, through the capped inventory_changes collection
+    app.inventory_hub = InventoryHub(
+        mongo.db.inventory_changes,
+        history=app.config['INVENTORY_STREAM_HISTORY'],
+        max_queue=app.config['INVENTORY_STREAM_QUEUE_SIZE']
+    )
+    
+    # Create any missing indexes declared in indexes.py (a preloaded app
+    # leaves this to its first worker)
+    if app.config['ENSURE_INDEXES'] and not preload:
+        start_index_build(mongo.db)
     
     # Register blueprints
     from routes.auth import auth_bp
     from routes.products import products_bp
     from routes.inventory import inventory_bp
     from routes.barcode import barcode_bp
+    from routes.batch import batch_bp
     
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(products_bp, url_prefix='/api/products')
     app.register_blueprint(inventory_bp, url_prefix='/api/inventory')
     app.register_blueprint(barcode_bp, url_prefix='/api/barcode')
+    app.register_blueprint(batch_bp, url_prefix='/api/batch')
     
     # Health check endpoint
     @app.route('/api/health', methods=['GET'])
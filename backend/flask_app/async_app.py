@@ -0,0 +1,319 @@
+"""ASGI entry point for the I/O-bound endpoints.
+
+Product search (which may wait on Open Food Facts) and the inventory
+aggregations run as coroutines on Motor and httpx, so one process can keep
+many slow requests in flight. Every other route is served by the regular
+Flask app through a WSGI adapter, so the API surface is identical.
+
+The native routes do not pass through the Flask request hooks, so
+FlaskHooks applies the same rate limit, load shedding and request metrics
+under the Flask endpoint name of each route. Their Motor reads go through
+the same consistency map (read_routing.ENDPOINT_CONSISTENCY), and products
+added from Open Food Facts are recorded on the catalog snapshot overlay.
+
+Run with:  uvicorn async_app:app --factory --port 5000
+"""
+import time
+from contextlib import asynccontextmanager
+from functools import wraps
+
+import httpx
+from asgiref.wsgi import WsgiToAsgi
+from flask_jwt_extended import decode_token
+from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Mount, Route
+
+from app import create_app
+from metrics import observe_request, track_round_trips, upstream_timer
+from rate_limit import EXPENSIVE_ENDPOINTS, check_request
+from read_routing import PRIMARY
+from routes.inventory import (
+    annotate_expiry,
+    build_expiring_pipeline,
+    build_inventory_filter,
+    build_inventory_pipeline,
+    get_inventory_summary,
+)
+from routes.products import (
+    build_search_filter,
+    format_product,
+    open_food_facts_product_url,
+    parse_open_food_facts_response,
+)
+
+# Flask endpoint names of the native routes, for rate limits, metrics and read routing
+SEARCH_PRODUCTS = 'products.search_products'
+GET_INVENTORY = 'inventory.get_inventory'
+GET_EXPIRING_ITEMS = 'inventory.get_expiring_items'
+
+
+def bearer_token(request):
+    auth_header = request.headers.get('Authorization', '')
+    return auth_header[len('Bearer '):] if auth_header.startswith('Bearer ') else None
+
+
+def token_identity(flask_app, token):
+    with flask_app.app_context():
+        claims = decode_token(token)
+    return claims[flask_app.config.get('JWT_IDENTITY_CLAIM', 'sub')]
+
+
+class FlaskHooks:
+    """ASGI middleware doing for a native route what the Flask hooks do for Flask routes"""
+
+    def __init__(self, app, flask_app, endpoint):
+        self.app = app
+        self.flask_app = flask_app
+        self.endpoint = endpoint
+
+    def client_key(self, request):
+        """JWT identity when a valid token is sent, otherwise the client address"""
+        token = bearer_token(request)
+        if token:
+            try:
+                return f'user:{token_identity(self.flask_app, token)}'
+            except Exception:
+                pass
+        return f'ip:{request.client.host if request.client else None}'
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] == 'OPTIONS':
+            await self.app(scope, receive, send)
+            return
+
+        config = self.flask_app.config
+        started = time.perf_counter()
+        round_trips = track_round_trips()
+        status = [500]
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        holds_expensive_slot = False
+        try:
+            if config['RATE_LIMIT_ENABLED']:
+                rejection = check_request(
+                    self.flask_app.rate_limiter, self.flask_app.expensive_slots,
+                    self.client_key(Request(scope)), self.endpoint
+                )
+                if rejection:
+                    status_code, payload, retry_after = rejection
+                    response = Response(
+                        self.flask_app.json.dumps(payload), status_code=status_code,
+                        media_type='application/json', headers={'Retry-After': str(retry_after)}
+                    )
+                    await response(scope, receive, send_with_status)
+                    return
+                holds_expensive_slot = self.endpoint in EXPENSIVE_ENDPOINTS
+
+            await self.app(scope, receive, send_with_status)
+        finally:
+            if holds_expensive_slot:
+                self.flask_app.expensive_slots.release()
+            if config['METRICS_ENABLED']:
+                observe_request(
+                    self.endpoint, scope['method'], status[0],
+                    time.perf_counter() - started, round_trips[0]
+                )
+
+
+def create_asgi_app(flask_app=None):
+    flask_app = flask_app or create_app()
+    state = {}
+
+    def jsonify(payload, status=200):
+        # Same JSON provider as the Flask app so both variants encode identically
+        return Response(flask_app.json.dumps(payload), status_code=status, media_type='application/json')
+
+    def jwt_required(handler):
+        @wraps(handler)
+        async def wrapper(request):
+            token = bearer_token(request)
+            if not token:
+                return jsonify({'msg': 'Missing Authorization Header'}, 401)
+            try:
+                request.state.identity = token_identity(flask_app, token)
+            except Exception as e:
+                return jsonify({'msg': str(e)}, 401)
+            return await handler(request)
+        return wrapper
+
+    def read_database(request, endpoint):
+        """(consistency, Motor database) for the endpoint, as app.mongo.db picks for Flask routes"""
+        consistency = flask_app.mongo.consistency_for(
+            endpoint, request.state.identity, request.headers.get('X-Read-After')
+        )
+        return consistency, state['databases'][consistency]
+
+    @jwt_required
+    async def search_products(request):
+        try:
+            barcode = request.query_params.get('barcode')
+            query = request.query_params.get('query')
+
+            if not barcode and not query:
+                return jsonify({'error': 'Either barcode or query parameter is required'}, 400)
+
+            if barcode:
+                return await search_by_barcode(request, barcode)
+            else:
+                return await search_by_query(request, query)
+
+        except Exception as e:
+            return jsonify({'error': 'Search failed', 'details': str(e)}, 500)
+
+    async def search_by_barcode(request, barcode):
+        # Shared catalog snapshot first, when one is configured
+        if flask_app.catalog:
+            cached = flask_app.catalog.by_barcode(barcode)
+            if cached:
+                flask_app.write_behind.inc('products', cached['id'], {'lookup_count': 1})
+                return jsonify({
+                    'found': True,
+                    'source': 'local',
+                    'product': cached
+                })
+
+        consistency, db = read_database(request, SEARCH_PRODUCTS)
+        product = await db.products.find_one({'barcode': barcode})
+
+        # A secondary may not have a product another user just added
+        if not product and consistency != PRIMARY:
+            product = await state['databases'][PRIMARY].products.find_one({'barcode': barcode})
+
+        if product:
+            flask_app.write_behind.inc('products', product['_id'], {'lookup_count': 1})
+            return jsonify({
+                'found': True,
+                'source': 'local',
+                'product': format_product(product)
+            })
+
+        try:
+            with upstream_timer('open_food_facts') as timer:
+                response = await state['http'].get(
+                    open_food_facts_product_url(flask_app.config['OPEN_FOOD_FACTS_API_URL'], barcode)
+                )
+                timer.outcome = response.status_code
+
+            if response.status_code == 200:
+                product_data = parse_open_food_facts_response(response.json())
+
+                if product_data:
+                    await state['databases'][PRIMARY].products.insert_one(product_data)
+                    if flask_app.catalog:
+                        flask_app.catalog.record_write(product_data)
+
+                    return jsonify({
+                        'found': True,
+                        'source': 'open_food_facts',
+                        'product': format_product(product_data)
+                    })
+
+            return jsonify({
+                'found': False,
+                'message': 'Product not found in database'
+            })
+
+        except httpx.HTTPError as e:
+            return jsonify({'error': 'Failed to query Open Food Facts API', 'details': str(e)}, 500)
+
+    async def search_by_query(request, query):
+        _, db = read_database(request, SEARCH_PRODUCTS)
+        products = await db.products.find(build_search_filter(query)).limit(20).to_list(20)
+
+        return jsonify({
+            'found': len(products) > 0,
+            'products': [format_product(product) for product in products],
+            'count': len(products)
+        })
+
+    @jwt_required
+    async def get_inventory(request):
+        try:
+            args = request.query_params
+            status = args.get('status', 'active')
+            sort_by = args.get('sort_by', 'expiry_date')
+            sort_order = 1 if args.get('sort_order', 'asc') == 'asc' else -1
+
+            query_filter = build_inventory_filter(request.state.identity, status, args.get('category'))
+            _, db = read_database(request, GET_INVENTORY)
+            cursor = db.inventory.aggregate(
+                build_inventory_pipeline(query_filter, sort={sort_by: sort_order})
+            )
+            inventory_items = annotate_expiry(await cursor.to_list(None))
+
+            return jsonify({
+                'inventory': inventory_items,
+                'count': len(inventory_items),
+                'summary': get_inventory_summary(inventory_items)
+            })
+
+        except Exception as e:
+            return jsonify({'error': 'Failed to fetch inventory', 'details': str(e)}, 500)
+
+    @jwt_required
+    async def get_expiring_items(request):
+        try:
+            days = int(request.query_params.get('days', 7))
+            _, db = read_database(request, GET_EXPIRING_ITEMS)
+            cursor = db.inventory.aggregate(
+                build_expiring_pipeline(request.state.identity, days)
+            )
+            expiring_items = await cursor.to_list(None)
+
+            return jsonify({
+                'expiring_items': expiring_items,
+                'count': len(expiring_items),
+                'threshold_days': days
+            })
+
+        except Exception as e:
+            return jsonify({'error': 'Failed to fetch expiring items', 'details': str(e)}, 500)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        # Clients are created inside the worker's event loop, never in a
+        # pre-fork master process.
+        client = AsyncIOMotorClient(flask_app.config['MONGO_URI'], event_listeners=flask_app.mongo_listeners)
+        name = client.get_default_database('grocerstock').name
+        state['databases'] = {
+            consistency: client.get_database(name, read_preference=read_preference)
+            for consistency, read_preference in flask_app.mongo.read_preferences().items()
+        }
+        state['http'] = httpx.AsyncClient(timeout=10)
+        try:
+            yield
+        finally:
+            await state['http'].aclose()
+            client.close()
+            flask_app.write_behind.flush()
+
+    # Flask-CORS only covers the routes Flask serves; mirror its defaults here
+    cors = Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])
+
+    def native_route(path, handler, endpoint):
+        hooks = Middleware(FlaskHooks, flask_app=flask_app, endpoint=endpoint)
+        return Route(path, handler, methods=['GET', 'OPTIONS'], name=endpoint, middleware=[cors, hooks])
+
+    return Starlette(
+        routes=[
+            native_route('/api/products/search', search_products, SEARCH_PRODUCTS),
+            native_route('/api/inventory', get_inventory, GET_INVENTORY),
+            native_route('/api/inventory/expiring', get_expiring_items, GET_EXPIRING_ITEMS),
+            Mount('/', app=WsgiToAsgi(flask_app)),
+        ],
+        lifespan=lifespan,
+    )
+
+
+def app():
+    """Factory for `uvicorn async_app:app --factory`"""
+    return create_asgi_app()
@@ -0,0 +1,5 @@
+"""Performance benchmarks for the Flask backend.
+
+Benchmarks talk to a real mongod (MONGO_URI) and never to the real Open Food
+Facts API; see off_stub.py.
+"""
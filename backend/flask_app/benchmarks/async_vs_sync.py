@@ -0,0 +1,66 @@
+"""Requests/sec per process for the sync and async apps under mixed load.
+
+Both servers run a single process against the same mongod and an Open Food
+Facts stub with a fixed upstream delay. The mix is barcode lookups that miss
+locally and wait on the stub, plus inventory listings and expiring-item
+queries. Results are printed as JSON.
+
+    python -m benchmarks.async_vs_sync --duration 20 --concurrency 64
+"""
+import argparse
+import asyncio
+import json
+import uuid
+
+from bson import ObjectId
+
+from benchmarks.load import Scenario, run_load
+from benchmarks.off_stub import start_stub
+from benchmarks.servers import make_token, start_server, stop_server
+
+
+def mixed_scenarios():
+    return [
+        # Unknown barcodes always miss locally and go to the OFF stub
+        Scenario('barcode_lookup_off', 4, 'GET',
+                 lambda: f'/api/products/search?barcode=00{uuid.uuid4().int % 10 ** 11:011d}'),
+        Scenario('inventory_list', 4, 'GET', '/api/inventory'),
+        Scenario('inventory_expiring', 2, 'GET', '/api/inventory/expiring?days=7'),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--duration', type=float, default=15.0)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--off-delay', type=float, default=0.1, help='stub upstream latency in seconds')
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--user-id', default=None, help='user whose inventory is listed (default: random)')
+    args = parser.parse_args()
+
+    stub, stub_url = start_stub(delay=args.off_delay)
+    headers = {'Authorization': f'Bearer {make_token(args.user_id or str(ObjectId()))}'}
+    env = {'OPEN_FOOD_FACTS_API_URL': stub_url, 'ENSURE_INDEXES': 'false'}
+
+    results = {'concurrency': args.concurrency, 'duration': args.duration, 'off_delay': args.off_delay}
+    try:
+        for kind in ('sync', 'async'):
+            server = start_server(kind, args.port, env)
+            try:
+                results[kind] = asyncio.run(run_load(
+                    f'http://127.0.0.1:{args.port}', mixed_scenarios(),
+                    concurrency=args.concurrency, duration=args.duration, headers=headers
+                ))
+            finally:
+                stop_server(server)
+    finally:
+        stub.shutdown()
+
+    results['speedup'] = round(
+        results['async']['total']['throughput'] / max(results['sync']['total']['throughput'], 0.01), 2
+    )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
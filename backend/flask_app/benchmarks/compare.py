@@ -0,0 +1,51 @@
+"""Compare two benchmarks.run reports scenario by scenario.
+
+    python -m benchmarks.compare before.json after.json
+"""
+import argparse
+import json
+
+FIELDS = ('throughput', 'p50_ms', 'p95_ms', 'p99_ms')
+
+
+def change(before, after):
+    if not before or after is None:
+        return 'n/a'
+    return f'{(after - before) / before * 100:+.1f}%'
+
+
+def compare(before, after):
+    rows = []
+    for mix, scenarios in after['results'].items():
+        for scenario, stats in scenarios.items():
+            old = before['results'].get(mix, {}).get(scenario, {})
+            rows.append([f'{mix}/{scenario}'] + [
+                f'{old.get(field)} -> {stats.get(field)} ({change(old.get(field), stats.get(field))})'
+                for field in FIELDS
+            ])
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('before')
+    parser.add_argument('after')
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    if before['dataset'] != after['dataset']:
+        print('warning: reports were produced from different datasets')
+    print(f"{before.get('commit')} -> {after.get('commit')}")
+
+    rows = [['scenario', *FIELDS]] + compare(before, after)
+    widths = [max(len(row[column]) for row in rows) for column in range(len(FIELDS) + 1)]
+    for row in rows:
+        print('  '.join(cell.ljust(width) for cell, width in zip(row, widths)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Serialization time for a large inventory response.
+
+Compares the stdlib provider, which needs every ObjectId/datetime converted
+by hand first, with the orjson provider encoding the aggregation output as
+is. No database is needed. Results are printed as JSON.
+
+    python -m benchmarks.json_serialization --items 5000
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from json_provider import OrjsonProvider
+from routes.inventory import annotate_expiry, get_inventory_summary
+
+
+def synthetic_inventory(count):
+    """Documents shaped like the get_inventory aggregation output"""
+    now = datetime.utcnow()
+    items = []
+    for i in range(count):
+        items.append({
+            '_id': ObjectId(),
+            'quantity': float(random.randint(1, 10)),
+            'expiry_date': now + timedelta(days=random.randint(-5, 60)),
+            'added_date': now - timedelta(days=random.randint(0, 30)),
+            'location': random.choice(['pantry', 'fridge', 'freezer']),
+            'notes': '',
+            'status': 'active',
+            'product': {
+                'id': ObjectId(),
+                'name': f'Product {i}',
+                'brand': f'Brand {i % 50}',
+                'category': f'Category {i % 10}',
+                'image_url': f'https://images.example.com/{i}.jpg',
+                'barcode': f'{i:013d}'
+            }
+        })
+    return annotate_expiry(items)
+
+
+def hand_converted(items):
+    """What the routes had to do before the orjson provider"""
+    converted = []
+    for item in items:
+        item = dict(item, product=dict(item['product']))
+        item['_id'] = str(item['_id'])
+        item['product']['id'] = str(item['product']['id'])
+        for field in ('expiry_date', 'added_date'):
+            if item.get(field):
+                item[field] = item[field].isoformat()
+        converted.append(item)
+    return converted
+
+
+def time_it(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return {
+        'median_ms': round(statistics.median(timings) * 1000, 3),
+        'min_ms': round(min(timings) * 1000, 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=30)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    stdlib = DefaultJSONProvider(app)
+    fast = OrjsonProvider(app)
+
+    items = synthetic_inventory(args.items)
+    payload = {'inventory': items, 'count': len(items), 'summary': get_inventory_summary(items)}
+
+    def stdlib_response():
+        stdlib.dumps(dict(payload, inventory=hand_converted(items)))
+
+    def orjson_response():
+        fast.dumps(payload)
+
+    results = {
+        'items': args.items,
+        'bytes': len(fast.dumps(payload)),
+        'stdlib_hand_converted': time_it(stdlib_response, args.repeat),
+        'orjson_provider': time_it(orjson_response, args.repeat),
+    }
+    results['speedup'] = round(
+        results['stdlib_hand_converted']['median_ms'] / results['orjson_provider']['median_ms'], 1
+    )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
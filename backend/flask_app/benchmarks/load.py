@@ -0,0 +1,89 @@
+"""Fixed-concurrency HTTP load driver with latency percentiles."""
+import asyncio
+import random
+import time
+from collections import namedtuple
+
+import httpx
+
+Scenario = namedtuple('Scenario', ['name', 'weight', 'method', 'path', 'json'])
+Scenario.__new__.__defaults__ = (None,)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+def summarize(latencies, errors, elapsed):
+    """Throughput and p50/p95/p99 (in ms) for one scenario"""
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput': round(len(latencies) / elapsed, 2) if elapsed else 0,
+        'p50_ms': _ms(percentile(latencies, 50)),
+        'p95_ms': _ms(percentile(latencies, 95)),
+        'p99_ms': _ms(percentile(latencies, 99)),
+    }
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+def _resolve(value):
+    return value() if callable(value) else value
+
+
+async def run_load(base_url, scenarios, concurrency=32, duration=10.0, headers=None, warmup=1.0):
+    """Drive weighted scenarios at fixed concurrency and return per-scenario stats.
+
+    Each worker picks a scenario by weight, waits for the response and
+    immediately issues the next one (closed loop), so throughput is bounded by
+    server latency rather than by an arrival rate. Responses with status >= 500
+    or transport errors count as errors. ``headers`` may be a callable to
+    vary them per request (e.g. a different user's token each time).
+    """
+    request_headers = headers
+    weights = [scenario.weight for scenario in scenarios]
+    latencies = {scenario.name: [] for scenario in scenarios}
+    errors = {scenario.name: 0 for scenario in scenarios}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        async def worker(deadline, record):
+            while time.perf_counter() < deadline:
+                scenario = random.choices(scenarios, weights)[0]
+                started = time.perf_counter()
+                try:
+                    response = await client.request(
+                        scenario.method, _resolve(scenario.path),
+                        json=_resolve(scenario.json), headers=_resolve(request_headers)
+                    )
+                    failed = response.status_code >= 500
+                except httpx.HTTPError:
+                    failed = True
+                if not record:
+                    continue
+                if failed:
+                    errors[scenario.name] += 1
+                else:
+                    latencies[scenario.name].append(time.perf_counter() - started)
+
+        if warmup:
+            deadline = time.perf_counter() + warmup
+            await asyncio.gather(*(worker(deadline, False) for _ in range(concurrency)))
+
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(worker(deadline, True) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    results = {name: summarize(latencies[name], errors[name], elapsed) for name in latencies}
+    all_latencies = [value for values in latencies.values() for value in values]
+    results['total'] = summarize(all_latencies, sum(errors.values()), elapsed)
+    return results
@@ -0,0 +1,75 @@
+"""Local stand-in for the Open Food Facts product API.
+
+Serves /product/<barcode>.json after a configurable delay so benchmarks see
+realistic upstream latency without hitting the real service. Barcodes that
+start with KNOWN_PREFIX resolve to a synthetic product, everything else is
+reported as not found.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+KNOWN_PREFIX = '99'
+
+
+def synthetic_product(barcode):
+    """OFF-shaped product document for a barcode"""
+    return {
+        'code': barcode,
+        'product_name': f'Stub Product {barcode}',
+        'brands': 'Stub Brand',
+        'categories': 'Groceries',
+        'image_url': None,
+        'quantity': '1 unit',
+        'nutriments': {}
+    }
+
+
+def make_handler(delay):
+    class OpenFoodFactsStubHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+
+            barcode = self.path.rsplit('/', 1)[-1].replace('.json', '')
+            if self.path.startswith('/product/') and barcode.startswith(KNOWN_PREFIX):
+                body = {'status': 1, 'product': synthetic_product(barcode)}
+            else:
+                body = {'status': 0, 'status_verbose': 'product not found'}
+
+            payload = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return OpenFoodFactsStubHandler
+
+
+def start_stub(host='127.0.0.1', port=0, delay=0.05):
+    """Start the stub in a daemon thread; returns (server, base_url)"""
+    server = ThreadingHTTPServer((host, port), make_handler(delay))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='off-stub', daemon=True)
+    thread.start()
+    return server, f'http://{host}:{server.server_address[1]}'
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--delay', type=float, default=0.05, help='seconds per response')
+    args = parser.parse_args()
+
+    server, url = start_stub(port=args.port, delay=args.delay)
+    print(f'Open Food Facts stub listening on {url}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
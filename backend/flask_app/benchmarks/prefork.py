@@ -0,0 +1,176 @@
+"""Cold-worker first-request latency and per-worker memory, plain gunicorn vs server.py.
+
+``cold`` is gunicorn importing app:create_app() in every worker (as in
+benchmarks.servers). ``prefork`` is server.py, which builds and warms the app
+once in the master and forks workers from it.
+
+Latency: each trial starts a fresh single-worker server. It records the time
+until the first response once the listening socket accepts, which is
+mostly worker boot. It then times the first authenticated inventory read,
+which for a cold worker includes opening its MongoDB pool, and the median of
+the reads after it.
+
+Memory: a multi-worker server is driven with inventory reads until every
+worker has served requests. Each worker's RSS, PSS and private memory is
+then read from /proc/<pid>/smaps_rollup (Linux only). PSS charges shared
+pages proportionally, so it is the number that shows copy-on-write sharing.
+
+Run benchmarks.seed first.
+
+    python -m benchmarks.prefork --trials 5 --workers 4
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from pymongo import MongoClient
+
+from benchmarks.seed import DEFAULT_MONGO_URI
+from benchmarks.servers import APP_DIR, make_token, stop_server
+
+COMMANDS = {
+    'cold': lambda port, workers, threads: [
+        sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--worker-class', 'gthread',
+        '--threads', str(threads), '--bind', f'127.0.0.1:{port}', 'app:create_app()'
+    ],
+    'prefork': lambda port, workers, threads: [
+        sys.executable, 'server.py', '--workers', str(workers), '--threads', str(threads),
+        '--bind', f'127.0.0.1:{port}'
+    ],
+}
+
+SMAPS_FIELDS = ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty')
+
+
+def start(kind, port, workers, threads, env, timeout=60.0):
+    """Launch a server; returns the process and the seconds until its socket accepted"""
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        COMMANDS[kind](port, workers, threads), cwd=APP_DIR, env={**os.environ, **env},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'{kind} server exited with status {process.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return process, time.perf_counter() - started
+        except OSError:
+            time.sleep(0.01)
+    stop_server(process)
+    raise RuntimeError(f'{kind} server did not listen within {timeout}s')
+
+
+def timed_get(url, headers=None):
+    started = time.perf_counter()
+    response = httpx.get(url, headers=headers, timeout=60)
+    response.raise_for_status()
+    return (time.perf_counter() - started) * 1000
+
+
+def latency_trial(kind, port, threads, env, headers):
+    process, listen_s = start(kind, port, 1, threads, env)
+    try:
+        base = f'http://127.0.0.1:{port}'
+        first_response_ms = timed_get(f'{base}/api/health')
+        first_read_ms = timed_get(f'{base}/api/inventory', headers)
+        warm_read_ms = statistics.median(timed_get(f'{base}/api/inventory', headers) for _ in range(20))
+    finally:
+        stop_server(process)
+    return {
+        'listen_ms': listen_s * 1000,
+        'first_response_ms': first_response_ms,
+        'first_inventory_read_ms': first_read_ms,
+        'warm_inventory_read_ms': warm_read_ms,
+    }
+
+
+def child_pids(pid):
+    pids = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # The command name may contain spaces; the parent pid follows it
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            pids.append(int(entry))
+    return pids
+
+
+def memory_mb(pid):
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            name, _, rest = line.partition(':')
+            if name in SMAPS_FIELDS:
+                values[name] = int(rest.split()[0]) / 1024
+    return {
+        'rss_mb': values['Rss'],
+        'pss_mb': values['Pss'],
+        'private_mb': values['Private_Clean'] + values['Private_Dirty'],
+    }
+
+
+def memory_run(kind, port, workers, threads, env, headers, requests):
+    process, _ = start(kind, port, workers, threads, env)
+    try:
+        base = f'http://127.0.0.1:{port}'
+        timed_get(f'{base}/api/health')
+        with ThreadPoolExecutor(max_workers=workers * 4) as pool:
+            list(pool.map(lambda _: timed_get(f'{base}/api/inventory', headers), range(requests)))
+        time.sleep(1)
+        master = memory_mb(process.pid)
+        per_worker = [memory_mb(pid) for pid in child_pids(process.pid)]
+    finally:
+        stop_server(process)
+    return {
+        'workers': len(per_worker),
+        'master': {key: round(value, 1) for key, value in master.items()},
+        'worker_mean': {
+            key: round(statistics.mean(worker[key] for worker in per_worker), 1) for key in master
+        },
+        'total_pss_mb': round(master['pss_mb'] + sum(worker['pss_mb'] for worker in per_worker), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mongo-uri', default=DEFAULT_MONGO_URI)
+    parser.add_argument('--trials', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--port', type=int, default=5098)
+    args = parser.parse_args()
+
+    db = MongoClient(args.mongo_uri).get_default_database('grocerstock_bench')
+    manifest = db.bench_meta.find_one({'_id': 'manifest'})
+    if not manifest:
+        parser.error('benchmark database is not seeded; run python -m benchmarks.seed first')
+    headers = {'Authorization': f"Bearer {make_token(manifest['sample_user_ids'][0])}"}
+    env = {'MONGO_URI': args.mongo_uri, 'ENSURE_INDEXES': 'false'}
+
+    results = {}
+    for kind in COMMANDS:
+        trials = [latency_trial(kind, args.port, args.threads, env, headers) for _ in range(args.trials)]
+        results[kind] = {
+            'latency': {key: round(statistics.median(trial[key] for trial in trials), 1) for key in trials[0]},
+            'memory': memory_run(kind, args.port, args.workers, args.threads, env, headers, args.requests),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+"""Check read preference routing against a three-node replica set.
+
+Either point it at an existing replica set or let it start one from the
+local mongod binary (three members on consecutive ports, throwaway data
+directories). A global command listener records which member served each
+find/aggregate. The check then drives the app through its test client:
+
+    catalog reads (GET /api/products/<id>)        must go to a secondary
+    inventory reads with no recent write          must go to a secondary
+    inventory reads right after the user's write  must go to the primary
+    ... from another process, given X-Read-After  must go to the primary
+
+It exits with status 1 if any check fails. Results are printed as JSON.
+
+    python -m benchmarks.read_routing --start-replica-set
+    python -m benchmarks.read_routing --mongo-uri 'mongodb://h1,h2,h3/grocerstock_routing?replicaSet=rs0'
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import MongoClient, WriteConcern, monitoring
+
+from benchmarks.servers import APP_DIR
+
+REPLICA_SET = 'rs0'
+DATABASE = 'grocerstock_routing'
+
+
+class ServedBy(monitoring.CommandListener):
+    """Records the member that served each read, per label"""
+
+    READS = ('find', 'aggregate', 'count', 'distinct')
+
+    def __init__(self):
+        self.label = None
+        self.reads = defaultdict(Counter)
+
+    def started(self, event):
+        if self.label and event.command_name in self.READS:
+            self.reads[self.label]['%s:%d' % event.connection_id] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def start_replica_set(base_port):
+    """Launch three local mongod members; returns (processes, data directory, URI)"""
+    if not shutil.which('mongod'):
+        raise RuntimeError('mongod is not on PATH')
+
+    data_dir = tempfile.mkdtemp(prefix='grocerstock-rs-')
+    ports = [base_port + offset for offset in range(3)]
+    processes = []
+    for port in ports:
+        path = os.path.join(data_dir, str(port))
+        os.makedirs(path)
+        processes.append(subprocess.Popen([
+            'mongod', '--replSet', REPLICA_SET, '--port', str(port), '--bind_ip', '127.0.0.1',
+            '--dbpath', path, '--logpath', os.path.join(path, 'mongod.log')
+        ]))
+
+    seed = MongoClient('127.0.0.1', ports[0], directConnection=True, serverSelectionTimeoutMS=30000)
+    seed.admin.command('ping')
+    seed.admin.command('replSetInitiate', {
+        '_id': REPLICA_SET,
+        'members': [
+            # The first member is preferred as primary so runs are repeatable
+            {'_id': index, 'host': f'127.0.0.1:{port}', 'priority': 2 if index == 0 else 1}
+            for index, port in enumerate(ports)
+        ]
+    })
+    hosts = ','.join(f'127.0.0.1:{port}' for port in ports)
+    return processes, data_dir, f'mongodb://{hosts}/{DATABASE}?replicaSet={REPLICA_SET}'
+
+
+def stop_replica_set(processes, data_dir):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def wait_for_members(client, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        client.admin.command('ping')
+        if client.primary and len(client.secondaries) == 2:
+            return client.primary, client.secondaries
+        time.sleep(0.5)
+    raise RuntimeError('replica set did not elect a primary with two secondaries in time')
+
+
+def seed_data(client):
+    """One user with one inventory item, replicated to every member"""
+    db = client.get_default_database(DATABASE).with_options(write_concern=WriteConcern(w=3))
+    for collection in ('users', 'products', 'inventory'):
+        db[collection].delete_many({})
+    user_id = ObjectId()
+    product_id = db.products.insert_one({
+        'barcode': '0000000000017', 'name': 'Whole Milk', 'brand': 'Routing', 'category_id': 'dairy-eggs',
+        'created_at': datetime.utcnow(), 'updated_at': datetime.utcnow()
+    }).inserted_id
+    db.users.insert_one({'_id': user_id, 'email': 'routing@example.com', 'username': 'routing'})
+    db.inventory.insert_one({
+        'user_id': user_id, 'product_id': product_id, 'quantity': 1.0, 'status': 'active',
+        'expiry_date': None, 'added_date': datetime.utcnow(), 'category_id': 'dairy-eggs'
+    })
+    return str(user_id), str(product_id)
+
+
+def make_app(mongo_uri, max_staleness):
+    os.environ.update({
+        'MONGO_URI': mongo_uri,
+        'READ_ROUTING_ENABLED': 'true',
+        'MONGO_MAX_STALENESS_SECONDS': str(max_staleness),
+        'ENSURE_INDEXES': 'false',
+    })
+    from app import create_app
+
+    app = create_app()
+    app.testing = True
+    return app
+
+
+def run_checks(mongo_uri, max_staleness):
+    sys.path.insert(0, APP_DIR)
+    listener = ServedBy()
+    # Applies to every client created from here on, including the apps'
+    monitoring.register(listener)
+
+    client = MongoClient(mongo_uri)
+    primary, secondaries = wait_for_members(client)
+    primary = '%s:%d' % primary
+    user_id, product_id = seed_data(client)
+
+    from flask_jwt_extended import create_access_token
+
+    app = make_app(mongo_uri, max_staleness)
+    # A second app stands in for another worker process that did not see the write
+    other_worker = make_app(mongo_uri, max_staleness)
+    with app.app_context():
+        headers = {'Authorization': f'Bearer {create_access_token(identity=user_id)}'}
+    api = app.test_client()
+    other_api = other_worker.test_client()
+
+    def read(label, test_client, path, extra_headers=None):
+        listener.label = label
+        try:
+            response = test_client.get(path, headers={**headers, **(extra_headers or {})})
+        finally:
+            listener.label = None
+        assert response.status_code == 200, f'{path} returned {response.status_code}: {response.get_data(as_text=True)}'
+        return response
+
+    read('catalog_read', api, f'/api/products/{product_id}')
+    read('inventory_read_no_recent_write', api, '/api/inventory')
+
+    listener.label = 'inventory_write'
+    response = api.put(f'/api/inventory/{_first_item(client, user_id)}', json={'quantity': 2}, headers=headers)
+    listener.label = None
+    assert response.status_code == 200, response.get_data(as_text=True)
+    last_write = response.headers.get('X-Last-Write')
+
+    read('inventory_read_after_write', api, '/api/inventory')
+    read('other_worker_read_with_read_after', other_api, '/api/inventory', {'X-Read-After': last_write or ''})
+    read('other_worker_read_without_read_after', other_api, '/api/inventory')
+
+    expected = {
+        'catalog_read': 'secondary',
+        'inventory_read_no_recent_write': 'secondary',
+        'inventory_read_after_write': 'primary',
+        'other_worker_read_with_read_after': 'primary',
+        'other_worker_read_without_read_after': 'secondary',
+    }
+    results = {}
+    failures = []
+    for label, member_kind in expected.items():
+        members = dict(listener.reads[label])
+        served = {'primary' if member == primary else 'secondary' for member in members}
+        results[label] = {'expected': member_kind, 'served_by': members}
+        if served != {member_kind}:
+            failures.append(label)
+    if not last_write:
+        failures.append('x_last_write_header')
+
+    return {
+        'primary': primary,
+        'secondaries': sorted('%s:%d' % member for member in secondaries),
+        'max_staleness_seconds': max_staleness,
+        'checks': results,
+        'failures': failures,
+    }
+
+
+def _first_item(client, user_id):
+    item = client.get_default_database(DATABASE).inventory.find_one({'user_id': ObjectId(user_id)}, {'_id': 1})
+    return str(item['_id'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mongo-uri', default=None, help='an existing replica set (its data in the URI database is replaced)')
+    parser.add_argument('--start-replica-set', action='store_true', help='start three local mongod members')
+    parser.add_argument('--base-port', type=int, default=27117)
+    parser.add_argument('--max-staleness', type=int, default=90)
+    args = parser.parse_args()
+    if bool(args.mongo_uri) == args.start_replica_set:
+        parser.error('pass either --mongo-uri or --start-replica-set')
+
+    processes, data_dir, mongo_uri = [], None, args.mongo_uri
+    if args.start_replica_set:
+        processes, data_dir, mongo_uri = start_replica_set(args.base_port)
+    try:
+        report = run_checks(mongo_uri, args.max_staleness)
+    finally:
+        if processes:
+            stop_replica_set(processes, data_dir)
+
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if report['failures'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Forecast throughput of the restock job at a million series.
+
+Synthetic consumption matrices shaped like restock_forecast.load_partition
+output are generated partition by partition and run through
+restock_forecast.forecast, serially and then across a process pool. The
+per-series pure Python equivalent is timed on a sample and extrapolated.
+No database is needed. Results are printed as JSON.
+
+    python -m benchmarks.restock_forecast --series 1000000 --partitions 10 --workers 4
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from restock_forecast import ALPHA, COVER_DAYS, HORIZON_DAYS, LOW_STOCK_QUANTITY, WINDOW_DAYS, forecast
+
+
+def synthetic_partition(series, seed):
+    """Sparse daily consumption (most products are not used every day) and stock levels"""
+    rng = np.random.default_rng(seed)
+    used = rng.random((series, WINDOW_DAYS)) < rng.uniform(0.05, 0.6, size=(series, 1))
+    consumption = np.where(used, rng.integers(1, 4, size=(series, WINDOW_DAYS)), 0).astype(np.float64)
+    quantity = rng.integers(0, 20, size=series).astype(np.float64)
+    return consumption, quantity
+
+
+def python_forecast(consumption, quantity):
+    """One series at a time, the way a per-request implementation would do it"""
+    results = []
+    for row, stock in zip(consumption.tolist(), quantity.tolist()):
+        level = row[0]
+        for value in row[1:]:
+            level = ALPHA * value + (1 - ALPHA) * level
+        days_left = stock / level if level > 0 else math.inf
+        if any(row):
+            restock = days_left <= HORIZON_DAYS
+            suggested = math.ceil(max(level * COVER_DAYS - stock, 0))
+        else:
+            restock, suggested = stock <= LOW_STOCK_QUANTITY, 0
+        results.append((level, days_left, restock, suggested))
+    return results
+
+
+def run_partition(series, seed):
+    consumption, quantity = synthetic_partition(series, seed)
+    started = time.perf_counter()
+    result = forecast(consumption, quantity)
+    return time.perf_counter() - started, int(result['restock'].sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--series', type=int, default=1000000)
+    parser.add_argument('--partitions', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--python-sample', type=int, default=20000)
+    args = parser.parse_args()
+
+    per_partition = math.ceil(args.series / args.partitions)
+    seeds = range(args.partitions)
+
+    started = time.perf_counter()
+    serial = [run_partition(per_partition, seed) for seed in seeds]
+    serial_wall = time.perf_counter() - started
+
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=context) as pool:
+        # Start the workers before timing so interpreter startup is not counted
+        list(pool.map(run_partition, [1] * args.workers, range(args.workers)))
+        started = time.perf_counter()
+        pooled = list(pool.map(run_partition, [per_partition] * args.partitions, seeds))
+        pooled_wall = time.perf_counter() - started
+
+    consumption, quantity = synthetic_partition(args.python_sample, seed=0)
+    started = time.perf_counter()
+    python_forecast(consumption, quantity)
+    python_per_series = (time.perf_counter() - started) / args.python_sample
+
+    vectorized_compute = sum(elapsed for elapsed, _ in serial)
+    results = {
+        'series': per_partition * args.partitions,
+        'window_days': WINDOW_DAYS,
+        'partitions': args.partitions,
+        'restock_suggestions': sum(count for _, count in serial),
+        'vectorized_compute_s': round(vectorized_compute, 3),
+        'vectorized_series_per_s': round(per_partition * args.partitions / vectorized_compute),
+        'serial_wall_s': round(serial_wall, 3),
+        'pool_wall_s': round(pooled_wall, 3),
+        'pool_workers': args.workers,
+        'python_estimated_s': round(python_per_series * per_partition * args.partitions, 3),
+    }
+    results['speedup_vs_python'] = round(results['python_estimated_s'] / vectorized_compute, 1)
+    assert sum(count for _, count in pooled) == results['restock_suggestions']
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Drive the real endpoints against a seeded database and report JSON.
+
+Run benchmarks.seed first. The app is started as its own server process with
+MONGO_URI pointing at the benchmark database and Open Food Facts replaced by
+the local stub, then each scenario mix is driven at fixed concurrency.
+The add, scan and OFF scenarios write to the database, so reseed before each run
+that is going to be compared.
+
+    python -m benchmarks.seed && python -m benchmarks.run --output before.json
+    git checkout <other commit>
+    python -m benchmarks.seed && python -m benchmarks.run --output after.json
+    python -m benchmarks.compare before.json after.json
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import subprocess
+import uuid
+
+from pymongo import MongoClient
+
+from benchmarks.load import Scenario, run_load
+from benchmarks.off_stub import KNOWN_PREFIX, start_stub
+from benchmarks.seed import DEFAULT_MONGO_URI, NAME_WORDS, product_barcode
+from benchmarks.servers import APP_DIR, make_token, start_server, stop_server
+
+
+def build_scenarios(manifest):
+    products = manifest['products']
+    product_ids = manifest['sample_product_ids']
+
+    def known_barcode():
+        return product_barcode(random.randrange(products))
+
+    def inventory_item():
+        return {
+            'product_id': product_ids[random.randrange(len(product_ids))],
+            'quantity': random.randint(1, 3),
+            'location': 'pantry'
+        }
+
+    return {
+        'inventory_list': Scenario('inventory_list', 30, 'GET', '/api/inventory'),
+        'inventory_add': Scenario('inventory_add', 10, 'POST', '/api/inventory', inventory_item),
+        # Scanner fast path: one barcode, or a queued burst of 20 as one bulk_write
+        'inventory_scan': Scenario('inventory_scan', 10, 'POST', '/api/inventory/scan',
+                                   lambda: {'barcode': known_barcode()}),
+        'inventory_scan_session': Scenario('inventory_scan_session', 2, 'POST', '/api/inventory/scan',
+                                           lambda: {'scans': [{'barcode': known_barcode()} for _ in range(20)]}),
+        'product_search': Scenario('product_search', 15, 'GET',
+                                   lambda: f'/api/products/search?query={random.choice(NAME_WORDS)}'),
+        'barcode_lookup_local': Scenario('barcode_lookup_local', 25, 'GET',
+                                         lambda: f'/api/products/search?barcode={known_barcode()}'),
+        # Fresh barcodes in the stub's known range: miss locally, resolve upstream
+        'barcode_lookup_off': Scenario('barcode_lookup_off', 10, 'GET',
+                                       lambda: f'/api/products/search?barcode={KNOWN_PREFIX}{uuid.uuid4().int % 10 ** 11:011d}'),
+        'barcode_image': Scenario('barcode_image', 10, 'GET',
+                                  lambda: f'/api/barcode/GS{random.randrange(10 ** 8):08d}/image'),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=APP_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mongo-uri', default=DEFAULT_MONGO_URI)
+    parser.add_argument('--server', choices=['sync', 'async'], default='sync')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--warmup', type=float, default=5.0)
+    parser.add_argument('--off-delay', type=float, default=0.05)
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--scenarios', default=None,
+                        help='comma-separated subset to run, each on its own (default: the weighted mix)')
+    parser.add_argument('--output', default=None, help='also write the JSON report to this file')
+    args = parser.parse_args()
+
+    db = MongoClient(args.mongo_uri).get_default_database('grocerstock_bench')
+    manifest = db.bench_meta.find_one({'_id': 'manifest'})
+    if not manifest:
+        parser.error('benchmark database is not seeded; run python -m benchmarks.seed first')
+    manifest['sample_product_ids'] = [
+        str(product['_id']) for product in db.products.aggregate([{'$sample': {'size': 500}}, {'$project': {'_id': 1}}])
+    ]
+
+    tokens = [make_token(user_id) for user_id in manifest['sample_user_ids']]
+    scenarios = build_scenarios(manifest)
+
+    def headers():
+        return {'Authorization': f'Bearer {random.choice(tokens)}'}
+
+    if args.scenarios:
+        mixes = {name: [scenarios[name]] for name in args.scenarios.split(',')}
+    else:
+        mixes = {'mixed': list(scenarios.values())}
+
+    stub, stub_url = start_stub(delay=args.off_delay)
+    server = start_server(args.server, args.port, {
+        'MONGO_URI': args.mongo_uri,
+        'OPEN_FOOD_FACTS_API_URL': stub_url,
+        'ENSURE_INDEXES': 'false',
+    })
+
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'server': args.server,
+        'concurrency': args.concurrency,
+        'duration': args.duration,
+        'dataset': {key: manifest[key] for key in ('seed', 'users', 'items_per_user', 'products', 'inventory')},
+        'results': {},
+    }
+    try:
+        for name, mix in mixes.items():
+            report['results'][name] = asyncio.run(run_load(
+                f'http://127.0.0.1:{args.port}', mix, concurrency=args.concurrency,
+                duration=args.duration, headers=headers, warmup=args.warmup
+            ))
+    finally:
+        stop_server(server)
+        stub.shutdown()
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
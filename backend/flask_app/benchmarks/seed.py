@@ -0,0 +1,196 @@
+"""Seed a local mongod with a reproducible synthetic GrocerStock dataset.
+
+The same --seed and sizes always produce the same documents, so two commits
+can be benchmarked against identical data. Existing data in the target
+database is dropped first; point it at a dedicated database.
+
+    python -m benchmarks.seed --users 10000 --items-per-user 50 --products 1000000
+"""
+import argparse
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import MongoClient
+from werkzeug.security import generate_password_hash
+
+from categories import category_id_for
+from indexes import ensure_indexes
+
+DEFAULT_MONGO_URI = os.getenv('BENCH_MONGO_URI', 'mongodb://localhost:27017/grocerstock_bench')
+BENCH_PASSWORD = 'benchmark-password'
+BATCH_SIZE = 10000
+
+# name, catalog share, shelf life range in days, usual storage location
+CATEGORIES = [
+    ('Fruits & Vegetables', 0.16, (3, 14), 'fridge'),
+    ('Dairy & Eggs', 0.12, (5, 21), 'fridge'),
+    ('Meat & Seafood', 0.08, (2, 7), 'fridge'),
+    ('Bakery & Bread', 0.07, (3, 10), 'pantry'),
+    ('Pantry & Dry Goods', 0.20, (90, 720), 'pantry'),
+    ('Beverages', 0.10, (30, 365), 'pantry'),
+    ('Frozen Foods', 0.08, (60, 365), 'freezer'),
+    ('Snacks & Sweets', 0.11, (60, 270), 'pantry'),
+    ('Household & Cleaning', 0.05, None, 'cupboard'),
+    ('Personal Care', 0.03, None, 'bathroom'),
+]
+
+NAME_WORDS = [
+    'Organic', 'Whole', 'Fresh', 'Classic', 'Light', 'Original', 'Spicy', 'Sweet', 'Natural',
+    'Milk', 'Cheese', 'Yogurt', 'Bread', 'Apple', 'Banana', 'Tomato', 'Rice', 'Pasta', 'Juice',
+    'Coffee', 'Tea', 'Chicken', 'Salmon', 'Butter', 'Eggs', 'Cereal', 'Crackers', 'Soap', 'Chips',
+]
+BRANDS = [f'Brand {letter}{number}' for letter in 'ABCDEFGHIJ' for number in range(20)]
+QUANTITIES = ['250 g', '500 g', '1 kg', '330 ml', '1 L', '2 L', '6 pack', '12 pcs']
+
+
+def product_barcode(index):
+    """Deterministic 13-digit barcode for the nth synthetic product"""
+    return f'2{index:012d}'
+
+
+def product_name(rng):
+    return ' '.join(rng.sample(NAME_WORDS, 3))
+
+
+def generate_products(rng, count, now):
+    category_weights = [share for _, share, _, _ in CATEGORIES]
+    for index in range(count):
+        category = rng.choices(CATEGORIES, category_weights)[0]
+        yield {
+            '_id': ObjectId.from_datetime(now - timedelta(seconds=count - index)),
+            'barcode': product_barcode(index),
+            'name': product_name(rng),
+            'brand': rng.choice(BRANDS),
+            'category': category[0],
+            'category_id': category_id_for(category[0]),
+            'image_url': f'https://images.example.com/products/{index}.jpg',
+            'quantity': rng.choice(QUANTITIES),
+            'nutritional_info': {},
+            'created_at': now - timedelta(days=rng.randint(0, 720)),
+            'updated_at': now,
+            'source': 'local'
+        }
+
+
+def generate_inventory(rng, user_ids, items_per_user, product_ids, product_categories, now):
+    # Popularity is skewed: most items come from a small pool of staples
+    # (cubing the uniform draw favours the front of the pool), the rest from
+    # the long tail of the catalog.
+    shelf_life = {name: life for name, _, life, _ in CATEGORIES}
+    location = {name: place for name, _, _, place in CATEGORIES}
+    staples = min(5000, len(product_ids))
+    for user_id in user_ids:
+        for _ in range(items_per_user):
+            if rng.random() < 0.6:
+                index = int(staples * rng.random() ** 3)
+            else:
+                index = rng.randrange(len(product_ids))
+            category = product_categories[index]
+            life = shelf_life[category]
+            added = now - timedelta(days=rng.randint(0, 30), minutes=rng.randint(0, 1440))
+            expiry = added + timedelta(days=rng.randint(*life)) if life else None
+            yield {
+                'user_id': user_id,
+                'product_id': product_ids[index],
+                'quantity': float(rng.randint(1, 6)),
+                'expiry_date': expiry,
+                'added_date': added,
+                'location': location[category],
+                'category_id': category_id_for(category),
+                'notes': '',
+                'status': 'active' if rng.random() < 0.9 else 'consumed'
+            }
+
+
+def insert_batched(collection, documents):
+    batch = []
+    inserted = 0
+    for document in documents:
+        batch.append(document)
+        if len(batch) >= BATCH_SIZE:
+            collection.insert_many(batch, ordered=False)
+            inserted += len(batch)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+        inserted += len(batch)
+    return inserted
+
+
+def seed(db, users=10000, items_per_user=50, products=1000000, seed_value=42):
+    """Drop and regenerate the dataset; returns the manifest stored in bench_meta"""
+    rng = random.Random(seed_value)
+    now = datetime(2026, 1, 1)
+    started = time.perf_counter()
+
+    for collection in ('users', 'products', 'inventory', 'generated_barcodes', 'categories', 'bench_meta'):
+        db.drop_collection(collection)
+    ensure_indexes(db)
+
+    db.categories.insert_many([
+        {'name': name, 'description': name} for name, _, _, _ in CATEGORIES
+    ])
+
+    password_hash = generate_password_hash(BENCH_PASSWORD)
+    user_ids = [ObjectId.from_datetime(now - timedelta(seconds=users - index)) for index in range(users)]
+    insert_batched(db.users, ({
+        '_id': user_id,
+        'email': f'bench{index}@example.com',
+        'username': f'bench{index}',
+        'password_hash': password_hash,
+        'created_at': now,
+        'last_login': None,
+        'preferences': {'theme': 'light', 'notifications': True}
+    } for index, user_id in enumerate(user_ids)))
+
+    product_ids = []
+    product_categories = []
+
+    def tracked_products():
+        for product in generate_products(rng, products, now):
+            product_ids.append(product['_id'])
+            product_categories.append(product['category'])
+            yield product
+
+    insert_batched(db.products, tracked_products())
+    inventory_count = insert_batched(db.inventory, generate_inventory(
+        rng, user_ids, items_per_user, product_ids, product_categories, now
+    ))
+
+    manifest = {
+        '_id': 'manifest',
+        'seed': seed_value,
+        'users': users,
+        'items_per_user': items_per_user,
+        'products': products,
+        'inventory': inventory_count,
+        'password': BENCH_PASSWORD,
+        'sample_user_ids': [str(user_id) for user_id in rng.sample(user_ids, min(users, 200))],
+        'seeded_at': datetime.utcnow(),
+        'seconds': round(time.perf_counter() - started, 1)
+    }
+    db.bench_meta.insert_one(manifest)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mongo-uri', default=DEFAULT_MONGO_URI)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--items-per-user', type=int, default=50)
+    parser.add_argument('--products', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    db = MongoClient(args.mongo_uri).get_default_database('grocerstock_bench')
+    manifest = seed(db, args.users, args.items_per_user, args.products, args.seed)
+    manifest.pop('sample_user_ids')
+    print(json.dumps(manifest, indent=2, default=str))
+
+
+if __name__ == '__main__':
+    main()
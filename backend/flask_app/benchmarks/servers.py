@@ -0,0 +1,65 @@
+"""Start the sync (gunicorn) or async (uvicorn) app as a single-process server."""
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMMANDS = {
+    'sync': lambda port: [
+        sys.executable, '-m', 'gunicorn', '--workers', '1', '--bind', f'127.0.0.1:{port}',
+        'app:create_app()'
+    ],
+    'async': lambda port: [
+        sys.executable, '-m', 'uvicorn', '--factory', '--workers', '1',
+        '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning', 'async_app:app'
+    ],
+}
+
+
+def start_server(kind, port, env=None, timeout=30.0):
+    """Launch a server process and wait until /api/health answers"""
+    process = subprocess.Popen(
+        COMMANDS[kind](port),
+        cwd=APP_DIR,
+        env={**os.environ, **(env or {})},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'{kind} server exited: {process.stderr.read().decode()}')
+        try:
+            if httpx.get(f'http://127.0.0.1:{port}/api/health', timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+
+    process.terminate()
+    raise RuntimeError(f'{kind} server did not become healthy within {timeout}s')
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def make_token(identity):
+    """Access token the servers will accept, signed with the configured JWT secret"""
+    from flask import Flask
+    from flask_jwt_extended import JWTManager, create_access_token
+
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'your-super-secret-jwt-key-change-in-production')
+    JWTManager(app)
+    with app.app_context():
+        return create_access_token(identity=identity, expires_delta=False)
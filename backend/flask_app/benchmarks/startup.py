@@ -0,0 +1,107 @@
+"""Cold create_app() time and RSS, with a budget that fails on regressions.
+
+Each trial is a fresh interpreter, so nothing is cached in sys.modules. The
+check fails (exit status 1) if the median create_app() time or the peak RSS
+exceeds its budget, or if any module that should only load on first use
+(barcode rendering, Pillow, requests, numpy, pyarrow) was imported at
+startup.
+
+    python -m benchmarks.startup --max-ms 500 --max-rss-mb 64
+    python -m benchmarks.startup --importtime    # slowest imports, like python -X importtime
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.servers import APP_DIR
+
+LAZY_MODULES = ('barcode', 'PIL', 'requests', 'numpy', 'pyarrow')
+
+CHILD = f'''
+import json, resource, sys, time
+started = time.perf_counter()
+from app import create_app
+create_app()
+elapsed = time.perf_counter() - started
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{
+    'create_app_ms': elapsed * 1000,
+    'rss_mb': rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024,
+    'eager_imports': [name for name in {LAZY_MODULES!r} if name in sys.modules],
+}}))
+'''
+
+# Keep the child from touching MongoDB or starting background work
+CHILD_ENV = {'ENSURE_INDEXES': 'false', 'METRICS_ENABLED': 'false', 'PROFILER_ENABLED': 'false'}
+
+
+def run_trial():
+    started = time.perf_counter()
+    output = subprocess.check_output(
+        [sys.executable, '-c', CHILD], cwd=APP_DIR, env={**os.environ, **CHILD_ENV}, text=True
+    )
+    result = json.loads(output.strip().splitlines()[-1])
+    result['process_ms'] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def slowest_imports(limit=15):
+    """Top imports by cumulative time from python -X importtime"""
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'from app import create_app; create_app()'],
+        cwd=APP_DIR, env={**os.environ, **CHILD_ENV}, capture_output=True, text=True, check=True
+    )
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append({
+            'module': name.strip(),
+            'self_ms': int(self_us) / 1000,
+            'cumulative_ms': int(cumulative_us) / 1000
+        })
+    return sorted(rows, key=lambda row: row['cumulative_ms'], reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--trials', type=int, default=7)
+    parser.add_argument('--max-ms', type=float, default=float(os.getenv('STARTUP_BUDGET_MS', '500')),
+                        help='budget for median cold create_app() time')
+    parser.add_argument('--max-rss-mb', type=float, default=float(os.getenv('STARTUP_BUDGET_RSS_MB', '64')),
+                        help='budget for peak RSS after create_app()')
+    parser.add_argument('--importtime', action='store_true', help='also list the slowest imports')
+    args = parser.parse_args()
+
+    trials = [run_trial() for _ in range(args.trials)]
+    report = {
+        'trials': args.trials,
+        'create_app_ms': round(statistics.median(trial['create_app_ms'] for trial in trials), 1),
+        'process_ms': round(statistics.median(trial['process_ms'] for trial in trials), 1),
+        'rss_mb': round(max(trial['rss_mb'] for trial in trials), 1),
+        'eager_imports': sorted({name for trial in trials for name in trial['eager_imports']}),
+        'budget': {'max_ms': args.max_ms, 'max_rss_mb': args.max_rss_mb},
+    }
+    if args.importtime:
+        report['slowest_imports'] = slowest_imports()
+
+    failures = []
+    if report['create_app_ms'] > args.max_ms:
+        failures.append(f"create_app() took {report['create_app_ms']} ms (budget {args.max_ms} ms)")
+    if report['rss_mb'] > args.max_rss_mb:
+        failures.append(f"RSS {report['rss_mb']} MB (budget {args.max_rss_mb} MB)")
+    if report['eager_imports']:
+        failures.append(f"imported at startup: {', '.join(report['eager_imports'])}")
+    report['failures'] = failures
+
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+"""Versioned offline catalog bundles for resolving barcode scans on the client.
+
+``build_bundle`` (``python catalog_bundle.py build``, e.g. nightly) ranks
+products by the number of inventory items that reference them. It exports
+the top N products that have a barcode, keeping only the fields a scan needs
+(BUNDLE_FIELDS). If the result differs from the latest bundle, it is stored
+in ``catalog_bundles`` as the next version. Versions beyond the last
+KEEP_VERSIONS are deleted.
+
+Full bundles and deltas use one binary layout:
+
+    header   magic, version, base version (0 for a full bundle),
+             upserted records, removed barcodes, built_at
+    body     zlib stream (DecompressionStream('deflate') in browsers) of an
+             orjson object: {"fields": [...], "upsert": [[...], ...],
+             "remove": [barcode, ...]}
+
+A client on the base version applies a delta by replacing or adding each
+upserted record by barcode and dropping the removed barcodes. A client
+whose version is no longer kept, or unknown, is sent the full bundle.
+Deltas are computed on first request and cached per process; versions
+never change once stored.
+"""
+import logging
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+
+import orjson
+from bson import Binary
+
+from thumbnails import thumbnail_path
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'GSBND001'
+HEADER = struct.Struct('<8sIIIId')  # magic, version, base version, upserts, removals, built_at
+CONTENT_TYPE = 'application/vnd.grocerstock.catalog-bundle'
+
+BUNDLE_FIELDS = ('id', 'barcode', 'name', 'brand', 'category', 'category_id', 'quantity', 'thumbnail_url')
+DEFAULT_TOP = 5000
+KEEP_VERSIONS = 30
+DELTA_CACHE_SIZE = 64
+
+_delta_cache = OrderedDict()
+_delta_lock = threading.Lock()
+
+
+def bundle_record(product):
+    """One product as a list in BUNDLE_FIELDS order"""
+    return [
+        str(product['_id']),
+        product['barcode'],
+        product.get('name', ''),
+        product.get('brand', ''),
+        product.get('category', ''),
+        product.get('category_id'),
+        product.get('quantity', ''),
+        thumbnail_path(product['_id'], product.get('image_url')),
+    ]
+
+
+def encode(version, base_version, upsert, remove, built_at):
+    body = orjson.dumps({'fields': BUNDLE_FIELDS, 'upsert': upsert, 'remove': remove})
+    header = HEADER.pack(MAGIC, version, base_version, len(upsert), len(remove), built_at)
+    return header + zlib.compress(body, 9)
+
+
+def decode(data):
+    """(header fields, body) of an encoded bundle or delta"""
+    magic, version, base_version, upserts, removals, built_at = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError('not a catalog bundle')
+    body = orjson.loads(zlib.decompress(data[HEADER.size:]))
+    return {'version': version, 'base_version': base_version, 'built_at': built_at}, body
+
+
+def top_products(db, top):
+    """The top products with a barcode, most inventory references first"""
+    ranked = db.inventory.aggregate([
+        {'$group': {'_id': '$product_id', 'references': {'$sum': 1}}},
+        {'$sort': {'references': -1, '_id': 1}},
+        # Some referenced products may have no barcode or no longer exist
+        {'$limit': top * 2},
+    ], allowDiskUse=True)
+    product_ids = [entry['_id'] for entry in ranked]
+    projection = {'barcode': 1, 'name': 1, 'brand': 1, 'category': 1, 'category_id': 1, 'quantity': 1, 'image_url': 1}
+    products = {
+        product['_id']: product
+        for product in db.products.find({'_id': {'$in': product_ids}, 'barcode': {'$nin': [None, '']}}, projection)
+    }
+    return [products[product_id] for product_id in product_ids if product_id in products][:top]
+
+
+def build_bundle(db, top=DEFAULT_TOP):
+    """Store the current top products as a new bundle version, unless nothing changed"""
+    records = [bundle_record(product) for product in top_products(db, top)]
+    records.sort(key=lambda record: record[1])
+
+    latest = db.catalog_bundles.find_one({}, sort=[('_id', -1)])
+    if latest:
+        _, body = decode(latest['data'])
+        if body['upsert'] == records:
+            logger.info('Catalog bundle %d is unchanged', latest['_id'])
+            return {'version': latest['_id'], 'products': len(records), 'bytes': len(latest['data']), 'changed': False}
+
+    version = latest['_id'] + 1 if latest else 1
+    data = encode(version, 0, records, [], time.time())
+    db.catalog_bundles.insert_one({
+        '_id': version,
+        'products': len(records),
+        'built_at': datetime.utcnow(),
+        'data': Binary(data),
+    })
+    db.catalog_bundles.delete_many({'_id': {'$lte': version - KEEP_VERSIONS}})
+    logger.info('Built catalog bundle %d of %d products (%d bytes)', version, len(records), len(data))
+    return {'version': version, 'products': len(records), 'bytes': len(data), 'changed': True}
+
+
+def make_delta(base_data, data):
+    """Delta bringing a client from the bundle base_data to the bundle data"""
+    base_header, base_body = decode(base_data)
+    header, body = decode(data)
+    base_records = {record[1]: record for record in base_body['upsert']}
+    records = {record[1]: record for record in body['upsert']}
+    upsert = [record for barcode, record in records.items() if base_records.get(barcode) != record]
+    remove = [barcode for barcode in base_records if barcode not in records]
+    return encode(header['version'], base_header['version'], upsert, remove, header['built_at'])
+
+
+def latest_version(db):
+    latest = db.catalog_bundles.find_one({}, {'_id': 1}, sort=[('_id', -1)])
+    return latest['_id'] if latest else None
+
+
+def bundle_for(db, since_version=0):
+    """Encoded payload bringing a client at since_version up to date
+
+    Returns (version, payload). payload is None when the client is already
+    current; version is None when no bundle has been built yet.
+    """
+    version = latest_version(db)
+    if version is None or since_version == version:
+        return version, None
+
+    key = (since_version, version)
+    with _delta_lock:
+        if key in _delta_cache:
+            _delta_cache.move_to_end(key)
+            return version, _delta_cache[key]
+
+    bundles = {
+        bundle['_id']: bundle['data']
+        for bundle in db.catalog_bundles.find({'_id': {'$in': [since_version, version]}})
+    }
+    if since_version in bundles:
+        payload = make_delta(bundles[since_version], bundles[version])
+    else:
+        # Unknown or no longer kept: everyone in that position shares the full bundle
+        key = (0, version)
+        payload = bytes(bundles[version])
+
+    with _delta_lock:
+        payload = _delta_cache.setdefault(key, payload)
+        _delta_cache.move_to_end(key)
+        while len(_delta_cache) > DELTA_CACHE_SIZE:
+            _delta_cache.popitem(last=False)
+    return version, payload
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    import os
+
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Build the offline catalog bundle')
+    parser.add_argument('command', choices=['build'])
+    parser.add_argument('--top', type=int, default=int(os.getenv('CATALOG_BUNDLE_TOP', DEFAULT_TOP)))
+    parser.add_argument('--every', type=float, default=None, help='keep building every N seconds')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    client = MongoClient(os.getenv('MONGO_URI', 'mongodb://localhost:27017/grocerstock'))
+    database = client.get_default_database('grocerstock')
+    while True:
+        print(json.dumps(build_bundle(database, args.top)))
+        if not args.every:
+            break
+        time.sleep(args.every)
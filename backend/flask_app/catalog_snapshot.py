@@ -0,0 +1,335 @@
+"""Read-only product catalog snapshot shared by every worker through mmap.
+
+The snapshot is one binary file:
+
+    header   magic, entry counts, built_at, offsets of the two indexes
+    records  format_product fields of each product, orjson encoded
+    indexes  fixed-width entries sorted by key, binary searched in place:
+             barcode (BARCODE_WIDTH bytes, NUL padded) -> record offset/length
+             ObjectId (12 bytes)                        -> record offset/length
+
+Workers map it read-only. The pages live in the OS page cache once, however
+many workers there are, and a lookup decodes a single record straight from
+the mapping.
+
+Writes made after the snapshot was built go to an append-only journal next
+to it. ``CatalogSnapshot.record_write`` appends an entry and applies it to
+the writing worker's overlay immediately. Other workers on the host pick
+it up when they next check the journal (at most CHECK_INTERVAL later).
+Entries older than the snapshot are ignored because the snapshot already
+contains them.
+
+``build_snapshot`` (``python catalog_snapshot.py rebuild``, e.g. from cron)
+writes a new file next to the old one and os.replace()s it into place. It
+then rotates the journal, keeping the previous one, because writes made
+during the build are only in the journal. Workers notice the new inode and
+remap; requests still holding the old mapping finish on it.
+"""
+import bisect
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+
+import orjson
+from bson import ObjectId
+
+from json_provider import default
+from routes.products import format_product
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'GSCAT001'
+HEADER = struct.Struct('<8sIIdQQ')  # magic, products, barcodes, built_at, barcode index, id index
+BARCODE_WIDTH = 24
+BARCODE_ENTRY = struct.Struct(f'<{BARCODE_WIDTH}sQI')
+ID_ENTRY = struct.Struct('<12sQI')
+JOURNAL_ENTRY = struct.Struct('<dI')  # written at, payload length
+
+CHECK_INTERVAL = 1.0
+# Journal entries this much older than built_at are already in the snapshot
+CLOCK_MARGIN = 5.0
+
+# Fields format_product reads
+PRODUCT_FIELDS = (
+    'barcode', 'name', 'brand', 'category', 'category_id', 'image_url', 'quantity',
+    'nutritional_info', 'created_at', 'updated_at', 'source'
+)
+
+
+def product_record(product):
+    """format_product output for a product document, ready to encode"""
+    return format_product(product)
+
+
+def _decode(data):
+    record = orjson.loads(data)
+    record['id'] = ObjectId(record['id'])
+    return record
+
+
+def _barcode_key(barcode):
+    key = barcode.encode()
+    return key if len(key) <= BARCODE_WIDTH else None
+
+
+class _SortedEntries:
+    """Sequence view over a fixed-width index region, for bisect"""
+
+    def __init__(self, buffer, offset, count, entry, key_length):
+        self.buffer = buffer
+        self.offset = offset
+        self.count = count
+        self.entry = entry
+        self.key_length = key_length
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        start = self.offset + index * self.entry.size
+        return bytes(self.buffer[start:start + self.key_length])
+
+    def find(self, key):
+        key = key.ljust(self.key_length, b'\0')
+        index = bisect.bisect_left(self, key)
+        if index < self.count and self[index] == key:
+            _, offset, length = self.entry.unpack_from(self.buffer, self.offset + index * self.entry.size)
+            return offset, length
+        return None
+
+
+class _Mapping:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.inode = os.fstat(f.fileno()).st_ino
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, barcodes, self.built_at, barcode_offset, id_offset = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a catalog snapshot')
+        self.barcodes = _SortedEntries(self.buffer, barcode_offset, barcodes, BARCODE_ENTRY, BARCODE_WIDTH)
+        self.ids = _SortedEntries(self.buffer, id_offset, self.count, ID_ENTRY, 12)
+
+    def record(self, location):
+        if location is None:
+            return None
+        offset, length = location
+        return _decode(self.buffer[offset:offset + length])
+
+
+class _JournalReader:
+    def __init__(self, path):
+        self.path = path
+        self.inode = None
+        self.offset = 0
+
+    def read_new(self):
+        """Complete entries appended since the last call, as (written_at, payload)"""
+        try:
+            with open(self.path, 'rb') as f:
+                inode = os.fstat(f.fileno()).st_ino
+                if inode != self.inode:
+                    self.inode, self.offset = inode, 0
+                f.seek(self.offset)
+                data = f.read()
+        except FileNotFoundError:
+            return []
+
+        entries = []
+        position = 0
+        while position + JOURNAL_ENTRY.size <= len(data):
+            written_at, length = JOURNAL_ENTRY.unpack_from(data, position)
+            end = position + JOURNAL_ENTRY.size + length
+            if end > len(data):
+                break  # still being written
+            entries.append((written_at, data[position + JOURNAL_ENTRY.size:end]))
+            position = end
+        self.offset += position
+        return entries
+
+
+class CatalogSnapshot:
+    def __init__(self, path):
+        self.path = path
+        self.journal_path = f'{path}.journal'
+        self._lock = threading.Lock()
+        self._mapping = None
+        self._checked_at = 0.0
+        self._journals = [_JournalReader(f'{self.journal_path}.prev'), _JournalReader(self.journal_path)]
+        self._entries = []
+        self._by_id = {}
+        self._by_barcode = {}
+
+    def by_barcode(self, barcode):
+        """format_product dict for a barcode, or None if the caller must ask MongoDB"""
+        self._refresh()
+        if barcode in self._by_barcode:
+            return self._by_barcode[barcode]
+        mapping = self._mapping
+        key = _barcode_key(barcode)
+        if mapping is None or key is None:
+            return None
+        return mapping.record(mapping.barcodes.find(key))
+
+    def by_id(self, product_id):
+        """format_product dict for a product ObjectId, or None if the caller must ask MongoDB"""
+        self._refresh()
+        product_id = ObjectId(product_id)
+        if product_id in self._by_id:
+            return self._by_id[product_id]
+        mapping = self._mapping
+        if mapping is None:
+            return None
+        return mapping.record(mapping.ids.find(product_id.binary))
+
+    def by_ids(self, product_ids):
+        """Records for the ids the snapshot knows; the rest are left out"""
+        records = {}
+        for product_id in product_ids:
+            record = self.by_id(product_id)
+            if record is not None:
+                records[record['id']] = record
+        return records
+
+    def record_write(self, product, deleted=False):
+        """Journal a created, updated or deleted product so every worker sees it"""
+        entry = {'deleted': True, 'id': product['_id'], 'barcode': product.get('barcode')} \
+            if deleted else product_record(product)
+        payload = orjson.dumps(entry, default=default)
+        written_at = time.time()
+        fd = os.open(self.journal_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, JOURNAL_ENTRY.pack(written_at, len(payload)) + payload)
+        finally:
+            os.close(fd)
+        with self._lock:
+            self._apply(written_at, payload)
+
+    def warm(self):
+        """Map the snapshot now and have the kernel read it in, e.g. before forking workers"""
+        self._checked_at = 0.0
+        self._refresh()
+        mapping = self._mapping
+        if mapping is not None and hasattr(mmap, 'MADV_WILLNEED'):
+            mapping.buffer.madvise(mmap.MADV_WILLNEED)
+        return mapping.count if mapping else 0
+
+    def _refresh(self):
+        now = time.monotonic()
+        if now - self._checked_at < CHECK_INTERVAL:
+            return
+        with self._lock:
+            if now - self._checked_at < CHECK_INTERVAL:
+                return
+            self._checked_at = now
+            self._remap()
+            for journal in self._journals:
+                for written_at, payload in journal.read_new():
+                    self._apply(written_at, payload)
+
+    def _remap(self):
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            return
+        if self._mapping is not None and self._mapping.inode == inode:
+            return
+        try:
+            self._mapping = _Mapping(self.path)
+        except (OSError, ValueError):
+            logger.exception('Could not map catalog snapshot %s', self.path)
+            return
+        # Drop overlay entries the new snapshot already contains
+        entries = [(written_at, payload) for written_at, payload in self._entries
+                   if written_at >= self._mapping.built_at - CLOCK_MARGIN]
+        self._entries, self._by_id, self._by_barcode = [], {}, {}
+        for written_at, payload in entries:
+            self._apply(written_at, payload)
+        logger.info('Mapped catalog snapshot with %d products', self._mapping.count)
+
+    def _apply(self, written_at, payload):
+        if self._mapping is not None and written_at < self._mapping.built_at - CLOCK_MARGIN:
+            return
+        self._entries.append((written_at, payload))
+        entry = _decode(payload)
+        # A tombstone hides the product from the snapshot; callers fall back to MongoDB
+        record = None if entry.get('deleted') else entry
+        self._by_id[entry['id']] = record
+        if entry.get('barcode'):
+            self._by_barcode[entry['barcode']] = record
+
+
+def build_snapshot(db, path):
+    """Write a new snapshot of every product and swap it into place atomically"""
+    built_at = time.time()
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    barcode_entries = []
+    id_entries = []
+
+    with open(tmp_path, 'wb') as f:
+        f.write(b'\0' * HEADER.size)
+        offset = HEADER.size
+        projection = {field: 1 for field in PRODUCT_FIELDS}
+        for product in db.products.find({}, projection, batch_size=10000):
+            data = orjson.dumps(product_record(product), default=default)
+            f.write(data)
+            key = _barcode_key(product.get('barcode') or '')
+            if key:
+                barcode_entries.append((key.ljust(BARCODE_WIDTH, b'\0'), offset, len(data)))
+            id_entries.append((product['_id'].binary, offset, len(data)))
+            offset += len(data)
+
+        # Duplicate barcodes cannot happen with the unique index; keep the first if they do
+        barcode_entries.sort()
+        deduplicated = []
+        for entry in barcode_entries:
+            if not deduplicated or deduplicated[-1][0] != entry[0]:
+                deduplicated.append(entry)
+        id_entries.sort()
+
+        barcode_offset = offset
+        for entry in deduplicated:
+            f.write(BARCODE_ENTRY.pack(*entry))
+        id_offset = barcode_offset + len(deduplicated) * BARCODE_ENTRY.size
+        for entry in id_entries:
+            f.write(ID_ENTRY.pack(*entry))
+
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, len(id_entries), len(deduplicated), built_at, barcode_offset, id_offset))
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp_path, path)
+    journal_path = f'{path}.journal'
+    if os.path.exists(journal_path):
+        os.replace(journal_path, f'{journal_path}.prev')
+    logger.info('Built catalog snapshot of %d products at %s', len(id_entries), path)
+    return {'products': len(id_entries), 'bytes': os.path.getsize(path), 'built_at': built_at}
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Build the product catalog snapshot')
+    parser.add_argument('command', choices=['rebuild'])
+    parser.add_argument('--path', default=os.getenv('CATALOG_SNAPSHOT_PATH'))
+    parser.add_argument('--every', type=float, default=None, help='keep rebuilding every N seconds')
+    args = parser.parse_args()
+    if not args.path:
+        parser.error('set CATALOG_SNAPSHOT_PATH or pass --path')
+
+    logging.basicConfig(level=logging.INFO)
+    client = MongoClient(os.getenv('MONGO_URI', 'mongodb://localhost:27017/grocerstock'))
+    database = client.get_default_database('grocerstock')
+    while True:
+        print(json.dumps(build_snapshot(database, args.path)))
+        if not args.every:
+            break
+        time.sleep(args.every)
@@ -0,0 +1,244 @@
+"""Canonical product categories and an ingest-time classifier.
+
+Open Food Facts reports a long taxonomy string per product ("Dairies,
+Fermented foods, Fermented milk products, Cheeses, ..."). Users type free
+text. Every product is given one of the CATEGORIES below as ``category_id``
+(and its display name as ``category``), so category filters become exact
+matches on an index.
+
+All category names and synonyms are compiled once into a single
+Aho-Corasick automaton. ``classify`` lowercases the text and scans it once,
+whatever the number of terms. It keeps the leftmost-longest matches that
+sit on word boundaries ("frozen vegetables" beats "vegetables", and "egg"
+does not match inside "eggplant"). It then picks the category with the most
+matches; on a tie, the one matched last, since OFF lists categories from
+general to specific. Terms mapped to None (broad OFF roots such as
+"plant-based foods and beverages") only consume text.
+
+Backfill existing products and inventory:  python categories.py backfill
+"""
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+UNCATEGORIZED = 'uncategorized'
+
+# id, display name, synonyms (lowercase; singular and plural where they differ)
+CATEGORIES = [
+    ('fruits-vegetables', 'Fruits & Vegetables', [
+        'fruit', 'fruits', 'vegetable', 'vegetables', 'fresh fruits', 'fresh vegetables', 'salad', 'salads',
+        'apple', 'apples', 'banana', 'bananas', 'orange', 'oranges', 'citrus', 'berries', 'grapes',
+        'tomato', 'tomatoes', 'potato', 'potatoes', 'onion', 'onions', 'carrot', 'carrots', 'lettuce',
+        'spinach', 'avocado', 'avocados', 'mushroom', 'mushrooms', 'herbs', 'legumes', 'eggplant',
+    ]),
+    ('dairy-eggs', 'Dairy & Eggs', [
+        'dairy', 'dairies', 'milk', 'milks', 'cheese', 'cheeses', 'yogurt', 'yogurts', 'yoghurt', 'yoghurts',
+        'butter', 'cream', 'creams', 'fermented milk products', 'egg', 'eggs', 'kefir', 'dairy desserts',
+    ]),
+    ('meat-seafood', 'Meat & Seafood', [
+        'meat', 'meats', 'poultry', 'chicken', 'chickens', 'beef', 'pork', 'lamb', 'turkey', 'sausage',
+        'sausages', 'ham', 'hams', 'bacon', 'seafood', 'seafoods', 'fish', 'fishes', 'salmon', 'tuna',
+        'shrimp', 'shrimps', 'prawns', 'shellfish', 'deli meats', 'prepared meats',
+    ]),
+    ('bakery-bread', 'Bakery & Bread', [
+        'bakery', 'bread', 'breads', 'baguette', 'baguettes', 'rolls', 'buns', 'pastry', 'pastries',
+        'cake', 'cakes', 'croissant', 'croissants', 'muffin', 'muffins', 'viennoiseries', 'tortillas',
+        'pita', 'bagels', 'sandwich bread', 'sliced breads',
+    ]),
+    ('pantry', 'Pantry & Dry Goods', [
+        'pantry', 'dry goods', 'pasta', 'pastas', 'rice', 'rices', 'cereal', 'cereals', 'breakfast cereals',
+        'flour', 'flours', 'sugar', 'sugars', 'canned foods', 'canned', 'canned vegetables', 'canned fish',
+        'sauces', 'sauce', 'condiments', 'spices', 'oils', 'olive oils', 'vinegars', 'soups', 'noodles',
+        'beans', 'lentils', 'spreads', 'honey', 'jams', 'groceries', 'cereals and potatoes',
+    ]),
+    ('beverages', 'Beverages', [
+        'beverage', 'beverages', 'drink', 'drinks', 'water', 'waters', 'mineral waters', 'juice', 'juices',
+        'fruit juices', 'soda', 'sodas', 'soft drinks', 'carbonated drinks', 'coffee', 'coffees', 'tea', 'teas',
+        'beer', 'beers', 'wine', 'wines', 'alcoholic beverages', 'plant-based milks', 'energy drinks',
+    ]),
+    ('frozen', 'Frozen Foods', [
+        'frozen', 'frozen foods', 'frozen vegetables', 'frozen fruits', 'frozen meals', 'frozen desserts',
+        'frozen pizzas', 'frozen fish', 'ice cream', 'ice creams', 'ice creams and sorbets', 'sorbets',
+    ]),
+    ('snacks-sweets', 'Snacks & Sweets', [
+        'snack', 'snacks', 'sweet snacks', 'salty snacks', 'chips', 'crisps', 'crackers', 'biscuits',
+        'cookies', 'candy', 'candies', 'confectioneries', 'confectionery', 'chocolate', 'chocolates',
+        'sweets', 'nuts', 'popcorn', 'cereal bars', 'desserts',
+    ]),
+    ('household', 'Household & Cleaning', [
+        'household', 'cleaning', 'cleaning products', 'detergent', 'detergents', 'laundry', 'dishwasher',
+        'dish soap', 'paper towels', 'toilet paper', 'trash bags', 'bleach',
+    ]),
+    ('personal-care', 'Personal Care', [
+        'personal care', 'hygiene', 'toiletries', 'shampoo', 'shampoos', 'conditioner', 'soap', 'soaps',
+        'toothpaste', 'deodorant', 'deodorants', 'cosmetics', 'skin care', 'body wash', 'razors',
+    ]),
+]
+
+# Broad OFF taxonomy roots that would otherwise vote for the wrong category
+IGNORED_TERMS = [
+    'plant-based foods and beverages', 'plant-based foods', 'foods', 'food', 'meals',
+    'fruits and vegetables based foods', 'dairy substitutes', 'meat alternatives', 'fish and meat and eggs',
+]
+
+CATEGORY_NAMES = {category_id: name for category_id, name, _ in CATEGORIES}
+CATEGORY_NAMES[UNCATEGORIZED] = 'Uncategorized'
+
+
+class AhoCorasick:
+    """Multi-pattern matcher over lowercase text"""
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]  # (length, value) of every pattern ending at a state
+
+        for pattern, value in patterns:
+            state = 0
+            for char in pattern:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state].append((len(pattern), value))
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, target in self.goto[state].items():
+                queue.append(target)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[target] = self.goto[fallback].get(char, 0)
+                self.output[target] = self.output[target] + self.output[self.fail[target]]
+
+    def iter_matches(self, text):
+        """Yield (start, end, value) for every pattern occurrence"""
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, value in output[state]:
+                yield index + 1 - length, index + 1, value
+
+
+def _patterns():
+    for category_id, name, synonyms in CATEGORIES:
+        yield name.lower(), category_id
+        yield category_id.replace('-', ' '), category_id
+        for synonym in synonyms:
+            yield synonym, category_id
+    for term in IGNORED_TERMS:
+        yield term, None
+
+
+MATCHER = AhoCorasick(_patterns())
+
+
+def _on_word_boundary(text, start, end):
+    return (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum())
+
+
+def classify(*texts):
+    """Canonical category_id for the first text that matches anything, else UNCATEGORIZED"""
+    for text in texts:
+        if not text:
+            continue
+        text = text.lower()
+        matches = [match for match in MATCHER.iter_matches(text) if _on_word_boundary(text, match[0], match[1])]
+        # Leftmost-longest, non-overlapping
+        matches.sort(key=lambda match: (match[0], match[0] - match[1]))
+        scores = {}
+        position = 0
+        for start, end, category_id in matches:
+            if start < position:
+                continue
+            position = end
+            if category_id is not None:
+                count, _ = scores.get(category_id, (0, 0))
+                scores[category_id] = (count + 1, start)
+        if scores:
+            return max(scores, key=scores.get)
+    return UNCATEGORIZED
+
+
+def category_id_for(value):
+    """category_id for a filter value given as an id or a display name, or None"""
+    if not value:
+        return None
+    if value in CATEGORY_NAMES:
+        return value
+    for category_id, name in CATEGORY_NAMES.items():
+        if name.lower() == value.strip().lower():
+            return category_id
+    return None
+
+
+def category_fields(*texts):
+    """category_id and display category for a product, from its category text and name"""
+    category_id = classify(*texts)
+    return {'category_id': category_id, 'category': CATEGORY_NAMES[category_id]}
+
+
+def backfill(db, batch_size=1000, everything=False):
+    """Assign category_id to existing products and copy it onto their inventory items"""
+    from pymongo import UpdateMany, UpdateOne
+
+    for category_id, name in CATEGORY_NAMES.items():
+        db.categories.update_one({'name': name}, {'$set': {'id': category_id}}, upsert=True)
+
+    query = {} if everything else {'category_id': {'$exists': False}}
+    projection = {'name': 1, 'category': 1, 'category_source': 1}
+    # Resume after the last _id instead of re-querying the shrinking result set
+    last_id = None
+    products = 0
+    while True:
+        page_query = dict(query, _id={'$gt': last_id}) if last_id else query
+        batch = list(db.products.find(page_query, projection).sort('_id', 1).limit(batch_size))
+        if not batch:
+            break
+        last_id = batch[-1]['_id']
+
+        by_category = {}
+        product_updates = []
+        for product in batch:
+            # The raw OFF taxonomy (or user text) is kept for later reclassification
+            source_text = product.get('category_source') or product.get('category') or ''
+            fields = category_fields(source_text, product.get('name'))
+            fields['category_source'] = source_text
+            product_updates.append(UpdateOne({'_id': product['_id']}, {'$set': fields}))
+            by_category.setdefault(fields['category_id'], []).append(product['_id'])
+
+        db.products.bulk_write(product_updates, ordered=False)
+        db.inventory.bulk_write([
+            UpdateMany({'product_id': {'$in': product_ids}}, {'$set': {'category_id': category_id}})
+            for category_id, product_ids in by_category.items()
+        ], ordered=False)
+        products += len(batch)
+        logger.info('Categorized %d products', products)
+    return {'products': products}
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    import os
+
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Assign canonical categories to existing products')
+    parser.add_argument('command', choices=['backfill'])
+    parser.add_argument('--all', action='store_true', help='reclassify products that already have a category_id')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    client = MongoClient(os.getenv('MONGO_URI', 'mongodb://localhost:27017/grocerstock'))
+    print(json.dumps(backfill(client.get_default_database('grocerstock'), everything=args.all)))
@@ -0,0 +1,162 @@
+"""Declarative index registry for the GrocerStock collections.
+
+Every query shape the routes rely on should have its index declared here so
+index coverage ships with the code instead of living only in
+database/init-mongo.js, which runs on first container boot only.
+"""
+import logging
+import threading
+
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+INDEXES = {
+    'users': [
+        IndexModel([('email', ASCENDING)], unique=True),
+        IndexModel([('username', ASCENDING)], unique=True),
+        IndexModel([('created_at', DESCENDING)]),
+    ],
+    'products': [
+        IndexModel([('barcode', ASCENDING)], unique=True),
+        # Exact category filters; category_id is assigned by categories.classify
+        IndexModel([('category_id', ASCENDING)]),
+        IndexModel([('name', TEXT), ('brand', TEXT)]),
+        IndexModel([('created_at', DESCENDING)]),
+        # product_dedup.find_similar: products sharing any MinHash LSH band
+        IndexModel([('lsh_bands', ASCENDING)]),
+    ],
+    'inventory': [
+        # add_to_inventory: existing active item for this user/product
+        IndexModel([('user_id', ASCENDING), ('product_id', ASCENDING), ('status', ASCENDING)]),
+        # get_inventory / get_expiring_items: user + status, sorted by expiry
+        IndexModel([('user_id', ASCENDING), ('status', ASCENDING), ('expiry_date', ASCENDING)]),
+        # get_inventory?category=: same, narrowed to one category
+        IndexModel([('user_id', ASCENDING), ('status', ASCENDING), ('category_id', ASCENDING), ('expiry_date', ASCENDING)]),
+        # update_product / product_dedup.merge_cluster: every item of a product
+        IndexModel([('product_id', ASCENDING)]),
+    ],
+    'generated_barcodes': [
+        IndexModel([('custom_barcode', ASCENDING)], unique=True),
+        # get_my_barcodes: user's barcodes, newest first
+        IndexModel([('user_id', ASCENDING), ('created_at', DESCENDING)]),
+    ],
+    'inventory_events': [
+        IndexModel([('meta.user_id', ASCENDING), ('meta.product_id', ASCENDING), ('ts', ASCENDING)]),
+    ],
+    'inventory_daily': [
+        # $merge target of the consumption rollup, one document per user/product/day
+        IndexModel([('user_id', ASCENDING), ('product_id', ASCENDING), ('day', ASCENDING)], unique=True),
+    ],
+    'restock_suggestions': [
+        # restock_forecast upserts by user/product; get_restock_suggestions reads by user, soonest first
+        IndexModel([('user_id', ASCENDING), ('product_id', ASCENDING)], unique=True),
+        IndexModel([('user_id', ASCENDING), ('restock', ASCENDING), ('run_out_date', ASCENDING)]),
+    ],
+}
+
+# Collections that must be created as time-series collections before any
+# index (or insert) would create them as regular ones
+TIMESERIES = {
+    'inventory_events': {'timeField': 'ts', 'metaField': 'meta', 'granularity': 'hours'},
+}
+
+
+def declared_index_names(collection):
+    """Names of the indexes declared for a collection"""
+    return [index.document['name'] for index in INDEXES.get(collection, [])]
+
+
+def ensure_indexes(db):
+    """Create any declared time-series collection and index that does not exist yet"""
+    existing_collections = set(db.list_collection_names())
+    for collection, options in TIMESERIES.items():
+        if collection not in existing_collections:
+            db.create_collection(collection, timeseries=options)
+            logger.info('Created time-series collection %s', collection)
+
+    created = {}
+    for collection, indexes in INDEXES.items():
+        existing = set(db[collection].index_information())
+        missing = [index for index in indexes if index.document['name'] not in existing]
+        if missing:
+            created[collection] = db[collection].create_indexes(missing)
+            logger.info('Created indexes on %s: %s', collection, ', '.join(created[collection]))
+    return created
+
+
+def start_index_build(db):
+    """Run ensure_indexes in a background thread so startup is not blocked"""
+    def build():
+        try:
+            ensure_indexes(db)
+        except PyMongoError:
+            logger.exception('Background index build failed')
+
+    thread = threading.Thread(target=build, name='index-build', daemon=True)
+    thread.start()
+    return thread
+
+
+def report_indexes(db):
+    """Report unused, undeclared and redundant indexes per collection.
+
+    Usage counts come from $indexStats and reset when mongod restarts, so an
+    index is only reported as unused relative to the current uptime.
+    """
+    report = {}
+    for collection in INDEXES:
+        info = db[collection].index_information()
+        stats = {
+            stat['name']: stat['accesses']['ops']
+            for stat in db[collection].aggregate([{'$indexStats': {}}])
+        }
+        declared = set(declared_index_names(collection))
+
+        unused = [name for name, ops in stats.items() if ops == 0 and name != '_id_']
+        undeclared = [name for name in info if name != '_id_' and name not in declared]
+
+        redundant = []
+        for name, spec in info.items():
+            if name == '_id_' or spec.get('unique') or _is_text(spec):
+                continue
+            for other_name, other_spec in info.items():
+                if other_name != name and _is_prefix(spec['key'], other_spec['key']):
+                    redundant.append({'index': name, 'covered_by': other_name})
+                    break
+
+        report[collection] = {
+            'usage': stats,
+            'unused': sorted(unused),
+            'undeclared': sorted(undeclared),
+            'redundant': redundant,
+        }
+    return report
+
+
+def _is_text(spec):
+    return any(direction == 'text' for _, direction in spec['key'])
+
+
+def _is_prefix(keys, other_keys):
+    keys, other_keys = list(keys), list(other_keys)
+    return len(keys) < len(other_keys) and other_keys[:len(keys)] == keys
+
+
+if __name__ == '__main__':
+    import json
+    import os
+    import sys
+
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv()
+    client = MongoClient(os.getenv('MONGO_URI', 'mongodb://localhost:27017/grocerstock'))
+    database = client.get_default_database('grocerstock')
+
+    if '--report' in sys.argv:
+        print(json.dumps(report_indexes(database), indent=2))
+    else:
+        print(json.dumps(ensure_indexes(database), indent=2))
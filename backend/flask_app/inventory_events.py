@@ -0,0 +1,180 @@
+"""Inventory quantity-change history and daily consumption rollups.
+
+Every quantity change made through routes/inventory.py appends one small
+document to the ``inventory_events`` time-series collection (metaField
+``meta`` = user and product). ``rollup_consumption`` folds new events into
+``inventory_daily``, which holds one document per user, product and day:
+units added, units consumed, units removed without being used (deleted
+items, REMOVAL_REASONS) and the number of events. It tracks a
+checkpoint, so each run only reads events since the last run. Forecasts and
+buying-pattern insights read a handful of those daily documents instead of
+scanning raw history.
+
+Run the rollup periodically (e.g. from cron):  python inventory_events.py rollup
+Recompute every day from the raw events:       python inventory_events.py rebuild
+"""
+import logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_STATE_ID = 'inventory_daily'
+# Events newer than this are left for the next run so that writes still in
+# flight at the window boundary are not skipped
+ROLLUP_LAG = timedelta(seconds=60)
+# Negative deltas that are not consumption, so forecasts leave them out
+REMOVAL_REASONS = ('delete',)
+
+
+def quantity_event(user_id, product_id, item_id, delta, quantity, reason, ts=None):
+    return {
+        'ts': ts or datetime.utcnow(),
+        'meta': {'user_id': user_id, 'product_id': product_id},
+        'item_id': item_id,
+        'delta': float(delta),
+        'quantity': float(quantity),
+        'reason': reason
+    }
+
+
+def record_quantity_change(db, user_id, product_id, item_id, delta, quantity, reason):
+    """Append a quantity change event; zero deltas are not recorded"""
+    if not delta:
+        return
+    db.inventory_events.insert_one(quantity_event(user_id, product_id, item_id, delta, quantity, reason))
+
+
+def record_quantity_changes(db, events):
+    """Append several events built with quantity_event in one round trip"""
+    events = [event for event in events if event['delta']]
+    if events:
+        db.inventory_events.insert_many(events, ordered=False)
+
+
+def rollup_consumption(db, now=None):
+    """Fold events since the last checkpoint into inventory_daily; returns the window"""
+    now = now or datetime.utcnow()
+    state = db.rollup_state.find_one({'_id': ROLLUP_STATE_ID}) or {}
+    start = state.get('last_ts', datetime.min)
+    end = now - ROLLUP_LAG
+    if end <= start:
+        return {'from': start, 'to': start}
+
+    db.inventory_events.aggregate([
+        {'$match': {'ts': {'$gt': start, '$lte': end}}},
+        {'$sort': {'ts': 1}},
+        {'$group': {
+            '_id': {
+                'user_id': '$meta.user_id',
+                'product_id': '$meta.product_id',
+                'day': {'$dateTrunc': {'date': '$ts', 'unit': 'day'}}
+            },
+            'added': {'$sum': {'$cond': [{'$gt': ['$delta', 0]}, '$delta', 0]}},
+            'consumed': {'$sum': {'$cond': [
+                {'$and': [{'$lt': ['$delta', 0]}, {'$not': [{'$in': ['$reason', list(REMOVAL_REASONS)]}]}]},
+                {'$abs': '$delta'}, 0
+            ]}},
+            'removed': {'$sum': {'$cond': [
+                {'$and': [{'$lt': ['$delta', 0]}, {'$in': ['$reason', list(REMOVAL_REASONS)]}]},
+                {'$abs': '$delta'}, 0
+            ]}},
+            'events': {'$sum': 1},
+            'last_quantity': {'$last': '$quantity'}
+        }},
+        {'$project': {
+            '_id': 0,
+            'user_id': '$_id.user_id',
+            'product_id': '$_id.product_id',
+            'day': '$_id.day',
+            'added': 1,
+            'consumed': 1,
+            'removed': 1,
+            'events': 1,
+            'last_quantity': 1
+        }},
+        {'$merge': {
+            'into': 'inventory_daily',
+            'on': ['user_id', 'product_id', 'day'],
+            'whenMatched': [{'$set': {
+                'added': {'$add': ['$added', '$$new.added']},
+                'consumed': {'$add': ['$consumed', '$$new.consumed']},
+                # Absent from days rolled up before removals were split out
+                'removed': {'$add': [{'$ifNull': ['$removed', 0]}, '$$new.removed']},
+                'events': {'$add': ['$events', '$$new.events']},
+                'last_quantity': '$$new.last_quantity'
+            }}],
+            'whenNotMatched': 'insert'
+        }}
+    ])
+
+    db.rollup_state.update_one(
+        {'_id': ROLLUP_STATE_ID},
+        {'$set': {'last_ts': end, 'updated_at': now}},
+        upsert=True
+    )
+    logger.info('Rolled up inventory events from %s to %s', start, end)
+    return {'from': start, 'to': end}
+
+
+def rebuild_rollups(db, now=None):
+    """Drop inventory_daily and its checkpoint, then roll up every event again
+
+    Forecasts see no history until the rollup finishes, so run it off-peak.
+    """
+    db.inventory_daily.delete_many({})
+    db.rollup_state.delete_one({'_id': ROLLUP_STATE_ID})
+    return rollup_consumption(db, now)
+
+
+def consumption_forecast(db, user_id, product_id, current_quantity, days=90, now=None):
+    """Average daily use, restock interval and run-out date from the daily rollups"""
+    now = now or datetime.utcnow()
+    since = datetime(now.year, now.month, now.day) - timedelta(days=days)
+    rollups = list(db.inventory_daily.find(
+        {'user_id': user_id, 'product_id': product_id, 'day': {'$gte': since}},
+        {'_id': 0, 'day': 1, 'added': 1, 'consumed': 1}
+    ).sort('day', 1))
+
+    if not rollups:
+        return {'history_days': 0, 'daily_consumption': None, 'restock_interval_days': None,
+                'run_out_date': None}
+
+    observed_days = max(1, (now - rollups[0]['day']).days)
+    daily_consumption = sum(rollup['consumed'] for rollup in rollups) / observed_days
+
+    restock_days = [rollup['day'] for rollup in rollups if rollup['added'] > 0]
+    restock_interval = None
+    if len(restock_days) > 1:
+        restock_interval = round((restock_days[-1] - restock_days[0]).days / (len(restock_days) - 1), 1)
+
+    run_out_date = None
+    if daily_consumption > 0:
+        run_out_date = now + timedelta(days=current_quantity / daily_consumption)
+
+    return {
+        'history_days': observed_days,
+        'daily_consumption': round(daily_consumption, 3),
+        'restock_interval_days': restock_interval,
+        'run_out_date': run_out_date
+    }
+
+
+if __name__ == '__main__':
+    import json
+    import os
+    import sys
+
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv()
+    client = MongoClient(os.getenv('MONGO_URI', 'mongodb://localhost:27017/grocerstock'))
+    database = client.get_default_database('grocerstock')
+
+    if sys.argv[1:] == ['rollup']:
+        print(json.dumps(rollup_consumption(database), default=str))
+    elif sys.argv[1:] == ['rebuild']:
+        print(json.dumps(rebuild_rollups(database), default=str))
+    else:
+        print('usage: python inventory_events.py rollup|rebuild')
+        sys.exit(2)
@@ -0,0 +1,259 @@
+"""Streaming inventory export to CSV and Parquet.
+
+Inventory rows are read from a server-side cursor in chunks of CHUNK_SIZE.
+Each chunk is joined to its products with one batched ``$in`` query, then
+written out and dropped, so memory stays flat whatever the export size.
+Parquet is written one row group at a time. The bytes produced so far are
+streamed to the client after every row group.
+
+Admin exports cover every user. The inventory ``_id`` range is split into
+partitions that are read in parallel by producer threads. They feed a
+bounded queue, so fast producers wait for the client instead of buffering.
+"""
+import csv
+import io
+import queue
+import threading
+from datetime import datetime
+
+from bson import ObjectId
+
+CHUNK_SIZE = 1000
+ROW_GROUP_SIZE = 10000
+
+EXPORT_FIELDS = [
+    'item_id', 'user_id', 'product_id', 'barcode', 'name', 'brand', 'category',
+    'quantity', 'expiry_date', 'added_date', 'location', 'notes', 'status'
+]
+
+INVENTORY_PROJECTION = {
+    'user_id': 1, 'product_id': 1, 'quantity': 1, 'expiry_date': 1,
+    'added_date': 1, 'location': 1, 'notes': 1, 'status': 1
+}
+PRODUCT_PROJECTION = {'barcode': 1, 'name': 1, 'brand': 1, 'category': 1}
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def join_products(db, items):
+    """Inventory documents to export rows, with one $in lookup for their products"""
+    product_ids = list({item['product_id'] for item in items if item.get('product_id')})
+    products = {
+        product['_id']: product
+        for product in db.products.find({'_id': {'$in': product_ids}}, PRODUCT_PROJECTION)
+    }
+
+    rows = []
+    for item in items:
+        product = products.get(item.get('product_id'), {})
+        rows.append({
+            'item_id': str(item['_id']),
+            'user_id': str(item.get('user_id', '')),
+            'product_id': str(item.get('product_id', '')),
+            'barcode': product.get('barcode'),
+            'name': product.get('name'),
+            'brand': product.get('brand'),
+            'category': product.get('category'),
+            'quantity': item.get('quantity'),
+            'expiry_date': item.get('expiry_date'),
+            'added_date': item.get('added_date'),
+            'location': item.get('location'),
+            'notes': item.get('notes'),
+            'status': item.get('status')
+        })
+    return rows
+
+
+def iter_chunks(db, query_filter, chunk_size=CHUNK_SIZE):
+    """Yield lists of export rows for the inventory matching query_filter"""
+    cursor = db.inventory.find(query_filter, INVENTORY_PROJECTION, batch_size=chunk_size)
+    try:
+        items = []
+        for item in cursor:
+            items.append(item)
+            if len(items) >= chunk_size:
+                yield join_products(db, items)
+                items = []
+        if items:
+            yield join_products(db, items)
+    finally:
+        cursor.close()
+
+
+def partition_filters(db, query_filter, partitions):
+    """Split query_filter into _id ranges of roughly equal creation time"""
+    first = db.inventory.find_one(query_filter, {'_id': 1}, sort=[('_id', 1)])
+    last = db.inventory.find_one(query_filter, {'_id': 1}, sort=[('_id', -1)])
+    if not first or partitions <= 1:
+        return [query_filter]
+
+    start = first['_id'].generation_time.timestamp()
+    span = last['_id'].generation_time.timestamp() - start
+    bounds = [
+        ObjectId.from_datetime(datetime.utcfromtimestamp(start + span * index / partitions))
+        for index in range(1, partitions)
+    ]
+
+    filters = []
+    lower = None
+    for upper in bounds + [None]:
+        id_range = {}
+        if lower is not None:
+            id_range['$gte'] = lower
+        if upper is not None:
+            id_range['$lt'] = upper
+        filters.append({**query_filter, '_id': id_range})
+        lower = upper
+    return filters
+
+
+def iter_partitioned_chunks(db, query_filter, partitions, chunk_size=CHUNK_SIZE):
+    """Read partitions in parallel threads and yield their chunks as they arrive"""
+    filters = partition_filters(db, query_filter, partitions)
+    chunks = queue.Queue(maxsize=len(filters) * 2)
+    stop = threading.Event()
+    done = object()
+
+    def produce(partition_filter):
+        try:
+            for chunk in iter_chunks(db, partition_filter, chunk_size):
+                while not stop.is_set():
+                    try:
+                        chunks.put(chunk, timeout=1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+        except Exception as e:
+            chunks.put(e)
+        finally:
+            chunks.put(done)
+
+    threads = [
+        threading.Thread(target=produce, args=(partition_filter,), name=f'export-partition-{index}', daemon=True)
+        for index, partition_filter in enumerate(filters)
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        remaining = len(threads)
+        while remaining:
+            chunk = chunks.get()
+            if chunk is done:
+                remaining -= 1
+            elif isinstance(chunk, Exception):
+                raise chunk
+            else:
+                yield chunk
+    finally:
+        # Client went away or a partition failed: let the producers exit
+        stop.set()
+        while True:
+            try:
+                chunks.get_nowait()
+            except queue.Empty:
+                break
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def csv_stream(chunks):
+    """Yield CSV text, one piece per chunk"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    yield buffer.getvalue()
+
+    for rows in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_csv_value(row[field]) for field in EXPORT_FIELDS] for row in rows)
+        yield buffer.getvalue()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands back whatever was written since the last drain"""
+
+    def __init__(self):
+        self._pieces = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._pieces.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._pieces)
+        self._pieces = []
+        return data
+
+
+def parquet_schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ('item_id', pa.string()),
+        ('user_id', pa.string()),
+        ('product_id', pa.string()),
+        ('barcode', pa.string()),
+        ('name', pa.string()),
+        ('brand', pa.string()),
+        ('category', pa.string()),
+        ('quantity', pa.float64()),
+        ('expiry_date', pa.timestamp('ms')),
+        ('added_date', pa.timestamp('ms')),
+        ('location', pa.string()),
+        ('notes', pa.string()),
+        ('status', pa.string()),
+    ])
+
+
+def parquet_stream(chunks, row_group_size=ROW_GROUP_SIZE):
+    """Yield Parquet bytes, flushing after every row group"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = parquet_schema()
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+
+    def write_group(rows):
+        columns = {field: [row[field] for row in rows] for field in EXPORT_FIELDS}
+        columns['quantity'] = [float(value) if value is not None else None for value in columns['quantity']]
+        writer.write_table(pa.Table.from_pydict(columns, schema=schema), row_group_size=row_group_size)
+
+    pending = []
+    for rows in chunks:
+        pending.extend(rows)
+        if len(pending) >= row_group_size:
+            write_group(pending)
+            pending = []
+            yield sink.drain()
+    if pending:
+        write_group(pending)
+    writer.close()
+    yield sink.drain()
+
+
+def export_stream(chunks, export_format):
+    if export_format == 'parquet':
+        return parquet_stream(chunks)
+    return csv_stream(chunks)
@@ -0,0 +1,249 @@
+"""Publish/subscribe hub behind GET /api/inventory/stream, shared by all workers.
+
+The inventory write routes call ``InventoryHub.publish`` after their write
+succeeds. The event goes into ``inventory_changes``, a capped collection
+that every worker process tails with a tailable cursor. Each worker then
+delivers the event to its own open streams for that user. Every stream sees
+every write, however many worker processes or hosts serve the app. A capped
+collection is used rather than a change stream because it also works on a
+standalone mongod.
+
+Each event is encoded once per worker as a Server-Sent Events frame. The
+frame is fanned out to the user's open streams and kept in a ring buffer
+the size of the capped collection. The ring buffer is filled from the
+collection when the tailer starts; those events are history, not news, so
+nothing is fanned out until the tailer has caught up, and new streams wait
+(up to CATCH_UP_SECONDS) for that before they register.
+
+Each open stream holds one server thread for as long as it stays open. Under
+server.py's gthread workers that is one of WEB_WORKERS x WEB_THREADS; size
+those for the expected number of open dashboards plus API traffic.
+
+Every subscriber has a bounded queue. A client that cannot keep up is not
+allowed to grow memory: once its queue is full it is marked overflowed and
+its stream ends. EventSource then reconnects with ``Last-Event-ID`` and
+resumes from the ring buffer of whichever worker it reaches. Event ids are
+the change documents' ids, so they are the same in every worker. If the
+events it missed have already left the log, it gets a ``reset`` event and
+reloads the inventory instead.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import orjson
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+from json_provider import default
+
+logger = logging.getLogger(__name__)
+
+EVENT_NAME = 'inventory-changed'
+RESET_EVENT = 'reset'
+RETRY_MS = 3000
+
+CHANGE_LOG_BYTES = 8 * 1024 * 1024
+TAIL_AWAIT_MS = 1000
+TAIL_RETRY_SECONDS = 1.0
+# How long a new stream waits for a newly started tailer to load the log
+CATCH_UP_SECONDS = 5.0
+
+
+def format_event(event_id, event, data):
+    """One SSE frame, encoded"""
+    payload = orjson.dumps(data, default=default)
+    return b'id: %s\nevent: %s\ndata: %s\n\n' % (event_id.encode(), event.encode(), payload)
+
+
+class Subscription:
+    """Bounded queue of encoded frames for one open stream"""
+
+    def __init__(self, user_id, max_queue):
+        self.user_id = user_id
+        self.max_queue = max_queue
+        self.overflowed = False
+        self._frames = deque()
+        self._ready = threading.Condition()
+
+    def offer(self, frame):
+        """Queue a frame; returns False once the subscriber has fallen too far behind"""
+        with self._ready:
+            if self.overflowed:
+                return False
+            if len(self._frames) >= self.max_queue:
+                self.overflowed = True
+                self._frames.clear()
+                self._ready.notify()
+                return False
+            self._frames.append(frame)
+            self._ready.notify()
+            return True
+
+    def next_frames(self, timeout):
+        """Every queued frame, waiting up to timeout for the first; [] on timeout"""
+        with self._ready:
+            if not self._frames and not self.overflowed:
+                self._ready.wait(timeout)
+            frames = list(self._frames)
+            self._frames.clear()
+            return frames
+
+
+class InventoryHub:
+    def __init__(self, collection, history=1000, max_queue=100):
+        self.collection = collection  # the capped change log
+        self.history_size = history
+        self.max_queue = max_queue
+        self._reset()
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._history = deque(maxlen=self.history_size)  # (event id, user_id, frame)
+        self._seen = set()  # event ids in _history
+        self._subscribers = {}  # user_id -> set of Subscription
+        self._caught_up = threading.Event()
+        self._log_ready = False
+        self._pid = None
+        self._thread = None
+
+    def publish(self, user_id, data, event=EVENT_NAME):
+        """Log an event for every open stream of a user, in every worker"""
+        self._ensure_tailer()
+        try:
+            self._ensure_log()
+            self.collection.insert_one({'user_id': str(user_id), 'event': event, 'data': data})
+        except PyMongoError:
+            # The write itself succeeded; open streams reload on their next reset
+            logger.exception('Could not log an inventory change for user %s', user_id)
+
+    def subscribe(self, user_id, last_event_id=None):
+        """Register a stream; returns it with the frames to replay first"""
+        self._ensure_tailer()
+        # Registered earlier, it would get the log's backlog as live events
+        self._caught_up.wait(CATCH_UP_SECONDS)
+        user_id = str(user_id)
+        subscription = Subscription(user_id, self.max_queue)
+        with self._lock:
+            replay = self._replay(user_id, last_event_id)
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription, replay
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def after_fork(self):
+        """Drop state inherited from the master; the worker starts its own tailer on first use"""
+        self._reset()
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def _ensure_log(self):
+        # Inserting first would create inventory_changes as a regular collection
+        if self._log_ready:
+            return
+        try:
+            self.collection.database.create_collection(
+                self.collection.name, capped=True, size=CHANGE_LOG_BYTES, max=self.history_size
+            )
+        except CollectionInvalid:
+            pass  # Already created by another worker
+        self._log_ready = True
+
+    def _ensure_tailer(self):
+        # Started lazily, like WriteBehindBuffer's flusher, so that a hub
+        # created in a pre-fork master gets its own tailer in every worker
+        pid = os.getpid()
+        if self._pid == pid and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != pid or not self._thread.is_alive():
+                self._pid = pid
+                self._thread = threading.Thread(target=self._tail, name='inventory-stream-tail', daemon=True)
+                self._thread.start()
+
+    def _tail(self):
+        while True:
+            try:
+                self._ensure_log()
+                cursor = self.collection.find(cursor_type=CursorType.TAILABLE_AWAIT).max_await_time_ms(TAIL_AWAIT_MS)
+                while cursor.alive:
+                    for change in cursor:
+                        self._deliver(change)
+                    self._caught_up.set()
+            except PyMongoError:
+                logger.exception('Tailing %s failed; retrying', self.collection.name)
+            # The cursor dies at once on an empty log; reopening it skips events already delivered
+            self._caught_up.set()
+            time.sleep(TAIL_RETRY_SECONDS)
+
+    def _deliver(self, change):
+        event_id = str(change['_id'])
+        user_id = change['user_id']
+        with self._lock:
+            if event_id in self._seen:
+                return
+            if len(self._history) == self._history.maxlen:
+                self._seen.discard(self._history[0][0])
+            frame = format_event(event_id, change['event'], change['data'])
+            self._history.append((event_id, user_id, frame))
+            self._seen.add(event_id)
+            if not self._caught_up.is_set():
+                # Still loading the log: history for resumes, not news
+                return
+            subscribers = list(self._subscribers.get(user_id, ()))
+
+        for subscription in subscribers:
+            if not subscription.offer(frame):
+                logger.info('Inventory stream for user %s fell behind; closing it', user_id)
+                self.unsubscribe(subscription)
+
+    def _replay(self, user_id, last_event_id):
+        if not last_event_id:
+            return []
+
+        if last_event_id not in self._seen:
+            # Events were missed for good; the client must reload
+            latest = self._history[-1][0] if self._history else ''
+            return [format_event(latest, RESET_EVENT, {'reason': 'history_lost'})]
+
+        frames = []
+        replaying = False
+        for event_id, owner, frame in self._history:
+            if replaying and owner == user_id:
+                frames.append(frame)
+            elif event_id == last_event_id:
+                replaying = True
+        return frames
+
+
+def event_stream(hub, user_id, last_event_id=None, heartbeat=15.0):
+    """Generator of SSE bytes for one client, ending when it overflows
+
+    Subscribes on first iteration, so a response that is never sent leaves
+    nothing registered.
+    """
+    subscription, replay = hub.subscribe(user_id, last_event_id)
+    try:
+        yield b'retry: %d\n\n' % RETRY_MS
+        for frame in replay:
+            yield frame
+        while not subscription.overflowed:
+            frames = subscription.next_frames(heartbeat)
+            if frames:
+                yield b''.join(frames)
+            elif not subscription.overflowed:
+                # Keeps proxies from closing an idle connection and lets the
+                # server notice clients that went away
+                yield b': keepalive %d\n\n' % int(time.time())
+    finally:
+        hub.unsubscribe(subscription)
@@ -0,0 +1,43 @@
+import decimal
+
+import orjson
+from bson import Decimal128, ObjectId
+from flask.json.provider import JSONProvider
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def default(obj):
+    """Encode the types orjson does not handle itself"""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, Decimal128):
+        return str(obj.to_decimal())
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson.
+
+    datetime/date are encoded natively as ISO 8601 (the same strings as
+    ``.isoformat()`` for the naive UTC datetimes stored in MongoDB) and
+    ObjectId as its hex string, so routes can return documents without
+    converting fields by hand.
+    """
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=default, option=ORJSON_OPTIONS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=default, option=ORJSON_OPTIONS),
+            mimetype='application/json'
+        )
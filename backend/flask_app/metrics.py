@@ -0,0 +1,235 @@
+"""Per-process request, MongoDB and upstream metrics in Prometheus text format.
+
+Enabled with METRICS_ENABLED=true. When disabled no hooks or command
+listener are installed, /api/metrics is not registered and upstream_timer
+only checks a flag, so the cost is close to zero. Each worker process keeps
+its own counters; scrape every worker or aggregate in Prometheus.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, g, has_request_context, request
+from pymongo import monitoring
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROUND_TRIP_BUCKETS = (0, 1, 2, 3, 4, 5, 8, 13, 21)
+
+_enabled = False
+
+# Round trips of requests served outside Flask (async_app). Motor runs each
+# command in a copy of the calling context, so the counter list is shared.
+_round_trips = contextvars.ContextVar('mongo_round_trips', default=None)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # one slot per bucket plus +Inf, then the running sum
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        for labels, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series[:-1]):
+                cumulative += count
+                bucket_labels = _format_labels(self.labelnames + ('le',), labels + (_format_bound(bound),))
+                lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f'{self.name}_sum{label_text} {series[-1]}')
+            lines.append(f'{self.name}_count{label_text} {cumulative}')
+        return lines
+
+
+def _format_bound(bound):
+    return bound if isinstance(bound, str) else repr(float(bound))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Flask request latency by endpoint',
+    ('endpoint', 'method', 'status')
+)
+REQUESTS = Counter(
+    'http_requests_total', 'Flask requests by endpoint and status code',
+    ('endpoint', 'method', 'status')
+)
+REQUEST_ROUND_TRIPS = Histogram(
+    'http_request_mongodb_round_trips', 'MongoDB commands issued per request',
+    ('endpoint',), buckets=ROUND_TRIP_BUCKETS
+)
+MONGO_LATENCY = Histogram(
+    'mongodb_command_duration_seconds', 'MongoDB command latency by collection and command',
+    ('collection', 'command')
+)
+MONGO_FAILURES = Counter(
+    'mongodb_command_failures_total', 'Failed MongoDB commands by collection and command',
+    ('collection', 'command')
+)
+UPSTREAM_LATENCY = Histogram(
+    'upstream_request_duration_seconds', 'Outgoing HTTP call latency by service and outcome',
+    ('service', 'outcome')
+)
+
+ALL_METRICS = (
+    REQUEST_LATENCY, REQUESTS, REQUEST_ROUND_TRIPS,
+    MONGO_LATENCY, MONGO_FAILURES, UPSTREAM_LATENCY,
+)
+
+
+def render():
+    """All metrics in Prometheus text exposition format"""
+    lines = []
+    for metric in ALL_METRICS:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def _command_collection(event):
+    collection = event.command.get(event.command_name)
+    if event.command_name == 'getMore':
+        collection = event.command.get('collection')
+    return collection if isinstance(collection, str) else ''
+
+
+class CommandTimingListener(monitoring.CommandListener):
+    """Times every MongoDB command and counts round trips per request"""
+
+    def __init__(self):
+        # Successful/failed events carry no command document, so remember the
+        # collection from the started event.
+        self._collections = {}
+
+    def started(self, event):
+        self._collections[(event.connection_id, event.request_id)] = _command_collection(event)
+        if has_request_context():
+            g.mongo_round_trips = g.get('mongo_round_trips', 0) + 1
+        else:
+            counter = _round_trips.get()
+            if counter is not None:
+                counter[0] += 1
+
+    def succeeded(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), '')
+        MONGO_LATENCY.observe((collection, event.command_name), event.duration_micros / 1e6)
+
+    def failed(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), '')
+        MONGO_LATENCY.observe((collection, event.command_name), event.duration_micros / 1e6)
+        MONGO_FAILURES.inc((collection, event.command_name))
+
+
+class _UpstreamTiming:
+    outcome = 'ok'
+
+
+@contextmanager
+def upstream_timer(service):
+    """Time an outgoing call; set ``timer.outcome`` (e.g. the status code) inside the block"""
+    if not _enabled:
+        yield _UpstreamTiming()
+        return
+
+    timer = _UpstreamTiming()
+    started = time.perf_counter()
+    try:
+        yield timer
+    except Exception:
+        timer.outcome = 'error'
+        raise
+    finally:
+        UPSTREAM_LATENCY.observe((service, str(timer.outcome)), time.perf_counter() - started)
+
+
+def track_round_trips():
+    """Count the MongoDB commands issued from the current context; returns the counter"""
+    counter = [0]
+    _round_trips.set(counter)
+    return counter
+
+
+def observe_request(endpoint, method, status, seconds, round_trips):
+    labels = (endpoint, method, str(status))
+    REQUEST_LATENCY.observe(labels, seconds)
+    REQUESTS.inc(labels)
+    REQUEST_ROUND_TRIPS.observe((endpoint,), round_trips)
+
+
+def _before_request():
+    g.metrics_started = time.perf_counter()
+
+
+def _after_request(response):
+    started = g.pop('metrics_started', None)
+    if started is not None:
+        observe_request(
+            request.endpoint or 'unmatched', request.method, response.status_code,
+            time.perf_counter() - started, g.pop('mongo_round_trips', 0)
+        )
+    return response
+
+
+def metrics_endpoint():
+    return Response(render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    """Install request hooks and /api/metrics; returns the Mongo command listener"""
+    global _enabled
+    _enabled = True
+
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.add_url_rule('/api/metrics', 'metrics', metrics_endpoint, methods=['GET'])
+    return CommandTimingListener()
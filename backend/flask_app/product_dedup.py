@@ -0,0 +1,428 @@
+"""Near-duplicate product detection with MinHash signatures and LSH bands.
+
+Products are compared on their brand, name and quantity. The text is
+normalized first: accents and punctuation are stripped, and quantities are
+converted to a canonical unit, so "Whole Milk 1L" and "whole milk, 1000 ml"
+read the same. It is then cut into character 3-grams. A MinHash signature
+of NUM_PERM values estimates the Jaccard similarity of two products' 3-gram
+sets.
+
+The signature is split into BANDS bands of ROWS values, and each band is
+hashed to one int64 key stored in ``lsh_bands``. Two products with
+similarity s share at least one band with probability 1 - (1 - s**ROWS)**BANDS:
+about 0.99 at s = 0.7, 0.64 at 0.5 and 0.12 at 0.3. ``lsh_bands`` has a
+multikey index. ``find_similar`` therefore gets the few products that share
+a band with one indexed $in query and ranks them by exact similarity,
+however large the catalog is.
+
+``merge_duplicates`` finds bands shared by several products with one
+aggregation. It verifies candidate pairs on their signatures and merges each
+cluster into one canonical product:
+- Open Food Facts products and real barcodes win over generated ones, then
+  the oldest product.
+- Only products whose barcode create_product made up (``barcode_generated``)
+  are ever merged away, since a real barcode may still be scanned. A
+  12-digit UPC-A looks like a generated code, so the flag is the only test.
+- Inventory items are repointed with bulk writes. Two active items of one
+  user are combined into one.
+- Event history and daily rollups follow the canonical product.
+- The removed products are kept in ``product_merges``.
+
+Index existing products:  python product_dedup.py index
+Merge duplicates:         python product_dedup.py merge [--dry-run]
+"""
+import functools
+import hashlib
+import logging
+import re
+import unicodedata
+import zlib
+from datetime import datetime
+
+from bson import Binary
+
+logger = logging.getLogger(__name__)
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+
+SUGGEST_THRESHOLD = 0.6
+MERGE_THRESHOLD = 0.85
+MAX_CANDIDATES = 100
+# Bands shared by more products than this are too generic to compare pairwise
+MAX_BUCKET = 50
+
+HASH_SEED = 20240601
+
+# unit -> (canonical unit, factor)
+UNITS = {
+    'kg': ('g', 1000), 'kilo': ('g', 1000), 'kilos': ('g', 1000), 'g': ('g', 1), 'gr': ('g', 1),
+    'gram': ('g', 1), 'grams': ('g', 1), 'mg': ('g', 0.001), 'oz': ('g', 28.3495), 'lb': ('g', 453.592),
+    'lbs': ('g', 453.592), 'l': ('ml', 1000), 'lt': ('ml', 1000), 'ltr': ('ml', 1000), 'litre': ('ml', 1000),
+    'litres': ('ml', 1000), 'liter': ('ml', 1000), 'liters': ('ml', 1000), 'ml': ('ml', 1), 'cl': ('ml', 10),
+    'dl': ('ml', 100),
+}
+QUANTITY_PATTERN = re.compile(
+    r'(\d+(?:[.,]\d+)?)\s*(' + '|'.join(sorted(UNITS, key=len, reverse=True)) + r')(?![a-z])'
+)
+QUANTITY_TOKEN = re.compile(r'^\d+(?:\.\d+)?(?:g|ml)$')
+NON_WORD = re.compile(r'[^a-z0-9.]+')
+STOP_WORDS = {'the', 'of', 'and', 'with', 'a'}
+# Placeholders that say nothing about the product
+IGNORED_BRANDS = {'', 'unknown brand'}
+
+SIMILARITY_PROJECTION = {'name': 1, 'brand': 1, 'quantity': 1}
+
+
+def _quantity_token(match):
+    unit, factor = UNITS[match.group(2)]
+    amount = round(float(match.group(1).replace(',', '.')) * factor, 1)
+    return f' {amount:g}{unit} '
+
+
+def normalize_text(*parts):
+    """Lowercase ASCII words with quantities in canonical units"""
+    text = ' '.join(part for part in parts if isinstance(part, str) and part)
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode().lower()
+    text = QUANTITY_PATTERN.sub(_quantity_token, text)
+    words = (word.strip('.') for word in NON_WORD.split(text))
+    return ' '.join(word for word in words if word and word not in STOP_WORDS)
+
+
+def _brand(product):
+    brand = normalize_text(product.get('brand'))
+    return '' if brand in IGNORED_BRANDS else brand
+
+
+def product_text(product):
+    return normalize_text(_brand(product), product.get('name'), product.get('quantity'))
+
+
+def shingles(text):
+    if len(text) <= SHINGLE_SIZE:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def quantities(product):
+    """Canonical quantity tokens mentioned in the name or quantity"""
+    text = normalize_text(product.get('name'), product.get('quantity'))
+    return {word for word in text.split() if QUANTITY_TOKEN.match(word)}
+
+
+def compatible(a, b):
+    """Whether two similar products may be the same: same quantities, no conflicting brands"""
+    brand_a, brand_b = _brand(a), _brand(b)
+    if brand_a and brand_b and brand_a != brand_b:
+        return False
+    return quantities(a) == quantities(b)
+
+
+@functools.lru_cache(maxsize=None)
+def hash_family():
+    """numpy and the universal hash family h(x) = (a * x + b) mod p over 32-bit shingle hashes
+
+    numpy is imported on first use so that importing this module (the
+    product routes do) does not slow down app startup. The seed is fixed so
+    every process computes the same signatures.
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(HASH_SEED)
+    a = rng.integers(1, 2 ** 31, size=(NUM_PERM, 1), dtype=np.uint64)
+    b = rng.integers(0, 2 ** 31, size=(NUM_PERM, 1), dtype=np.uint64)
+    return np, a, b, np.uint64(4294967291)
+
+
+def signature(text):
+    """MinHash signature of a normalized text, NUM_PERM uint32 values"""
+    np, a, b, prime = hash_family()
+    grams = shingles(text)
+    if not grams:
+        return np.full(NUM_PERM, np.iinfo(np.uint32).max, dtype=np.uint32)
+    hashes = np.fromiter((zlib.crc32(gram.encode()) for gram in grams), dtype=np.uint64, count=len(grams))
+    return ((a * hashes + b) % prime).min(axis=1).astype(np.uint32)
+
+
+def band_keys(values):
+    """One signed int64 key per band, so bands can be matched with an index"""
+    keys = []
+    for band in range(BANDS):
+        digest = hashlib.blake2b(
+            values[band * ROWS:(band + 1) * ROWS].tobytes(), digest_size=8, salt=band.to_bytes(2, 'little')
+        ).digest()
+        keys.append(int.from_bytes(digest, 'little', signed=True))
+    return keys
+
+
+def similarity_fields(name, brand='', quantity=''):
+    """minhash and lsh_bands fields for a product document"""
+    values = signature(product_text({'name': name, 'brand': brand, 'quantity': quantity}))
+    return {'minhash': Binary(values.astype('<u4').tobytes()), 'lsh_bands': band_keys(values)}
+
+
+def estimated_similarity(a, b):
+    """Fraction of equal MinHash values of two stored signatures"""
+    np = hash_family()[0]
+    return float(np.mean(np.frombuffer(a, dtype='<u4') == np.frombuffer(b, dtype='<u4')))
+
+
+def has_generated_barcode(product):
+    """Whether create_product made up the product's barcode (a custom product)"""
+    return product.get('barcode_generated') is True
+
+
+def find_similar(db, product, threshold=SUGGEST_THRESHOLD, limit=5, exclude_id=None):
+    """Existing products that look like the same item, most similar first, as (product, similarity)"""
+    bands = product.get('lsh_bands') or similarity_fields(
+        product.get('name'), product.get('brand'), product.get('quantity')
+    )['lsh_bands']
+    query = {'lsh_bands': {'$in': bands}}
+    if exclude_id is not None:
+        query['_id'] = {'$ne': exclude_id}
+
+    grams = shingles(product_text(product))
+    matches = []
+    for candidate in db.products.find(query, {'minhash': 0, 'lsh_bands': 0}).limit(MAX_CANDIDATES):
+        score = jaccard(grams, shingles(product_text(candidate)))
+        if score >= threshold and compatible(product, candidate):
+            matches.append((candidate, round(score, 3)))
+    matches.sort(key=lambda match: -match[1])
+    return matches[:limit]
+
+
+def index_products(db, batch_size=1000, everything=False):
+    """Compute similarity fields for products that do not have them yet"""
+    from pymongo import UpdateOne
+
+    query = {} if everything else {'lsh_bands': {'$exists': False}}
+    last_id = None
+    products = 0
+    while True:
+        page_query = dict(query, _id={'$gt': last_id}) if last_id else query
+        batch = list(db.products.find(page_query, SIMILARITY_PROJECTION).sort('_id', 1).limit(batch_size))
+        if not batch:
+            break
+        last_id = batch[-1]['_id']
+        db.products.bulk_write([
+            UpdateOne({'_id': product['_id']}, {'$set': similarity_fields(
+                product.get('name'), product.get('brand'), product.get('quantity')
+            )})
+            for product in batch
+        ], ordered=False)
+        products += len(batch)
+        logger.info('Indexed %d products', products)
+    return {'products': products}
+
+
+def candidate_buckets(db):
+    """Groups of product ids that share an LSH band"""
+    return db.products.aggregate([
+        {'$project': {'lsh_bands': 1}},
+        {'$unwind': '$lsh_bands'},
+        {'$group': {'_id': '$lsh_bands', 'ids': {'$push': '$_id'}, 'size': {'$sum': 1}}},
+        {'$match': {'size': {'$gt': 1, '$lte': MAX_BUCKET}}},
+        {'$project': {'_id': 0, 'ids': 1}},
+    ], allowDiskUse=True)
+
+
+def _canonical_order(product):
+    return (
+        product.get('source') != 'open_food_facts',
+        has_generated_barcode(product),
+        product.get('created_at') or datetime.max,
+        product['_id'],
+    )
+
+
+def find_clusters(db, threshold=MERGE_THRESHOLD):
+    """Clusters of duplicate products as (canonical, [duplicates])"""
+    pairs = set()
+    for bucket in candidate_buckets(db):
+        ids = sorted(bucket['ids'])
+        pairs.update((a, b) for i, a in enumerate(ids) for b in ids[i + 1:])
+
+    ids = list({product_id for pair in pairs for product_id in pair})
+    products = {}
+    projection = {
+        'name': 1, 'brand': 1, 'quantity': 1, 'minhash': 1, 'source': 1, 'barcode': 1, 'barcode_generated': 1,
+        'created_at': 1, 'category_id': 1
+    }
+    for start in range(0, len(ids), 1000):
+        for product in db.products.find({'_id': {'$in': ids[start:start + 1000]}}, projection):
+            products[product['_id']] = product
+
+    parent = {}
+
+    def root(product_id):
+        while parent.get(product_id, product_id) != product_id:
+            product_id = parent[product_id]
+        return product_id
+
+    for a, b in pairs:
+        first, second = products.get(a), products.get(b)
+        if not first or not second or 'minhash' not in first or 'minhash' not in second:
+            continue
+        if estimated_similarity(first['minhash'], second['minhash']) < threshold or not compatible(first, second):
+            continue
+        root_a, root_b = root(a), root(b)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    members = {}
+    for product_id in parent:
+        members.setdefault(root(product_id), set()).update((product_id, root(product_id)))
+
+    clusters = []
+    for cluster in members.values():
+        ordered = sorted((products[product_id] for product_id in cluster), key=_canonical_order)
+        canonical = ordered[0]
+        duplicates = [product for product in ordered[1:] if has_generated_barcode(product)]
+        if duplicates:
+            clusters.append((canonical, duplicates))
+    return clusters
+
+
+def inventory_merge_ops(items, canonical_id):
+    """Bulk ops repointing a cluster's inventory items, combining each user's active items"""
+    from pymongo import DeleteOne, UpdateOne
+
+    ops = []
+    active = {}
+    for item in sorted(items, key=lambda item: item['product_id'] != canonical_id):
+        if item.get('status') != 'active':
+            if item['product_id'] != canonical_id:
+                ops.append(UpdateOne({'_id': item['_id']}, {'$set': {'product_id': canonical_id}}))
+            continue
+        active.setdefault(item['user_id'], []).append(item)
+
+    for user_items in active.values():
+        # The canonical product's item, if the user has one, absorbs the rest
+        target, others = user_items[0], user_items[1:]
+        update = {}
+        if target['product_id'] != canonical_id:
+            update['$set'] = {'product_id': canonical_id}
+        if others:
+            update['$inc'] = {'quantity': sum(item.get('quantity', 0) for item in others)}
+            expiry_dates = [item['expiry_date'] for item in user_items if item.get('expiry_date')]
+            if expiry_dates:
+                # The earliest expiry is the one that matters
+                update.setdefault('$set', {})['expiry_date'] = min(expiry_dates)
+            ops.extend(DeleteOne({'_id': item['_id']}) for item in others)
+        if update:
+            ops.insert(0, UpdateOne({'_id': target['_id']}, update))
+    return ops
+
+
+def merge_cluster(db, canonical, duplicates, catalog=None):
+    """Move a cluster's inventory and history to the canonical product and delete the duplicates"""
+    canonical_id = canonical['_id']
+    duplicate_ids = [product['_id'] for product in duplicates]
+    cluster_ids = [canonical_id] + duplicate_ids
+
+    items = list(db.inventory.find(
+        {'product_id': {'$in': cluster_ids}}, {'user_id': 1, 'product_id': 1, 'status': 1, 'quantity': 1, 'expiry_date': 1}
+    ))
+    ops = inventory_merge_ops(items, canonical_id)
+    if ops:
+        db.inventory.bulk_write(ops, ordered=True)
+    # Repointed items still carry the duplicate's category_id copy
+    db.inventory.update_many(
+        {'product_id': canonical_id, 'category_id': {'$ne': canonical.get('category_id')}},
+        {'$set': {'category_id': canonical.get('category_id')}}
+    )
+
+    # History follows the product so forecasts keep their consumption data
+    db.inventory_events.update_many(
+        {'meta.product_id': {'$in': duplicate_ids}}, {'$set': {'meta.product_id': canonical_id}}
+    )
+    db.inventory_daily.aggregate([
+        {'$match': {'product_id': {'$in': duplicate_ids}}},
+        {'$project': {'_id': 0, 'user_id': 1, 'day': 1, 'added': 1, 'consumed': 1,
+                      'removed': {'$ifNull': ['$removed', 0]}, 'events': 1,
+                      'last_quantity': 1, 'product_id': {'$literal': canonical_id}}},
+        {'$merge': {
+            'into': 'inventory_daily',
+            'on': ['user_id', 'product_id', 'day'],
+            'whenMatched': [{'$set': {
+                'added': {'$add': ['$added', '$$new.added']},
+                'consumed': {'$add': ['$consumed', '$$new.consumed']},
+                'removed': {'$add': [{'$ifNull': ['$removed', 0]}, '$$new.removed']},
+                'events': {'$add': ['$events', '$$new.events']},
+                'last_quantity': {'$add': ['$last_quantity', '$$new.last_quantity']}
+            }}],
+            'whenNotMatched': 'insert'
+        }}
+    ])
+    db.inventory_daily.delete_many({'product_id': {'$in': duplicate_ids}})
+    # Recomputed for the canonical product by the next restock_forecast run
+    db.restock_suggestions.delete_many({'product_id': {'$in': duplicate_ids}})
+
+    db.product_merges.insert_one({
+        'canonical_id': canonical_id,
+        'merged_ids': duplicate_ids,
+        'products': [{key: value for key, value in product.items() if key != 'minhash'} for product in duplicates],
+        'inventory_ops': len(ops),
+        'merged_at': datetime.utcnow()
+    })
+    db.products.delete_many({'_id': {'$in': duplicate_ids}})
+    if catalog is not None:
+        for product in duplicates:
+            catalog.record_write(product, deleted=True)
+    return len(ops)
+
+
+def merge_duplicates(db, threshold=MERGE_THRESHOLD, dry_run=False, catalog=None):
+    """Find duplicate clusters across the catalog and merge each into its canonical product"""
+    clusters = find_clusters(db, threshold)
+    report = {'clusters': len(clusters), 'merged_products': 0, 'inventory_ops': 0, 'examples': []}
+    for canonical, duplicates in clusters:
+        if len(report['examples']) < 10:
+            report['examples'].append({
+                'canonical': {'id': str(canonical['_id']), 'name': canonical.get('name')},
+                'duplicates': [{'id': str(product['_id']), 'name': product.get('name')} for product in duplicates]
+            })
+        report['merged_products'] += len(duplicates)
+        if not dry_run:
+            report['inventory_ops'] += merge_cluster(db, canonical, duplicates, catalog)
+    logger.info('%s %d duplicate products in %d clusters', 'Found' if dry_run else 'Merged',
+                report['merged_products'], report['clusters'])
+    return report
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    import os
+
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Detect and merge near-duplicate products')
+    parser.add_argument('command', choices=['index', 'merge'])
+    parser.add_argument('--all', action='store_true', help='recompute signatures of products that already have one')
+    parser.add_argument('--threshold', type=float, default=MERGE_THRESHOLD)
+    parser.add_argument('--dry-run', action='store_true', help='report clusters without merging')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    client = MongoClient(os.getenv('MONGO_URI', 'mongodb://localhost:27017/grocerstock'))
+    database = client.get_default_database('grocerstock')
+
+    if args.command == 'index':
+        print(json.dumps(index_products(database, everything=args.all)))
+    else:
+        snapshot = None
+        if os.getenv('CATALOG_SNAPSHOT_PATH'):
+            from catalog_snapshot import CatalogSnapshot
+            snapshot = CatalogSnapshot(os.getenv('CATALOG_SNAPSHOT_PATH'))
+        print(json.dumps(merge_duplicates(database, args.threshold, args.dry_run, snapshot), indent=2))
@@ -0,0 +1,248 @@
+"""Opt-in profiler that explains slow queries issued by the data routes.
+
+A PyMongo CommandListener watches find/aggregate/count/distinct commands
+sent while serving the inventory, products and barcode blueprints. When one
+takes longer than PROFILER_SLOW_MS and passes sampling, the command is
+re-run as ``explain`` with executionStats on a background thread and a
+summary is logged: COLLSCANs, blocking in-memory sorts, the
+examined-to-returned ratio, the endpoint and the filter shape with every
+literal value redacted.
+
+Sampling keeps it safe for production: only a PROFILER_SAMPLE_RATE fraction
+of slow commands is considered, each endpoint + query shape is explained at
+most once per PROFILER_SHAPE_TTL seconds, at most PROFILER_MAX_PER_MINUTE
+explains run per process, and the explain queue is small and drops work
+when full.
+"""
+import json
+import logging
+import queue
+import random
+import threading
+import time
+
+from flask import has_request_context, request
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+PROFILED_BLUEPRINTS = ('inventory', 'products', 'barcode')
+PROFILED_COMMANDS = ('find', 'aggregate', 'count', 'distinct')
+
+# Fields copied into the explain command; session, cluster time, read
+# preference and cursor batch options are dropped.
+EXPLAINABLE_FIELDS = {
+    'find': ('filter', 'sort', 'projection', 'limit', 'skip', 'hint', 'collation'),
+    'aggregate': ('pipeline', 'hint', 'collation', 'allowDiskUse'),
+    'count': ('query', 'limit', 'skip', 'hint', 'collation'),
+    'distinct': ('key', 'query', 'collation'),
+}
+
+
+def redact(value):
+    """Replace every literal in a filter with '?', keeping field names and operators
+
+    A list of literals ($in, $all, ...) becomes ['?'] whatever its length, so
+    it does not split one shape into many. Lists of sub-filters ($and, $or)
+    keep their structure.
+    """
+    if isinstance(value, dict):
+        return {key: redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        if any(isinstance(item, dict) for item in value):
+            return [redact(item) for item in value]
+        return ['?']
+    return '?'
+
+
+def query_shape(command_name, command):
+    """Redacted, log-safe description of a command"""
+    shape = {'command': command_name, 'collection': command.get(command_name)}
+    if command_name == 'aggregate':
+        pipeline = command.get('pipeline', [])
+        shape['pipeline'] = [next(iter(stage)) for stage in pipeline]
+        matches = [stage['$match'] for stage in pipeline if '$match' in stage]
+        if matches:
+            shape['filter'] = redact(matches[0])
+        sorts = [stage['$sort'] for stage in pipeline if '$sort' in stage]
+        if sorts:
+            shape['sort'] = dict(sorts[0])
+    else:
+        shape['filter'] = redact(command.get('filter', command.get('query', {})))
+        if command.get('sort'):
+            shape['sort'] = dict(command['sort'])
+    return shape
+
+
+def summarize_explain(explain):
+    """Pull plan stages, documents examined and returned out of an explain result.
+
+    ``returned`` is what the query stage produced (the $cursor stage of an
+    aggregation), so the ratio measures how selective the index use was.
+    Blocking sorts are SORT plan stages and $sort entries of the pipeline's
+    ``stages``. The echoed ``command`` is skipped: its $sort says nothing about
+    whether an index provided the order.
+    """
+    stages = []
+    docs_examined = 0
+    keys_examined = 0
+    returned = None
+
+    def walk(node):
+        nonlocal docs_examined, keys_examined, returned
+        if isinstance(node, dict):
+            if isinstance(node.get('stage'), str):
+                stages.append(node['stage'])
+            if node.get('collectionScans'):
+                # $lookup reports scans of the foreign collection this way
+                stages.append('COLLSCAN')
+            if 'executionStats' in node and isinstance(node['executionStats'], dict):
+                stats = node['executionStats']
+                docs_examined += stats.get('totalDocsExamined', 0)
+                keys_examined += stats.get('totalKeysExamined', 0)
+                if returned is None:
+                    returned = stats.get('nReturned')
+            # $lookup and other pipeline stages report their own counts
+            elif 'totalDocsExamined' in node:
+                docs_examined += node['totalDocsExamined']
+                keys_examined += node.get('totalKeysExamined', 0)
+            for key, child in node.items():
+                if key == 'command':
+                    continue
+                if key == 'stages' and isinstance(child, list):
+                    # Aggregation stages that were not pushed into the query plan
+                    stages.extend('$sort' for stage in child if isinstance(stage, dict) and '$sort' in stage)
+                if key != 'executionStats':
+                    walk(child)
+                else:
+                    walk(child.get('executionStages', {}))
+        elif isinstance(node, list):
+            for child in node:
+                walk(child)
+
+    walk(explain)
+
+    return {
+        'collscan': 'COLLSCAN' in stages,
+        'blocking_sort': any(stage in ('SORT', 'sort', '$sort') for stage in stages),
+        'stages': sorted(set(stages)),
+        'docs_examined': docs_examined,
+        'keys_examined': keys_examined,
+        'returned': returned,
+        'examined_to_returned': round(docs_examined / returned, 1) if returned else None,
+    }
+
+
+class SlowQueryProfiler(monitoring.CommandListener):
+    def __init__(self, slow_ms=100, sample_rate=0.1, max_per_minute=6, shape_ttl=600):
+        self.slow_ms = slow_ms
+        self.sample_rate = sample_rate
+        self.max_per_minute = max_per_minute
+        self.shape_ttl = shape_ttl
+        self.client = None
+        self._inflight = {}
+        self._recent_shapes = {}
+        self._window = []
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=16)
+        self._thread = None
+
+    def attach(self, client):
+        """Client used to run explains (the same one the listener watches)"""
+        self.client = client
+
+    def started(self, event):
+        if event.command_name not in PROFILED_COMMANDS or not has_request_context():
+            return
+        if request.blueprint not in PROFILED_BLUEPRINTS:
+            return
+        self._inflight[(event.connection_id, event.request_id)] = (
+            request.endpoint, event.database_name, dict(event.command)
+        )
+
+    def succeeded(self, event):
+        inflight = self._inflight.pop((event.connection_id, event.request_id), None)
+        if inflight is None or event.duration_micros < self.slow_ms * 1000:
+            return
+        if random.random() >= self.sample_rate:
+            return
+
+        endpoint, database, command = inflight
+        shape = query_shape(event.command_name, command)
+        if not self._admit(endpoint, shape):
+            return
+
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((endpoint, database, event.command_name, command, shape,
+                                    event.duration_micros / 1000))
+        except queue.Full:
+            pass
+
+    def failed(self, event):
+        self._inflight.pop((event.connection_id, event.request_id), None)
+
+    def _admit(self, endpoint, shape):
+        now = time.monotonic()
+        key = (endpoint, json.dumps(shape, sort_keys=True, default=str))
+        with self._lock:
+            if now - self._recent_shapes.get(key, -self.shape_ttl) < self.shape_ttl:
+                return False
+            self._window = [started for started in self._window if now - started < 60]
+            if len(self._window) >= self.max_per_minute:
+                return False
+            self._window.append(now)
+            self._recent_shapes[key] = now
+            if len(self._recent_shapes) > 1000:
+                self._recent_shapes = {
+                    shape_key: seen for shape_key, seen in self._recent_shapes.items()
+                    if now - seen < self.shape_ttl
+                }
+        return True
+
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(
+                        target=self._run, name='slow-query-profiler', daemon=True
+                    )
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            endpoint, database, command_name, command, shape, duration_ms = self._queue.get()
+            try:
+                self.explain(endpoint, database, command_name, command, shape, duration_ms)
+            except Exception:
+                logger.exception('Failed to explain slow %s on %s', command_name, endpoint)
+
+    def explain(self, endpoint, database, command_name, command, shape, duration_ms):
+        explainable = {command_name: command[command_name]}
+        for field in EXPLAINABLE_FIELDS[command_name]:
+            if field in command:
+                explainable[field] = command[field]
+        if command_name == 'aggregate':
+            explainable['cursor'] = {}
+
+        result = self.client[database].command(
+            {'explain': explainable, 'verbosity': 'executionStats'}
+        )
+        report = dict(
+            endpoint=endpoint, duration_ms=round(duration_ms, 1), shape=shape,
+            **summarize_explain(result)
+        )
+        logger.warning('Slow query: %s', json.dumps(report, default=str))
+        return report
+
+
+def create_profiler(app):
+    """Build the profiler from app config, or None when it is disabled"""
+    if not app.config.get('PROFILER_ENABLED'):
+        return None
+    return SlowQueryProfiler(
+        slow_ms=app.config['PROFILER_SLOW_MS'],
+        sample_rate=app.config['PROFILER_SAMPLE_RATE'],
+        max_per_minute=app.config['PROFILER_MAX_PER_MINUTE'],
+        shape_ttl=app.config['PROFILER_SHAPE_TTL'],
+    )
@@ -0,0 +1,180 @@
+"""Per-client token-bucket rate limiting and load shedding for expensive routes.
+
+Buckets live in a small memory-mapped file (RATE_LIMIT_TABLE_PATH, /dev/shm
+by default) that every worker process on the host maps, so a client's budget
+is shared across workers. The table is split into groups of
+SLOTS_PER_GROUP 24-byte slots; a client key hashes to one group, which is
+locked with a per-process lock plus an fcntl byte-range lock while its
+bucket is refilled and charged. When a group is full, the slot touched least
+recently is reused.
+
+Clients are keyed by JWT identity when a valid token is present, otherwise
+by remote address. Each request costs ENDPOINT_COSTS[endpoint] tokens
+(default 1). Requests that cannot be paid for get 429 with Retry-After.
+
+Separately, EXPENSIVE_ENDPOINTS may only run RATE_LIMIT_EXPENSIVE_CONCURRENCY
+at a time per process. Excess requests get 503 straight away instead of
+queueing until every worker thread is tied up in image rendering or
+upstream calls.
+"""
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from flask import g, jsonify, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+
+SLOT = struct.Struct('<Qdd')  # key hash, tokens, last update (unix time)
+SLOTS_PER_GROUP = 8
+
+ENDPOINT_COSTS = {
+    'barcode.get_barcode_image': 5,
+    'barcode.download_barcode_image': 5,
+    'barcode.generate_barcode': 5,
+    # unanchored regex scans and possible Open Food Facts lookups
+    'products.search_products': 3,
+    'inventory.export_inventory': 10,
+    'products.get_product_thumbnail': 2,
+    'products.get_catalog_bundle': 5,
+}
+
+EXPENSIVE_ENDPOINTS = (
+    'barcode.get_barcode_image',
+    'barcode.download_barcode_image',
+    'barcode.generate_barcode',
+    'products.search_products',
+)
+
+EXEMPT_ENDPOINTS = ('health_check', 'metrics', 'static')
+
+
+def default_table_path():
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(directory, 'grocerstock-ratelimit')
+
+
+class TokenBucketTable:
+    def __init__(self, path, slots=65536, capacity=60.0, refill_per_second=1.0):
+        self.groups = max(1, slots // SLOTS_PER_GROUP)
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.size = self.groups * SLOTS_PER_GROUP * SLOT.size
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < self.size:
+            os.ftruncate(self._fd, self.size)
+        self._map = mmap.mmap(self._fd, self.size, mmap.MAP_SHARED)
+        self._locks = [threading.Lock() for _ in range(64)]
+
+    @staticmethod
+    def key_hash(key):
+        # 0 marks an empty slot
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little') or 1
+
+    def consume(self, key, cost=1.0, now=None):
+        """Charge ``cost`` tokens; returns 0 if allowed, else seconds until it would be"""
+        now = time.time() if now is None else now
+        cost = min(cost, self.capacity)
+        key_hash = self.key_hash(key)
+        group = key_hash % self.groups
+        group_offset = group * SLOTS_PER_GROUP * SLOT.size
+
+        with self._locks[group % len(self._locks)]:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, SLOT.size, group_offset)
+            try:
+                offset, tokens, updated = self._find_slot(group_offset, key_hash, now)
+                tokens = min(self.capacity, tokens + max(0.0, now - updated) * self.refill_per_second)
+
+                if tokens >= cost:
+                    SLOT.pack_into(self._map, offset, key_hash, tokens - cost, now)
+                    return 0.0
+
+                SLOT.pack_into(self._map, offset, key_hash, tokens, now)
+                if self.refill_per_second <= 0:
+                    return 3600.0
+                return (cost - tokens) / self.refill_per_second
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, SLOT.size, group_offset)
+
+    def _find_slot(self, group_offset, key_hash, now):
+        oldest_offset, oldest_updated = None, None
+        for index in range(SLOTS_PER_GROUP):
+            offset = group_offset + index * SLOT.size
+            slot_key, tokens, updated = SLOT.unpack_from(self._map, offset)
+            if slot_key == key_hash:
+                return offset, tokens, updated
+            if slot_key == 0:
+                return offset, self.capacity, now
+            if oldest_updated is None or updated < oldest_updated:
+                oldest_offset, oldest_updated = offset, updated
+        # Group is full: reuse the least recently touched bucket
+        return oldest_offset, self.capacity, now
+
+
+def client_key():
+    """JWT identity when a valid token is sent, otherwise the client address"""
+    try:
+        if verify_jwt_in_request(optional=True):
+            return f'user:{get_jwt_identity()}'
+    except Exception:
+        pass
+    return f'ip:{request.remote_addr}'
+
+
+def check_request(table, expensive, key, endpoint):
+    """None if the request may run, else (status, payload, retry after seconds)
+
+    A request let into one of EXPENSIVE_ENDPOINTS holds a slot of the
+    ``expensive`` semaphore, which the caller releases when it finishes.
+    """
+    retry_after = table.consume(key, ENDPOINT_COSTS.get(endpoint, 1))
+    if retry_after:
+        retry_after = math.ceil(retry_after)
+        return 429, {'error': 'Rate limit exceeded', 'retry_after': retry_after}, retry_after
+
+    if endpoint in EXPENSIVE_ENDPOINTS and not expensive.acquire(blocking=False):
+        return 503, {'error': 'Server busy, please retry'}, 1
+    return None
+
+
+def init_app(app):
+    table = TokenBucketTable(
+        app.config['RATE_LIMIT_TABLE_PATH'],
+        slots=app.config['RATE_LIMIT_SLOTS'],
+        capacity=app.config['RATE_LIMIT_CAPACITY'],
+        refill_per_second=app.config['RATE_LIMIT_REFILL_PER_SEC'],
+    )
+    expensive = threading.BoundedSemaphore(app.config['RATE_LIMIT_EXPENSIVE_CONCURRENCY'])
+    app.rate_limiter = table
+    app.expensive_slots = expensive
+
+    @app.before_request
+    def enforce_rate_limit():
+        endpoint = request.endpoint
+        if endpoint is None or endpoint in EXEMPT_ENDPOINTS or request.method == 'OPTIONS':
+            return None
+
+        rejection = check_request(table, expensive, client_key(), endpoint)
+        if rejection:
+            status, payload, retry_after = rejection
+            response = jsonify(payload)
+            response.status_code = status
+            response.headers['Retry-After'] = str(retry_after)
+            return response
+
+        if endpoint in EXPENSIVE_ENDPOINTS:
+            g.holds_expensive_slot = True
+        return None
+
+    @app.teardown_request
+    def release_expensive_slot(exc):
+        if g.pop('holds_expensive_slot', False):
+            expensive.release()
+
+    return table
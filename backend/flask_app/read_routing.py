@@ -0,0 +1,154 @@
+"""Per-endpoint read preference routing on top of app.mongo.
+
+Every endpoint belongs to a consistency class (ENDPOINT_CONSISTENCY; the
+default is PRIMARY). ``RoutedMongo.db`` returns the database handle for the
+class of the current request, so routes keep using ``current_app.mongo.db``.
+Writes always go to the primary, whatever handle they are issued on.
+
+    PRIMARY            reads on the primary
+    BOUNDED_STALENESS  secondaryPreferred with maxStalenessSeconds: catalog
+                       reads, reports and exports that can be a little behind
+    READ_YOUR_WRITES   a user's own data: the primary until maxStalenessSeconds
+                       plus one heartbeat have passed since that user last
+                       wrote, bounded staleness after that
+
+Write times are tracked per user in the process. They are also returned on
+successful writes as ``X-Last-Write``, which clients echo back as
+``X-Read-After``, so the guarantee holds across workers and devices. The
+inventory stream events carry the same time as ``written_at``.
+
+maxStalenessSeconds must be at least 90 (a MongoDB limit). With routing
+disabled, or against a standalone server, every read goes to the primary.
+"""
+import threading
+import time
+
+from flask import has_request_context, request
+from flask_jwt_extended import get_jwt_identity
+from pymongo.read_preferences import Primary, SecondaryPreferred
+
+PRIMARY = 'primary'
+BOUNDED_STALENESS = 'bounded_staleness'
+READ_YOUR_WRITES = 'read_your_writes'
+
+MIN_MAX_STALENESS = 90
+# A secondary's staleness is only re-measured every heartbeat (pymongo default 10s)
+HEARTBEAT_SECONDS = 10
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+# Forget writes older than the window once this many users are tracked
+MAX_TRACKED_USERS = 10000
+
+ENDPOINT_CONSISTENCY = {
+    'products.search_products': BOUNDED_STALENESS,
+    'products.get_product': BOUNDED_STALENESS,
+    'products.get_similar_products': BOUNDED_STALENESS,
+    'products.get_product_thumbnail': BOUNDED_STALENESS,
+    'products.get_categories': BOUNDED_STALENESS,
+    # Bundles are written by catalog_bundle.py, never changed afterwards
+    'products.get_catalog_bundle': BOUNDED_STALENESS,
+    'inventory.get_inventory': READ_YOUR_WRITES,
+    'inventory.get_expiring_items': READ_YOUR_WRITES,
+    'inventory.get_item_forecast': READ_YOUR_WRITES,
+    # Written by the nightly restock_forecast job, not by the user
+    'inventory.get_restock_suggestions': BOUNDED_STALENESS,
+    'inventory.export_inventory': BOUNDED_STALENESS,
+    'barcode.get_my_barcodes': READ_YOUR_WRITES,
+}
+
+
+def request_identity():
+    """JWT identity already verified for the current request, or None"""
+    try:
+        return get_jwt_identity()
+    except RuntimeError:
+        # The endpoint does not require a token
+        return None
+
+
+class RoutedMongo:
+    """app.mongo with .db chosen by the consistency class of the current endpoint"""
+
+    def __init__(self, mongo, enabled=False, max_staleness=MIN_MAX_STALENESS):
+        if enabled and max_staleness < MIN_MAX_STALENESS:
+            raise ValueError(f'MONGO_MAX_STALENESS_SECONDS must be at least {MIN_MAX_STALENESS}')
+        self.mongo = mongo
+        self.cx = mongo.cx
+        self.enabled = enabled
+        self.max_staleness = max_staleness
+        self.write_window = max_staleness + HEARTBEAT_SECONDS
+        self._databases = {
+            consistency: mongo.cx.get_database(mongo.db.name, read_preference=read_preference)
+            for consistency, read_preference in self.read_preferences().items()
+        }
+        self.primary = self._databases[PRIMARY]
+        self._lock = threading.Lock()
+        self._last_writes = {}  # user id -> time.time() of their last write
+
+    @property
+    def db(self):
+        return self._databases[self.consistency()]
+
+    def read_preferences(self):
+        """pymongo read preference of each consistency class"""
+        return {
+            PRIMARY: Primary(),
+            BOUNDED_STALENESS: SecondaryPreferred(max_staleness=self.max_staleness),
+        }
+
+    def consistency(self):
+        """Read preference class for the current request"""
+        if not self.enabled or not has_request_context():
+            return PRIMARY
+        return self.consistency_for(request.endpoint, request_identity, request.headers.get('X-Read-After'))
+
+    def consistency_for(self, endpoint, user_id, read_after=None):
+        """Read preference class of an endpoint for a user, also outside a Flask request
+
+        user_id may be a callable, so the identity is only looked up for
+        READ_YOUR_WRITES endpoints; read_after is the X-Read-After header.
+        """
+        if not self.enabled:
+            return PRIMARY
+        consistency = ENDPOINT_CONSISTENCY.get(endpoint, PRIMARY)
+        if consistency == READ_YOUR_WRITES:
+            user_id = user_id() if callable(user_id) else user_id
+            return PRIMARY if self.wrote_recently(user_id, read_after) else BOUNDED_STALENESS
+        return consistency
+
+    def wrote_recently(self, user_id, read_after=None):
+        """Whether a secondary may not have the user's last write yet"""
+        last_write = self._last_writes.get(user_id, 0.0)
+        try:
+            last_write = max(last_write, float(read_after or 0))
+        except ValueError:
+            pass
+        return time.time() - last_write < self.write_window
+
+    def record_write(self, user_id, written_at):
+        with self._lock:
+            self._last_writes[user_id] = written_at
+            if len(self._last_writes) > MAX_TRACKED_USERS:
+                cutoff = written_at - self.write_window
+                self._last_writes = {
+                    user: timestamp for user, timestamp in self._last_writes.items() if timestamp >= cutoff
+                }
+
+
+def init_app(app, mongo):
+    routed = RoutedMongo(
+        mongo,
+        enabled=app.config['READ_ROUTING_ENABLED'],
+        max_staleness=app.config['MONGO_MAX_STALENESS_SECONDS'],
+    )
+
+    @app.after_request
+    def track_writes(response):
+        if routed.enabled and request.method in WRITE_METHODS and 200 <= response.status_code < 300:
+            user_id = request_identity()
+            if user_id:
+                written_at = time.time()
+                routed.record_write(user_id, written_at)
+                response.headers['X-Last-Write'] = f'{written_at:.3f}'
+        return response
+
+    return routed
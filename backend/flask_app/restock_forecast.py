@@ -0,0 +1,215 @@
+"""Nightly restock forecasting over every user's inventory.
+
+Users are split into partitions that a process pool works through. For each
+partition, one query loads the current active quantity per user and product
+and another loads the last WINDOW_DAYS of inventory_daily rollups (see
+inventory_events.py). Each (user, product) pair becomes one row of a
+``series x day`` consumption matrix. Simple exponential smoothing runs down
+the day axis for all rows at once, so the Python loop is WINDOW_DAYS steps
+long however many series there are. The smoothed daily use gives a run-out
+date and a suggested top-up. Results are upserted into restock_suggestions
+with unordered bulk writes, and the inventory routes read them from there
+instead of computing anything per request.
+
+Series with no consumption history fall back to the old low-stock rule
+(quantity <= LOW_STOCK_QUANTITY).
+
+    python restock_forecast.py --partitions 32 --workers 4
+"""
+import logging
+import multiprocessing
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+from bson import ObjectId
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+WINDOW_DAYS = 28
+ALPHA = 0.3
+HORIZON_DAYS = 7       # suggest a restock when stock runs out within this many days
+COVER_DAYS = 14        # suggested quantity tops stock up to this many days of use
+LEAD_DAYS = 2          # restock_by is this many days before the run-out date
+LOW_STOCK_QUANTITY = 2
+WRITE_BATCH_SIZE = 1000
+
+
+def smooth(consumption, alpha=ALPHA):
+    """Exponentially smoothed daily use per row of a series x day matrix"""
+    level = consumption[:, 0].astype(np.float64)
+    for day in range(1, consumption.shape[1]):
+        level = alpha * consumption[:, day] + (1 - alpha) * level
+    return level
+
+
+def forecast(consumption, quantity, alpha=ALPHA, horizon=HORIZON_DAYS, cover=COVER_DAYS):
+    """Vectorized run-out and restock arrays for every series.
+
+    ``consumption`` is a (series, days) matrix of units used per day, oldest
+    day first; ``quantity`` holds the current stock per series. Returns a dict
+    of arrays: daily use, days left (inf when nothing is being used), whether
+    to restock and how much to buy.
+    """
+    quantity = np.asarray(quantity, dtype=np.float64)
+    daily = smooth(consumption, alpha)
+    has_history = consumption.any(axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days_left = np.where(daily > 0, quantity / daily, np.inf)
+
+    restock = np.where(has_history, days_left <= horizon, quantity <= LOW_STOCK_QUANTITY)
+    suggested = np.where(has_history, np.ceil(np.maximum(daily * cover - quantity, 0)), 0)
+    return {
+        'daily_consumption': daily,
+        'days_left': days_left,
+        'restock': restock,
+        'suggested_quantity': suggested,
+    }
+
+
+def partition_users(db, partitions):
+    """Split the users that hold inventory or history into roughly equal lists"""
+    user_ids = set(db.inventory.distinct('user_id', {'status': 'active'}))
+    user_ids.update(db.inventory_daily.distinct('user_id'))
+    ordered = sorted(user_ids)
+    partitions = max(1, min(partitions, len(ordered)))
+    return [ordered[index::partitions] for index in range(partitions)] if ordered else []
+
+
+def load_partition(db, user_ids, since, window=WINDOW_DAYS):
+    """Series keys, consumption matrix and current quantities for a set of users"""
+    stock = list(db.inventory.aggregate([
+        {'$match': {'user_id': {'$in': user_ids}, 'status': 'active'}},
+        {'$group': {'_id': {'user_id': '$user_id', 'product_id': '$product_id'}, 'quantity': {'$sum': '$quantity'}}},
+    ]))
+    rollups = list(db.inventory_daily.find(
+        {'user_id': {'$in': user_ids}, 'day': {'$gte': since}, 'consumed': {'$gt': 0}},
+        {'_id': 0, 'user_id': 1, 'product_id': 1, 'day': 1, 'consumed': 1}
+    ).batch_size(10000))
+
+    # 24-byte user+product keys let np.unique assign series numbers without a dict
+    stock_keys = np.array(
+        [doc['_id']['user_id'].binary + doc['_id']['product_id'].binary for doc in stock], dtype='S24'
+    )
+    rollup_keys = np.array([doc['user_id'].binary + doc['product_id'].binary for doc in rollups], dtype='S24')
+    keys, series = np.unique(np.concatenate([stock_keys, rollup_keys]), return_inverse=True)
+    stock_series, rollup_series = series[:len(stock)], series[len(stock):]
+
+    quantity = np.zeros(len(keys))
+    quantity[stock_series] = [float(doc['quantity'] or 0) for doc in stock]
+
+    consumption = np.zeros((len(keys), window))
+    if rollups:
+        days = np.array([doc['day'] for doc in rollups], dtype='datetime64[D]')
+        offsets = (days - np.datetime64(since, 'D')).astype(np.int64)
+        in_window = (offsets >= 0) & (offsets < window)
+        np.add.at(
+            consumption,
+            (rollup_series[in_window], offsets[in_window]),
+            np.array([doc['consumed'] for doc in rollups])[in_window]
+        )
+    return keys, consumption, quantity
+
+
+def suggestion_updates(keys, result, quantity, now, run_id):
+    """UpdateOne upserts for the series that have something to report"""
+    report = result['restock'] | np.isfinite(result['days_left'])
+    updates = []
+    for index in np.flatnonzero(report):
+        key = bytes(keys[index]).ljust(24, b'\0')
+        user_id, product_id = ObjectId(key[:12]), ObjectId(key[12:])
+        days_left = float(result['days_left'][index])
+        run_out_date = now + timedelta(days=days_left) if np.isfinite(days_left) else None
+        updates.append(UpdateOne(
+            {'user_id': user_id, 'product_id': product_id},
+            {'$set': {
+                'quantity': float(quantity[index]),
+                'daily_consumption': round(float(result['daily_consumption'][index]), 3),
+                'days_left': round(days_left, 1) if run_out_date else None,
+                'run_out_date': run_out_date,
+                'restock': bool(result['restock'][index]),
+                'restock_by': run_out_date - timedelta(days=LEAD_DAYS) if run_out_date else None,
+                'suggested_quantity': float(result['suggested_quantity'][index]),
+                'generated_at': now,
+                'run_id': run_id
+            }},
+            upsert=True
+        ))
+    return updates
+
+
+def run_partition(db, user_ids, now, run_id):
+    since = datetime(now.year, now.month, now.day) - timedelta(days=WINDOW_DAYS)
+    keys, consumption, quantity = load_partition(db, user_ids, since)
+    if not len(keys):
+        return {'series': 0, 'written': 0}
+
+    result = forecast(consumption, quantity)
+    updates = suggestion_updates(keys, result, quantity, now, run_id)
+    for start in range(0, len(updates), WRITE_BATCH_SIZE):
+        db.restock_suggestions.bulk_write(updates[start:start + WRITE_BATCH_SIZE], ordered=False)
+    # Drop suggestions for series that no longer produce one
+    db.restock_suggestions.delete_many({'user_id': {'$in': user_ids}, 'run_id': {'$ne': run_id}})
+    return {'series': len(keys), 'written': len(updates)}
+
+
+_worker_db = None
+
+
+def _init_worker(mongo_uri):
+    global _worker_db
+    from pymongo import MongoClient
+
+    _worker_db = MongoClient(mongo_uri).get_default_database('grocerstock')
+
+
+def _run_partition_in_worker(user_ids, now, run_id):
+    return run_partition(_worker_db, user_ids, now, run_id)
+
+
+def run_forecast(mongo_uri, partitions=32, workers=None, now=None):
+    """Forecast every user's inventory, one partition per pool task"""
+    from pymongo import MongoClient
+
+    now = now or datetime.utcnow()
+    run_id = uuid.uuid4().hex
+    client = MongoClient(mongo_uri)
+    try:
+        user_partitions = partition_users(client.get_default_database('grocerstock'), partitions)
+    finally:
+        client.close()
+
+    totals = {'run_id': run_id, 'partitions': len(user_partitions), 'series': 0, 'written': 0}
+    # spawn: each worker opens its own MongoClient instead of inheriting sockets
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(mongo_uri,)) as pool:
+        futures = [pool.submit(_run_partition_in_worker, user_ids, now, run_id) for user_ids in user_partitions]
+        for future in futures:
+            result = future.result()
+            totals['series'] += result['series']
+            totals['written'] += result['written']
+
+    logger.info('Restock forecast %s: %d series, %d suggestions', run_id, totals['series'], totals['written'])
+    return totals
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    import os
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mongo-uri', default=os.getenv('MONGO_URI', 'mongodb://localhost:27017/grocerstock'))
+    parser.add_argument('--partitions', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(run_forecast(args.mongo_uri, args.partitions, args.workers), indent=2))
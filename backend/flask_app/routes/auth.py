@@ -88,11 +88,8 @@ def login():
         if not user or not check_password_hash(user['password_hash'], password):
             return jsonify({'error': 'Invalid email or password'}), 401
         
-        # Update last login
-        current_app.mongo.db.users.update_one(
-            {'_id': user['_id']},
-            {'$set': {'last_login': datetime.utcnow()}}
-        )
+        # Update last login (buffered, flushed in batches off the request path)
+        current_app.write_behind.max('users', user['_id'], {'last_login': datetime.utcnow()})
         
         # Create access token
         access_token = create_access_token(identity=str(user['_id']))
@@ -101,7 +98,7 @@ def login():
             'message': 'Login successful',
             'access_token': access_token,
             'user': {
-                'id': str(user['_id']),
+                'id': user['_id'],
                 'email': user['email'],
                 'username': user['username'],
                 'preferences': user.get('preferences', {})
@@ -124,12 +121,12 @@ def get_profile():
         
         return jsonify({
             'user': {
-                'id': str(user['_id']),
+                'id': user['_id'],
                 'email': user['email'],
                 'username': user['username'],
                 'preferences': user.get('preferences', {}),
-                'created_at': user['created_at'].isoformat(),
-                'last_login': user.get('last_login', '').isoformat() if user.get('last_login') else None
+                'created_at': user['created_at'],
+                'last_login': user.get('last_login')
             }
         }), 200
         
@@ -177,7 +174,7 @@ def update_profile():
         return jsonify({
             'message': 'Profile updated successfully',
             'user': {
-                'id': str(user['_id']),
+                'id': user['_id'],
                 'email': user['email'],
                 'username': user['username'],
                 'preferences': user.get('preferences', {})
@@ -1,8 +1,6 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify, send_file, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from bson import ObjectId
-import barcode
-from barcode.writer import ImageWriter
 from io import BytesIO
 import hashlib
 import time
@@ -10,6 +8,20 @@ from datetime import datetime
 
 barcode_bp = Blueprint('barcode', __name__)
 
+def render_barcode_image(value):
+    """Render a Code 128 barcode as PNG into a BytesIO buffer"""
+    # python-barcode pulls in Pillow; import on first render, not at startup
+    import barcode
+    from barcode.writer import ImageWriter
+    
+    barcode_class = barcode.get_barcode_class('code128')
+    barcode_instance = barcode_class(value, writer=ImageWriter())
+    
+    buffer = BytesIO()
+    barcode_instance.write(buffer)
+    buffer.seek(0)
+    return buffer
+
 @barcode_bp.route('/generate', methods=['POST'])
 @jwt_required()
 def generate_barcode():
@@ -31,13 +43,7 @@ def generate_barcode():
         
         # Generate barcode image
         try:
-            barcode_class = barcode.get_barcode_class('code128')
-            barcode_instance = barcode_class(unique_id, writer=ImageWriter())
-            
-            # Save to bytes buffer
-            buffer = BytesIO()
-            barcode_instance.write(buffer)
-            buffer.seek(0)
+            render_barcode_image(unique_id)
         except Exception as e:
             return jsonify({'error': 'Failed to generate barcode image', 'details': str(e)}), 500
         
@@ -52,7 +58,7 @@ def generate_barcode():
         }
         
         # Check if barcode already exists (unlikely but possible)
-        existing_barcode = request.app.mongo.db.generated_barcodes.find_one({'custom_barcode': unique_id})
+        existing_barcode = current_app.mongo.db.generated_barcodes.find_one({'custom_barcode': unique_id})
         if existing_barcode:
             # Regenerate with different timestamp
             unique_id = hashlib.md5(
@@ -60,7 +66,7 @@ def generate_barcode():
             ).hexdigest()[:12]
             barcode_data['custom_barcode'] = unique_id
         
-        result = request.app.mongo.db.generated_barcodes.insert_one(barcode_data)
+        result = current_app.mongo.db.generated_barcodes.insert_one(barcode_data)
         
         return jsonify({
             'success': True,
@@ -70,7 +76,7 @@ def generate_barcode():
                 'product_name': product_name,
                 'category': category,
                 'weight': weight,
-                'created_at': barcode_data['created_at'].isoformat()
+                'created_at': barcode_data['created_at']
             },
             'image_url': f'/api/barcode/{unique_id}/image'
         })
@@ -82,12 +88,7 @@ def generate_barcode():
 def get_barcode_image(barcode_id):
     try:
         # Generate barcode image on the fly
-        barcode_class = barcode.get_barcode_class('code128')
-        barcode_instance = barcode_class(barcode_id, writer=ImageWriter())
-        
-        buffer = BytesIO()
-        barcode_instance.write(buffer)
-        buffer.seek(0)
+        buffer = render_barcode_image(barcode_id)
         
         return send_file(
             buffer,
@@ -103,12 +104,7 @@ def get_barcode_image(barcode_id):
 def download_barcode_image(barcode_id):
     try:
         # Generate barcode image on the fly
-        barcode_class = barcode.get_barcode_class('code128')
-        barcode_instance = barcode_class(barcode_id, writer=ImageWriter())
-        
-        buffer = BytesIO()
-        barcode_instance.write(buffer)
-        buffer.seek(0)
+        buffer = render_barcode_image(barcode_id)
         
         return send_file(
             buffer,
@@ -126,7 +122,7 @@ def get_my_barcodes():
     try:
         current_user_id = get_jwt_identity()
         
-        barcodes = list(request.app.mongo.db.generated_barcodes.find(
+        barcodes = list(current_app.mongo.db.generated_barcodes.find(
             {'user_id': ObjectId(current_user_id)},
             {'user_id': 0}  # Exclude user_id from response
         ).sort('created_at', -1))
@@ -134,12 +130,12 @@ def get_my_barcodes():
         formatted_barcodes = []
         for barcode in barcodes:
             formatted_barcodes.append({
-                'id': str(barcode['_id']),
+                'id': barcode['_id'],
                 'custom_barcode': barcode['custom_barcode'],
                 'product_name': barcode['product_name'],
                 'category': barcode.get('category', ''),
                 'weight': barcode.get('weight', ''),
-                'created_at': barcode['created_at'].isoformat(),
+                'created_at': barcode['created_at'],
                 'image_url': f'/api/barcode/{barcode["custom_barcode"]}/image',
                 'download_url': f'/api/barcode/{barcode["custom_barcode"]}/download'
             })
@@ -158,7 +154,7 @@ def get_barcode_details(barcode_id):
     try:
         current_user_id = get_jwt_identity()
         
-        barcode_data = request.app.mongo.db.generated_barcodes.find_one({
+        barcode_data = current_app.mongo.db.generated_barcodes.find_one({
             'custom_barcode': barcode_id,
             'user_id': ObjectId(current_user_id)
         })
@@ -168,12 +164,12 @@ def get_barcode_details(barcode_id):
         
         return jsonify({
             'barcode': {
-                'id': str(barcode_data['_id']),
+                'id': barcode_data['_id'],
                 'custom_barcode': barcode_data['custom_barcode'],
                 'product_name': barcode_data['product_name'],
                 'category': barcode_data.get('category', ''),
                 'weight': barcode_data.get('weight', ''),
-                'created_at': barcode_data['created_at'].isoformat(),
+                'created_at': barcode_data['created_at'],
                 'image_url': f'/api/barcode/{barcode_data["custom_barcode"]}/image',
                 'download_url': f'/api/barcode/{barcode_data["custom_barcode"]}/download'
             }
@@ -188,7 +184,7 @@ def delete_barcode(barcode_id):
     try:
         current_user_id = get_jwt_identity()
         
-        result = request.app.mongo.db.generated_barcodes.delete_one({
+        result = current_app.mongo.db.generated_barcodes.delete_one({
             'custom_barcode': barcode_id,
             'user_id': ObjectId(current_user_id)
         })
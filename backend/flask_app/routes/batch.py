@@ -0,0 +1,122 @@
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required
+from werkzeug.test import EnvironBuilder
+
+batch_bp = Blueprint('batch', __name__)
+
+READ_METHODS = ('GET', 'HEAD')
+
+@batch_bp.route('', methods=['POST'])
+@jwt_required()
+def batch():
+    """Run several API requests in one round trip.
+    
+    Body: {"requests": [{"method": "GET", "path": "/api/inventory", "body": null}, ...]}
+    Runs of consecutive reads are dispatched concurrently; writes run one at a
+    time in order, so a read listed after a write sees its effect.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        sub_requests = data.get('requests')
+        
+        if not isinstance(sub_requests, list) or not sub_requests:
+            return jsonify({'error': 'A non-empty requests list is required'}), 400
+        
+        if len(sub_requests) > current_app.config['BATCH_MAX_REQUESTS']:
+            return jsonify({
+                'error': f"At most {current_app.config['BATCH_MAX_REQUESTS']} requests per batch"
+            }), 400
+        
+        for sub_request in sub_requests:
+            error = validate_sub_request(sub_request)
+            if error:
+                return jsonify({'error': error, 'request': sub_request}), 400
+        
+        app = current_app._get_current_object()
+        headers = {'Authorization': request.headers.get('Authorization', '')}
+        if request.headers.get('X-Read-After'):
+            # Keeps read-your-writes routing for the reads in the batch
+            headers['X-Read-After'] = request.headers['X-Read-After']
+        base = {
+            'headers': headers,
+            'environ_base': {'REMOTE_ADDR': request.remote_addr}
+        }
+        
+        responses = [None] * len(sub_requests)
+        for wave in plan_waves(sub_requests):
+            if len(wave) == 1:
+                index = wave[0]
+                responses[index] = dispatch(app, sub_requests[index], base)
+            else:
+                futures = {
+                    index: app.batch_executor.submit(dispatch, app, sub_requests[index], base)
+                    for index in wave
+                }
+                for index, future in futures.items():
+                    responses[index] = future.result()
+        
+        return jsonify({'responses': responses})
+        
+    except Exception as e:
+        return jsonify({'error': 'Batch request failed', 'details': str(e)}), 500
+
+def validate_sub_request(sub_request):
+    """Return an error message for a malformed sub-request, or None"""
+    if not isinstance(sub_request, dict):
+        return 'Each request must be an object'
+    
+    path = sub_request.get('path')
+    if not isinstance(path, str) or not path.startswith('/api/'):
+        return 'Request path must start with /api/'
+    if path.split('?', 1)[0].rstrip('/') == '/api/batch':
+        return 'Batches cannot be nested'
+    
+    if str(sub_request.get('method', 'GET')).upper() not in ('GET', 'HEAD', 'POST', 'PUT', 'DELETE'):
+        return 'Unsupported method'
+    return None
+
+def plan_waves(sub_requests):
+    """Group request indexes into waves: runs of reads together, each write alone"""
+    waves = []
+    reads = []
+    for index, sub_request in enumerate(sub_requests):
+        if str(sub_request.get('method', 'GET')).upper() in READ_METHODS:
+            reads.append(index)
+            continue
+        if reads:
+            waves.append(reads)
+            reads = []
+        waves.append([index])
+    if reads:
+        waves.append(reads)
+    return waves
+
+def dispatch(app, sub_request, base):
+    """Run one sub-request through the app's normal request handling"""
+    builder = EnvironBuilder(
+        path=sub_request['path'],
+        method=str(sub_request.get('method', 'GET')).upper(),
+        json=sub_request.get('body'),
+        headers=base['headers'],
+        environ_base=base['environ_base']
+    )
+    try:
+        # A fresh app context gives the sub-request its own g; otherwise an
+        # inline sub-request would share (and its hooks consume) the batch's
+        with app.app_context(), app.request_context(builder.get_environ()):
+            # validate_sub_request sees the raw path; /api/%62atch only
+            # decodes to the batch route here
+            if request.endpoint == 'batch.batch':
+                return {'status': 400, 'body': {'error': 'Batches cannot be nested'}}
+            response = app.full_dispatch_request()
+    except Exception as e:
+        return {'status': 500, 'body': {'error': 'Internal server error', 'details': str(e)}}
+    finally:
+        builder.close()
+    
+    if response.is_streamed or not response.is_json:
+        # Files, images and exports need their own request
+        response.close()
+        return {'status': 415, 'body': {'error': 'Only JSON endpoints can be batched'}}
+    
+    return {'status': response.status_code, 'body': response.get_json()}
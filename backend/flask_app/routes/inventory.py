@@ -1,10 +1,22 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 from datetime import datetime, timedelta
+import time
+from inventory_events import consumption_forecast, quantity_event, record_quantity_change, record_quantity_changes
+from inventory_export import CONTENT_TYPES, export_stream, iter_chunks, iter_partitioned_chunks
+from thumbnails import thumbnail_path
+from categories import category_id_for
+from inventory_stream import event_stream
+from routes.products import fetch_open_food_facts_product, record_catalog_write
 
 inventory_bp = Blueprint('inventory', __name__)
 
+# Product fields embedded in inventory items
+INVENTORY_PRODUCT_FIELDS = {'name': 1, 'brand': 1, 'category': 1, 'category_id': 1, 'image_url': 1, 'barcode': 1}
+
 @inventory_bp.route('', methods=['GET'])
 @jwt_required()
 def get_inventory():
@@ -18,57 +30,19 @@ def get_inventory():
         sort_order = 1 if request.args.get('sort_order', 'asc') == 'asc' else -1
         
         # Build query filter
-        query_filter = {'user_id': ObjectId(current_user_id)}
-        
-        if status:
-            query_filter['status'] = status
+        query_filter = build_inventory_filter(current_user_id, status, category)
         
-        if category:
-            query_filter['category'] = category
-        
-        # Get inventory items with product details
-        inventory_items = list(request.app.mongo.db.inventory.aggregate([
-            {'$match': query_filter},
-            {'$lookup': {
-                'from': 'products',
-                'localField': 'product_id',
-                'foreignField': '_id',
-                'as': 'product'
-            }},
-            {'$unwind': '$product'},
-            {'$sort': {sort_by: sort_order}},
-            {'$project': {
-                '_id': 1,
-                'quantity': 1,
-                'expiry_date': 1,
-                'added_date': 1,
-                'location': 1,
-                'notes': 1,
-                'status': 1,
-                'product': {
-                    'id': '$product._id',
-                    'name': '$product.name',
-                    'brand': '$product.brand',
-                    'category': '$product.category',
-                    'image_url': '$product.image_url',
-                    'barcode': '$product.barcode'
-                }
-            }}
-        ]))
+        # Get inventory items with product details, joined from the catalog
+        # snapshot when there is one unless the sort needs product fields
+        join_in_app = current_app.catalog is not None and not sort_by.startswith('product.')
+        inventory_items = list(current_app.mongo.db.inventory.aggregate(
+            build_inventory_pipeline(query_filter, sort={sort_by: sort_order}, join_products=not join_in_app)
+        ))
+        if join_in_app:
+            inventory_items = attach_products(current_app.mongo.db, current_app.catalog, inventory_items)
         
         # Calculate expiry alerts
-        today = datetime.utcnow().date()
-        for item in inventory_items:
-            if item.get('expiry_date'):
-                expiry_date = item['expiry_date'].date()
-                days_remaining = (expiry_date - today).days
-                item['days_remaining'] = days_remaining
-                
-                # Update status based on expiry
-                if days_remaining < 0:
-                    item['status'] = 'expired'
-                elif days_remaining <= 3:
-                    item['status'] = 'expiring_soon'
+        annotate_expiry(inventory_items)
         
         return jsonify({
             'inventory': inventory_items,
@@ -90,7 +64,7 @@ def add_to_inventory():
             return jsonify({'error': 'Product ID and quantity are required'}), 400
         
         # Validate product exists
-        product = request.app.mongo.db.products.find_one({'_id': ObjectId(data['product_id'])})
+        product = current_app.mongo.db.products.find_one({'_id': ObjectId(data['product_id'])})
         if not product:
             return jsonify({'error': 'Product not found'}), 404
         
@@ -110,11 +84,13 @@ def add_to_inventory():
             'added_date': datetime.utcnow(),
             'location': data.get('location', 'pantry'),
             'notes': data.get('notes', ''),
-            'status': 'active'
+            'status': 'active',
+            # Copied from the product so category filters stay on the inventory index
+            'category_id': product.get('category_id')
         }
         
         # Check if item already exists in inventory
-        existing_item = request.app.mongo.db.inventory.find_one({
+        existing_item = current_app.mongo.db.inventory.find_one({
             'user_id': ObjectId(current_user_id),
             'product_id': ObjectId(data['product_id']),
             'status': 'active'
@@ -123,7 +99,7 @@ def add_to_inventory():
         if existing_item:
             # Update quantity if item exists
             new_quantity = existing_item['quantity'] + inventory_item['quantity']
-            request.app.mongo.db.inventory.update_one(
+            current_app.mongo.db.inventory.update_one(
                 {'_id': existing_item['_id']},
                 {'$set': {
                     'quantity': new_quantity,
@@ -135,37 +111,20 @@ def add_to_inventory():
             item_id = existing_item['_id']
         else:
             # Insert new item
-            result = request.app.mongo.db.inventory.insert_one(inventory_item)
+            result = current_app.mongo.db.inventory.insert_one(inventory_item)
             item_id = result.inserted_id
+            new_quantity = inventory_item['quantity']
+        
+        record_quantity_change(
+            current_app.mongo.db, inventory_item['user_id'], inventory_item['product_id'],
+            item_id, inventory_item['quantity'], new_quantity, 'add'
+        )
         
         # Get the updated/inserted item with product details
-        updated_item = request.app.mongo.db.inventory.aggregate([
-            {'$match': {'_id': item_id}},
-            {'$lookup': {
-                'from': 'products',
-                'localField': 'product_id',
-                'foreignField': '_id',
-                'as': 'product'
-            }},
-            {'$unwind': '$product'},
-            {'$project': {
-                '_id': 1,
-                'quantity': 1,
-                'expiry_date': 1,
-                'added_date': 1,
-                'location': 1,
-                'notes': 1,
-                'status': 1,
-                'product': {
-                    'id': '$product._id',
-                    'name': '$product.name',
-                    'brand': '$product.brand',
-                    'category': '$product.category',
-                    'image_url': '$product.image_url',
-                    'barcode': '$product.barcode'
-                }
-            }}
-        ]).next()
+        updated_item = current_app.mongo.db.inventory.aggregate(
+            build_inventory_pipeline({'_id': item_id})
+        ).next()
+        publish_inventory_change(current_user_id, 'add', updated_item)
         
         return jsonify({
             'message': 'Item added to inventory successfully',
@@ -175,6 +134,89 @@ def add_to_inventory():
     except Exception as e:
         return jsonify({'error': 'Failed to add item to inventory', 'details': str(e)}), 500
 
+@inventory_bp.route('/scan', methods=['POST'])
+@jwt_required()
+def scan_to_inventory():
+    """Add scanned barcodes to inventory with as few round trips as possible
+    
+    Body is one scan {"barcode", "quantity", "location", "expiry_date"} or a
+    scanning session burst {"scans": [...]} that is applied as one bulk_write
+    """
+    try:
+        current_user_id = get_jwt_identity()
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+        
+        session = 'scans' in data
+        scans = data['scans'] if session else [data]
+        
+        if not isinstance(scans, list) or not scans:
+            return jsonify({'error': 'At least one scan is required'}), 400
+        
+        if len(scans) > current_app.config['SCAN_SESSION_MAX_SCANS']:
+            return jsonify({
+                'error': f"At most {current_app.config['SCAN_SESSION_MAX_SCANS']} scans per request"
+            }), 400
+        
+        try:
+            scans = [parse_scan(scan) for scan in scans]
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        user_id = ObjectId(current_user_id)
+        barcodes = {scan['barcode'] for scan in scans}
+        if session:
+            # Unknown barcodes beyond the lookup limit or budget come back as
+            # not_found, for the client to look up on its own
+            products = resolve_barcodes(
+                current_app.mongo.db, barcodes,
+                max_lookups=current_app.config['SCAN_SESSION_MAX_LOOKUPS'],
+                budget=current_app.config['SCAN_SESSION_LOOKUP_BUDGET']
+            )
+        else:
+            products = resolve_barcodes(current_app.mongo.db, barcodes)
+        
+        if session:
+            result = apply_scan_session(current_app.mongo.db, user_id, scans, products)
+            for item in result['items']:
+                if item['item_id']:
+                    publish_inventory_change(user_id, 'scan', {
+                        '_id': item['item_id'], 'product_id': item['product_id'], 'quantity': item['quantity']
+                    })
+            return jsonify(result)
+        
+        scan = scans[0]
+        product = products.get(scan['barcode'])
+        if not product:
+            return jsonify({'error': 'Product not found', 'barcode': scan['barcode']}), 404
+        
+        item = current_app.mongo.db.inventory.find_one_and_update(
+            {'user_id': user_id, 'product_id': product['_id'], 'status': 'active'},
+            build_scan_update(dict(scan, category_id=product.get('category_id')), datetime.utcnow()),
+            projection={'quantity': 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        
+        record_quantity_change(
+            current_app.mongo.db, user_id, product['_id'], item['_id'], scan['quantity'], item['quantity'], 'scan'
+        )
+        publish_inventory_change(user_id, 'scan', dict(item, product_id=product['_id']))
+        
+        return jsonify({
+            'barcode': scan['barcode'],
+            'product_id': product['_id'],
+            'name': product.get('name'),
+            'item_id': item['_id'],
+            'quantity': item['quantity'],
+            'added': scan['quantity']
+        })
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to add scanned item', 'details': str(e)}), 500
+
 @inventory_bp.route('/<item_id>', methods=['PUT'])
 @jwt_required()
 def update_inventory_item(item_id):
@@ -195,46 +237,36 @@ def update_inventory_item(item_id):
                         update_data[field] = datetime.fromisoformat(data[field].replace('Z', '+00:00'))
                     except ValueError:
                         return jsonify({'error': 'Invalid expiry date format. Use ISO format.'}), 400
+                elif field == 'quantity':
+                    try:
+                        update_data[field] = float(data[field])
+                    except (TypeError, ValueError):
+                        return jsonify({'error': 'Quantity must be a number'}), 400
                 else:
                     update_data[field] = data[field]
         
         if update_data:
-            result = request.app.mongo.db.inventory.update_one(
+            # Fetch the previous quantity in the same round trip to log the change
+            previous = current_app.mongo.db.inventory.find_one_and_update(
                 {'_id': ObjectId(item_id), 'user_id': ObjectId(current_user_id)},
-                {'$set': update_data}
+                {'$set': update_data},
+                projection={'quantity': 1, 'product_id': 1, 'user_id': 1}
             )
             
-            if result.matched_count == 0:
+            if previous is None:
                 return jsonify({'error': 'Inventory item not found'}), 404
+            
+            if 'quantity' in update_data:
+                record_quantity_change(
+                    current_app.mongo.db, previous['user_id'], previous['product_id'], previous['_id'],
+                    update_data['quantity'] - previous.get('quantity', 0), update_data['quantity'], 'update'
+                )
         
         # Return updated item
-        updated_item = request.app.mongo.db.inventory.aggregate([
-            {'$match': {'_id': ObjectId(item_id)}},
-            {'$lookup': {
-                'from': 'products',
-                'localField': 'product_id',
-                'foreignField': '_id',
-                'as': 'product'
-            }},
-            {'$unwind': '$product'},
-            {'$project': {
-                '_id': 1,
-                'quantity': 1,
-                'expiry_date': 1,
-                'added_date': 1,
-                'location': 1,
-                'notes': 1,
-                'status': 1,
-                'product': {
-                    'id': '$product._id',
-                    'name': '$product.name',
-                    'brand': '$product.brand',
-                    'category': '$product.category',
-                    'image_url': '$product.image_url',
-                    'barcode': '$product.barcode'
-                }
-            }}
-        ]).next()
+        updated_item = current_app.mongo.db.inventory.aggregate(
+            build_inventory_pipeline({'_id': ObjectId(item_id)})
+        ).next()
+        publish_inventory_change(current_user_id, 'update', updated_item)
         
         return jsonify({
             'message': 'Inventory item updated successfully',
@@ -250,19 +282,49 @@ def delete_inventory_item(item_id):
     try:
         current_user_id = get_jwt_identity()
         
-        result = request.app.mongo.db.inventory.delete_one({
-            '_id': ObjectId(item_id),
-            'user_id': ObjectId(current_user_id)
-        })
+        deleted = current_app.mongo.db.inventory.find_one_and_delete(
+            {'_id': ObjectId(item_id), 'user_id': ObjectId(current_user_id)},
+            projection={'quantity': 1, 'product_id': 1, 'user_id': 1}
+        )
         
-        if result.deleted_count == 0:
+        if deleted is None:
             return jsonify({'error': 'Inventory item not found'}), 404
         
+        record_quantity_change(
+            current_app.mongo.db, deleted['user_id'], deleted['product_id'], deleted['_id'],
+            -deleted.get('quantity', 0), 0, 'delete'
+        )
+        publish_inventory_change(current_user_id, 'delete', dict(deleted, quantity=0))
+        
         return jsonify({'message': 'Inventory item deleted successfully'})
         
     except Exception as e:
         return jsonify({'error': 'Failed to delete inventory item', 'details': str(e)}), 500
 
+@inventory_bp.route('/<item_id>/forecast', methods=['GET'])
+@jwt_required()
+def get_item_forecast(item_id):
+    try:
+        current_user_id = get_jwt_identity()
+        days = int(request.args.get('days', 90))
+        
+        item = current_app.mongo.db.inventory.find_one(
+            {'_id': ObjectId(item_id), 'user_id': ObjectId(current_user_id)},
+            {'product_id': 1, 'quantity': 1}
+        )
+        
+        if not item:
+            return jsonify({'error': 'Inventory item not found'}), 404
+        
+        forecast = consumption_forecast(
+            current_app.mongo.db, ObjectId(current_user_id), item['product_id'], item.get('quantity', 0), days=days
+        )
+        
+        return jsonify({'item_id': item['_id'], 'quantity': item.get('quantity', 0), 'forecast': forecast})
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to forecast inventory item', 'details': str(e)}), 500
+
 @inventory_bp.route('/expiring', methods=['GET'])
 @jwt_required()
 def get_expiring_items():
@@ -270,36 +332,9 @@ def get_expiring_items():
         current_user_id = get_jwt_identity()
         days = int(request.args.get('days', 7))
         
-        threshold_date = datetime.utcnow() + timedelta(days=days)
-        
-        expiring_items = list(request.app.mongo.db.inventory.aggregate([
-            {'$match': {
-                'user_id': ObjectId(current_user_id),
-                'status': 'active',
-                'expiry_date': {'$lte': threshold_date, '$gte': datetime.utcnow()}
-            }},
-            {'$lookup': {
-                'from': 'products',
-                'localField': 'product_id',
-                'foreignField': '_id',
-                'as': 'product'
-            }},
-            {'$unwind': '$product'},
-            {'$sort': {'expiry_date': 1}},
-            {'$project': {
-                '_id': 1,
-                'quantity': 1,
-                'expiry_date': 1,
-                'location': 1,
-                'product': {
-                    'id': '$product._id',
-                    'name': '$product.name',
-                    'brand': '$product.brand',
-                    'category': '$product.category',
-                    'image_url': '$product.image_url'
-                }
-            }}
-        ]))
+        expiring_items = list(current_app.mongo.db.inventory.aggregate(
+            build_expiring_pipeline(current_user_id, days)
+        ))
         
         return jsonify({
             'expiring_items': expiring_items,
@@ -310,6 +345,405 @@ def get_expiring_items():
     except Exception as e:
         return jsonify({'error': 'Failed to fetch expiring items', 'details': str(e)}), 500
 
+@inventory_bp.route('/restock', methods=['GET'])
+@jwt_required()
+def get_restock_suggestions():
+    """Restock suggestions precomputed by the nightly restock_forecast job"""
+    try:
+        current_user_id = get_jwt_identity()
+        
+        suggestions = list(current_app.mongo.db.restock_suggestions.find(
+            {'user_id': ObjectId(current_user_id), 'restock': True},
+            {'run_id': 0}
+        ).sort('run_out_date', 1))
+        
+        return jsonify({
+            'suggestions': suggestions,
+            'count': len(suggestions),
+            'generated_at': suggestions[0]['generated_at'] if suggestions else None
+        })
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to fetch restock suggestions', 'details': str(e)}), 500
+
+@inventory_bp.route('/stream', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def stream_inventory_changes():
+    """Server-Sent Events feed of the user's inventory changes
+    
+    EventSource cannot send headers, so the token may also be passed as ?jwt=.
+    Reconnects resume after the Last-Event-ID header (or ?last_event_id=).
+    """
+    try:
+        current_user_id = get_jwt_identity()
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        
+        stream = event_stream(
+            current_app.inventory_hub, current_user_id, last_event_id,
+            heartbeat=current_app.config['INVENTORY_STREAM_HEARTBEAT']
+        )
+        
+        return Response(
+            stream_with_context(stream),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to open inventory stream', 'details': str(e)}), 500
+
+@inventory_bp.route('/export', methods=['GET'])
+@jwt_required()
+def export_inventory():
+    try:
+        current_user_id = get_jwt_identity()
+        export_format = request.args.get('format', 'csv')
+        status = request.args.get('status')
+        
+        if export_format not in CONTENT_TYPES:
+            return jsonify({'error': 'Unsupported format. Use csv or parquet.'}), 400
+        
+        if export_format == 'parquet':
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                return jsonify({'error': 'Parquet export is not available on this server'}), 501
+        
+        db = current_app.mongo.db
+        
+        if request.args.get('scope') == 'all':
+            # Admin export of every user's inventory, read in parallel partitions
+            user = db.users.find_one({'_id': ObjectId(current_user_id)}, {'role': 1})
+            if not user or user.get('role') != 'admin':
+                return jsonify({'error': 'Admin access required'}), 403
+            
+            query_filter = {'status': status} if status else {}
+            chunks = iter_partitioned_chunks(db, query_filter, current_app.config['EXPORT_PARTITIONS'])
+            filename = f'inventory-all.{export_format}'
+        else:
+            chunks = iter_chunks(db, build_inventory_filter(current_user_id, status))
+            filename = f'inventory.{export_format}'
+        
+        return Response(
+            stream_with_context(export_stream(chunks, export_format)),
+            mimetype=CONTENT_TYPES[export_format],
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
+        )
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to export inventory', 'details': str(e)}), 500
+
+def publish_inventory_change(user_id, action, item):
+    """Push a change to the user's open inventory streams"""
+    current_app.inventory_hub.publish(user_id, {
+        'action': action,
+        # Sent back as X-Read-After so the refetch is not served by a lagging secondary
+        'written_at': round(time.time(), 3),
+        'item_id': item['_id'],
+        'product_id': item['product_id'],
+        'quantity': item.get('quantity'),
+        'item': item if action in ('add', 'update') else None
+    })
+
+def parse_scan(scan):
+    """Validate one scan and fill in defaults; raises ValueError"""
+    if not isinstance(scan, dict) or not str(scan.get('barcode') or '').strip():
+        raise ValueError('Each scan needs a barcode')
+    
+    try:
+        quantity = float(scan.get('quantity', 1))
+    except (TypeError, ValueError):
+        raise ValueError('Quantity must be a number')
+    if quantity <= 0:
+        raise ValueError('Quantity must be positive')
+    
+    expiry_date = None
+    if scan.get('expiry_date'):
+        try:
+            expiry_date = datetime.fromisoformat(scan['expiry_date'].replace('Z', '+00:00'))
+        except (AttributeError, ValueError):
+            raise ValueError('Invalid expiry date format. Use ISO format.')
+    
+    return {
+        'barcode': str(scan['barcode']).strip(),
+        'quantity': quantity,
+        'location': scan.get('location', 'pantry'),
+        'expiry_date': expiry_date
+    }
+
+def lookup_open_food_facts(app, barcode, timeout):
+    """fetch_open_food_facts_product for a lookup_executor thread; None on failure"""
+    import requests
+    
+    with app.app_context():
+        try:
+            return fetch_open_food_facts_product(barcode, timeout=timeout)
+        except requests.exceptions.RequestException:
+            return None
+
+def resolve_barcodes(db, barcodes, max_lookups=None, budget=10.0):
+    """Map barcodes to products with one $in query, falling back to Open Food Facts
+    
+    At most max_lookups unknown barcodes are looked up, concurrently on
+    app.lookup_executor and within budget seconds in total; the others are
+    left out of the result
+    """
+    products = {}
+    if current_app.catalog:
+        for barcode in barcodes:
+            cached = current_app.catalog.by_barcode(barcode)
+            if cached:
+                products[barcode] = {
+                    '_id': cached['id'], 'barcode': barcode, 'name': cached['name'], 'category_id': cached.get('category_id')
+                }
+    
+    missing = barcodes - products.keys()
+    if missing:
+        products.update(
+            (product['barcode'], product)
+            for product in db.products.find({'barcode': {'$in': list(missing)}}, {'barcode': 1, 'name': 1, 'category_id': 1})
+        )
+    
+    unknown = sorted(barcodes - products.keys())[:max_lookups]
+    if not unknown:
+        return products
+    
+    app = current_app._get_current_object()
+    deadline = time.monotonic() + budget
+    lookups = {
+        barcode: app.lookup_executor.submit(lookup_open_food_facts, app, barcode, budget)
+        for barcode in unknown
+    }
+    for barcode, lookup in lookups.items():
+        try:
+            product_data = lookup.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FuturesTimeoutError:
+            # Queued lookups are dropped; running ones end within their own timeout
+            lookup.cancel()
+            continue
+        
+        if product_data:
+            # The scanned barcode is the key, even if OFF normalizes it differently
+            product_data.pop('barcode', None)
+            product = db.products.find_one_and_update(
+                {'barcode': barcode},
+                {'$setOnInsert': product_data},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            record_catalog_write(product)
+            products[barcode] = product
+    return products
+
+def build_scan_update(scan, now):
+    """Upsert update that adds a scan to the user's active item for the product"""
+    update = {
+        '$inc': {'quantity': scan['quantity']},
+        '$setOnInsert': {
+            'added_date': now, 'location': scan['location'], 'notes': '', 'category_id': scan.get('category_id')
+        }
+    }
+    if scan['expiry_date']:
+        update['$set'] = {'expiry_date': scan['expiry_date']}
+    else:
+        update['$setOnInsert']['expiry_date'] = None
+    return update
+
+def apply_scan_session(db, user_id, scans, products):
+    """Apply a burst of scans as one bulk_write, one upsert per product"""
+    now = datetime.utcnow()
+    not_found = []
+    merged = {}
+    
+    for scan in scans:
+        product = products.get(scan['barcode'])
+        if not product:
+            not_found.append(scan['barcode'])
+            continue
+        
+        pending = merged.get(product['_id'])
+        if pending:
+            pending['quantity'] += scan['quantity']
+            pending['location'] = scan['location']
+            pending['expiry_date'] = scan['expiry_date'] or pending['expiry_date']
+        else:
+            merged[product['_id']] = dict(scan, name=product.get('name'), category_id=product.get('category_id'))
+    
+    items = {}
+    if merged:
+        db.inventory.bulk_write([
+            UpdateOne(
+                {'user_id': user_id, 'product_id': product_id, 'status': 'active'},
+                build_scan_update(scan, now),
+                upsert=True
+            )
+            for product_id, scan in merged.items()
+        ], ordered=False)
+        
+        items = {
+            item['product_id']: item
+            for item in db.inventory.find(
+                {'user_id': user_id, 'product_id': {'$in': list(merged)}, 'status': 'active'},
+                {'product_id': 1, 'quantity': 1}
+            )
+        }
+        
+        record_quantity_changes(db, [
+            quantity_event(user_id, product_id, items[product_id]['_id'], scan['quantity'],
+                           items[product_id]['quantity'], 'scan', now)
+            for product_id, scan in merged.items() if product_id in items
+        ])
+    
+    return {
+        'scanned': len(scans),
+        'applied': len(merged),
+        'not_found': not_found,
+        'items': [
+            {
+                'barcode': scan['barcode'],
+                'product_id': product_id,
+                'name': scan['name'],
+                'item_id': items.get(product_id, {}).get('_id'),
+                'quantity': items.get(product_id, {}).get('quantity'),
+                'added': scan['quantity']
+            }
+            for product_id, scan in merged.items()
+        ]
+    }
+
+def build_inventory_filter(user_id, status=None, category=None):
+    """Build the inventory query filter for a user"""
+    query_filter = {'user_id': ObjectId(user_id)}
+    
+    if status:
+        query_filter['status'] = status
+    
+    if category:
+        # Accepts a category id or its display name; inventory items carry category_id
+        query_filter['category_id'] = category_id_for(category) or category
+    
+    return query_filter
+
+def build_inventory_pipeline(query_filter, sort=None, join_products=True):
+    """Aggregation pipeline returning inventory items joined with product details
+    
+    With join_products=False items keep product_id instead, for attach_products
+    """
+    pipeline = [{'$match': query_filter}]
+    
+    if join_products:
+        pipeline.extend([
+            {'$lookup': {
+                'from': 'products',
+                'localField': 'product_id',
+                'foreignField': '_id',
+                'as': 'product'
+            }},
+            {'$unwind': '$product'}
+        ])
+    
+    if sort:
+        pipeline.append({'$sort': sort})
+    
+    projection = {
+        '_id': 1,
+        'quantity': 1,
+        'expiry_date': 1,
+        'added_date': 1,
+        'location': 1,
+        'notes': 1,
+        'status': 1
+    }
+    if join_products:
+        projection['product'] = {
+            'id': '$product._id',
+            'name': '$product.name',
+            'brand': '$product.brand',
+            'category': '$product.category',
+            'category_id': '$product.category_id',
+            'image_url': '$product.image_url',
+            'barcode': '$product.barcode'
+        }
+    else:
+        projection['product_id'] = 1
+    pipeline.append({'$project': projection})
+    return pipeline
+
+def attach_products(db, catalog, inventory_items):
+    """Join product details from the catalog snapshot, asking MongoDB only for misses
+    
+    Items whose product no longer exists are dropped, as $unwind would
+    """
+    product_ids = {item['product_id'] for item in inventory_items}
+    products = catalog.by_ids(product_ids)
+    
+    missing = product_ids - products.keys()
+    if missing:
+        for product in db.products.find({'_id': {'$in': list(missing)}}, INVENTORY_PRODUCT_FIELDS):
+            products[product['_id']] = dict(product, id=product['_id'])
+    
+    joined = []
+    for item in inventory_items:
+        product = products.get(item.pop('product_id'))
+        if product is not None:
+            item['product'] = {field: product.get(field) for field in ('id',) + tuple(INVENTORY_PRODUCT_FIELDS)}
+            joined.append(item)
+    return joined
+
+def build_expiring_pipeline(user_id, days):
+    """Aggregation pipeline for active items expiring within the next days"""
+    now = datetime.utcnow()
+    threshold_date = now + timedelta(days=days)
+    
+    return [
+        {'$match': {
+            'user_id': ObjectId(user_id),
+            'status': 'active',
+            'expiry_date': {'$lte': threshold_date, '$gte': now}
+        }},
+        {'$lookup': {
+            'from': 'products',
+            'localField': 'product_id',
+            'foreignField': '_id',
+            'as': 'product'
+        }},
+        {'$unwind': '$product'},
+        {'$sort': {'expiry_date': 1}},
+        {'$project': {
+            '_id': 1,
+            'quantity': 1,
+            'expiry_date': 1,
+            'location': 1,
+            'product': {
+                'id': '$product._id',
+                'name': '$product.name',
+                'brand': '$product.brand',
+                'category': '$product.category',
+                'image_url': '$product.image_url'
+            }
+        }}
+    ]
+
+def annotate_expiry(inventory_items):
+    """Add days_remaining, expiry status and product thumbnail_url to inventory items in place"""
+    today = datetime.utcnow().date()
+    for item in inventory_items:
+        product = item.get('product')
+        if product:
+            product['thumbnail_url'] = thumbnail_path(product.get('id'), product.get('image_url'))
+        
+        if item.get('expiry_date'):
+            expiry_date = item['expiry_date'].date()
+            days_remaining = (expiry_date - today).days
+            item['days_remaining'] = days_remaining
+            
+            # Update status based on expiry
+            if days_remaining < 0:
+                item['status'] = 'expired'
+            elif days_remaining <= 3:
+                item['status'] = 'expiring_soon'
+    return inventory_items
+
 def get_inventory_summary(inventory_items):
     """Generate inventory summary statistics"""
     total_items = len(inventory_items)
@@ -1,8 +1,13 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, Response
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from bson import ObjectId
-import requests
 from datetime import datetime
+from metrics import upstream_timer
+from catalog_bundle import CONTENT_TYPE as BUNDLE_CONTENT_TYPE, bundle_for
+from categories import category_fields, category_id_for
+from product_dedup import find_similar, similarity_fields
+from read_routing import PRIMARY
+from thumbnails import DEFAULT_SIZE, THUMBNAIL_SIZES, CONTENT_TYPE, ThumbnailError, ThumbnailTimeout, image_version, thumbnail_path
 
 products_bp = Blueprint('products', __name__)
 
@@ -28,37 +33,49 @@ def search_products():
 
 def search_by_barcode(barcode):
     """Search for product by barcode"""
-    # First check local database
-    product = request.app.mongo.db.products.find_one({'barcode': barcode})
+    # Shared catalog snapshot first, when one is configured
+    if current_app.catalog:
+        cached = current_app.catalog.by_barcode(barcode)
+        if cached:
+            current_app.write_behind.inc('products', cached['id'], {'lookup_count': 1})
+            return jsonify({
+                'found': True,
+                'source': 'local',
+                'product': cached
+            })
+    
+    # Then check local database
+    product = current_app.mongo.db.products.find_one({'barcode': barcode})
+    
+    # A secondary may not have a product another user just added
+    if not product and current_app.mongo.consistency() != PRIMARY:
+        product = current_app.mongo.primary.products.find_one({'barcode': barcode})
     
     if product:
+        current_app.write_behind.inc('products', product['_id'], {'lookup_count': 1})
         return jsonify({
             'found': True,
             'source': 'local',
             'product': format_product(product)
         })
     
-    # If not found locally, query Open Food Facts
+    # If not found locally, query Open Food Facts (requests is only imported
+    # on the first miss)
+    import requests
+    
     try:
-        response = requests.get(
-            f'{request.app.config["OPEN_FOOD_FACTS_API_URL"]}/product/{barcode}.json',
-            timeout=10
-        )
+        product_data = fetch_open_food_facts_product(barcode)
         
-        if response.status_code == 200:
-            data = response.json()
+        if product_data:
+            # Save to local database for future use
+            current_app.mongo.db.products.insert_one(product_data)
+            record_catalog_write(product_data)
             
-            if data.get('status') == 1 and data.get('product'):
-                product_data = normalize_open_food_facts_product(data['product'])
-                
-                # Save to local database for future use
-                request.app.mongo.db.products.insert_one(product_data)
-                
-                return jsonify({
-                    'found': True,
-                    'source': 'open_food_facts',
-                    'product': format_product(product_data)
-                })
+            return jsonify({
+                'found': True,
+                'source': 'open_food_facts',
+                'product': format_product(product_data)
+            })
         
         return jsonify({
             'found': False,
@@ -68,16 +85,25 @@ def search_by_barcode(barcode):
     except requests.exceptions.RequestException as e:
         return jsonify({'error': 'Failed to query Open Food Facts API', 'details': str(e)}), 500
 
+def fetch_open_food_facts_product(barcode, timeout=10):
+    """Look a barcode up on Open Food Facts; returns a normalized product or None"""
+    import requests
+    
+    with upstream_timer('open_food_facts') as timer:
+        response = requests.get(
+            open_food_facts_product_url(current_app.config['OPEN_FOOD_FACTS_API_URL'], barcode),
+            timeout=timeout
+        )
+        timer.outcome = response.status_code
+    
+    if response.status_code == 200:
+        return parse_open_food_facts_response(response.json())
+    return None
+
 def search_by_query(query):
     """Search for products by text query"""
     # Search in local database
-    products = list(request.app.mongo.db.products.find({
-        '$or': [
-            {'name': {'$regex': query, '$options': 'i'}},
-            {'brand': {'$regex': query, '$options': 'i'}},
-            {'category': {'$regex': query, '$options': 'i'}}
-        ]
-    }).limit(20))
+    products = list(current_app.mongo.db.products.find(build_search_filter(query)).limit(20))
     
     return jsonify({
         'found': len(products) > 0,
@@ -94,8 +120,11 @@ def create_product():
         if not data or not data.get('name'):
             return jsonify({'error': 'Product name is required'}), 400
         
+        # Custom products have no barcode, so near-duplicates are only caught by name
+        custom = not data.get('barcode')
+        
         # Generate a unique ID for custom products
-        if not data.get('barcode'):
+        if custom:
             import hashlib
             import time
             data['barcode'] = hashlib.md5(
@@ -106,7 +135,7 @@ def create_product():
             'barcode': data.get('barcode'),
             'name': data['name'].strip(),
             'brand': data.get('brand', '').strip(),
-            'category': data.get('category', 'Uncategorized').strip(),
+            'category_source': data.get('category', '').strip(),
             'image_url': data.get('image_url'),
             'quantity': data.get('quantity', ''),
             'nutritional_info': data.get('nutritional_info', {}),
@@ -114,16 +143,31 @@ def create_product():
             'updated_at': datetime.utcnow(),
             'created_by': get_jwt_identity()
         }
+        if custom:
+            # Lets product_dedup tell made-up codes from real 12-digit UPCs
+            product_data['barcode_generated'] = True
+        product_data.update(category_fields(product_data['category_source'], product_data['name']))
+        product_data.update(similarity_fields(product_data['name'], product_data['brand'], product_data['quantity']))
+        
+        if custom and not data.get('allow_duplicate'):
+            similar = find_similar(current_app.mongo.db, product_data)
+            if similar:
+                return jsonify({
+                    'error': 'Similar products already exist',
+                    'suggestions': [dict(format_product(product), similarity=score) for product, score in similar],
+                    'hint': 'Use one of the suggestions, or resend with allow_duplicate: true'
+                }), 409
         
         # Check if product with same barcode already exists
-        existing_product = request.app.mongo.db.products.find_one({'barcode': product_data['barcode']})
+        existing_product = current_app.mongo.db.products.find_one({'barcode': product_data['barcode']})
         if existing_product:
             return jsonify({
                 'error': 'Product with this barcode already exists',
                 'product': format_product(existing_product)
             }), 409
         
-        result = request.app.mongo.db.products.insert_one(product_data)
+        result = current_app.mongo.db.products.insert_one(product_data)
+        record_catalog_write(product_data)
         
         return jsonify({
             'message': 'Product created successfully',
@@ -133,11 +177,63 @@ def create_product():
     except Exception as e:
         return jsonify({'error': 'Failed to create product', 'details': str(e)}), 500
 
+@products_bp.route('/similar', methods=['GET'])
+@jwt_required()
+def get_similar_products():
+    """Existing products that look like ?name=&brand=&quantity=, for suggestions while typing"""
+    try:
+        name = request.args.get('name', '').strip()
+        
+        if not name:
+            return jsonify({'error': 'Name is required'}), 400
+        
+        similar = find_similar(current_app.mongo.db, {
+            'name': name,
+            'brand': request.args.get('brand', ''),
+            'quantity': request.args.get('quantity', '')
+        })
+        
+        return jsonify({
+            'products': [dict(format_product(product), similarity=score) for product, score in similar],
+            'count': len(similar)
+        })
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to find similar products', 'details': str(e)}), 500
+
+@products_bp.route('/catalog', methods=['GET'])
+@jwt_required()
+def get_catalog_bundle():
+    """Offline barcode catalog: the full bundle, or a delta from since_version"""
+    try:
+        since_version = request.args.get('since_version', 0, type=int)
+        version, payload = bundle_for(current_app.mongo.db, since_version)
+
+        if version is None:
+            return jsonify({'error': 'No catalog bundle has been built yet'}), 404
+
+        if payload is None:
+            response = Response(status=204)
+        else:
+            response = Response(payload, mimetype=BUNDLE_CONTENT_TYPE)
+            response.set_etag(f'{since_version}-{version}')
+        response.headers['X-Catalog-Version'] = str(version)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
+
+    except Exception as e:
+        return jsonify({'error': 'Failed to fetch catalog bundle', 'details': str(e)}), 500
+
 @products_bp.route('/<product_id>', methods=['GET'])
 @jwt_required()
 def get_product(product_id):
     try:
-        product = request.app.mongo.db.products.find_one({'_id': ObjectId(product_id)})
+        if current_app.catalog:
+            cached = current_app.catalog.by_id(product_id)
+            if cached:
+                return jsonify({'product': cached})
+        
+        product = current_app.mongo.db.products.find_one({'_id': ObjectId(product_id)})
         
         if not product:
             return jsonify({'error': 'Product not found'}), 404
@@ -147,6 +243,41 @@ def get_product(product_id):
     except Exception as e:
         return jsonify({'error': 'Failed to fetch product', 'details': str(e)}), 500
 
+@products_bp.route('/<product_id>/thumbnail', methods=['GET'])
+def get_product_thumbnail(product_id):
+    """Resized product image; public so it can be used directly in <img> tags"""
+    try:
+        size = int(request.args.get('size', DEFAULT_SIZE))
+        if size not in THUMBNAIL_SIZES:
+            return jsonify({'error': f'Size must be one of {list(THUMBNAIL_SIZES)}'}), 400
+        
+        product = current_app.mongo.db.products.find_one({'_id': ObjectId(product_id)}, {'image_url': 1})
+        
+        if not product or not product.get('image_url'):
+            return jsonify({'error': 'Product image not found'}), 404
+        
+        data = current_app.thumbnails.get(product['image_url'], size)
+        
+        response = Response(data, mimetype=CONTENT_TYPE)
+        version = image_version(product['image_url'])
+        response.set_etag(f'{version}-{size}')
+        if request.args.get('v') == version:
+            # Versioned URLs change whenever image_url does
+            response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        else:
+            response.headers['Cache-Control'] = 'public, max-age=3600'
+        return response.make_conditional(request)
+        
+    except ThumbnailTimeout as e:
+        current_app.logger.warning('Thumbnail for product %s timed out: %s', product_id, e)
+        return jsonify({'error': 'Product image took too long to load'}), 504
+    except ThumbnailError as e:
+        # The reason may describe hosts the caller should not learn about
+        current_app.logger.warning('Thumbnail for product %s failed: %s', product_id, e)
+        return jsonify({'error': 'Failed to load product image'}), 502
+    except Exception as e:
+        return jsonify({'error': 'Failed to fetch thumbnail', 'details': str(e)}), 500
+
 @products_bp.route('/<product_id>', methods=['PUT'])
 @jwt_required()
 def update_product(product_id):
@@ -164,19 +295,36 @@ def update_product(product_id):
             if field in data:
                 update_data[field] = data[field]
         
+        if 'category' in update_data:
+            # Keep the text as entered; category itself is the canonical name
+            update_data['category_source'] = update_data['category']
+            update_data.update(category_fields(update_data['category'], update_data.get('name')))
+        
         if update_data:
             update_data['updated_at'] = datetime.utcnow()
             
-            result = request.app.mongo.db.products.update_one(
+            result = current_app.mongo.db.products.update_one(
                 {'_id': ObjectId(product_id)},
                 {'$set': update_data}
             )
             
             if result.matched_count == 0:
                 return jsonify({'error': 'Product not found'}), 404
+            
+            if 'category_id' in update_data:
+                # Inventory items carry a copy for the category filter
+                current_app.mongo.db.inventory.update_many(
+                    {'product_id': ObjectId(product_id)},
+                    {'$set': {'category_id': update_data['category_id']}}
+                )
         
         # Return updated product
-        product = request.app.mongo.db.products.find_one({'_id': ObjectId(product_id)})
+        product = current_app.mongo.db.products.find_one({'_id': ObjectId(product_id)})
+        if update_data and product:
+            if {'name', 'brand', 'quantity'} & update_data.keys():
+                fields = similarity_fields(product.get('name'), product.get('brand'), product.get('quantity'))
+                current_app.mongo.db.products.update_one({'_id': product['_id']}, {'$set': fields})
+            record_catalog_write(product)
         return jsonify({
             'message': 'Product updated successfully',
             'product': format_product(product)
@@ -189,11 +337,15 @@ def update_product(product_id):
 @jwt_required()
 def delete_product(product_id):
     try:
-        result = request.app.mongo.db.products.delete_one({'_id': ObjectId(product_id)})
+        deleted = current_app.mongo.db.products.find_one_and_delete(
+            {'_id': ObjectId(product_id)}, projection={'barcode': 1}
+        )
         
-        if result.deleted_count == 0:
+        if deleted is None:
             return jsonify({'error': 'Product not found'}), 404
         
+        record_catalog_write(deleted, deleted=True)
+        
         return jsonify({'message': 'Product deleted successfully'})
         
     except Exception as e:
@@ -203,19 +355,46 @@ def delete_product(product_id):
 @jwt_required()
 def get_categories():
     try:
-        categories = list(request.app.mongo.db.categories.find({}, {'_id': 0}))
+        categories = list(current_app.mongo.db.categories.find({}, {'_id': 0}))
         return jsonify({'categories': categories})
         
     except Exception as e:
         return jsonify({'error': 'Failed to fetch categories', 'details': str(e)}), 500
 
+def build_search_filter(query):
+    """Build the case-insensitive product text search filter"""
+    clauses = [
+        {'name': {'$regex': query, '$options': 'i'}},
+        {'brand': {'$regex': query, '$options': 'i'}}
+    ]
+    # A canonical category name or id is an exact category_id match
+    category_id = category_id_for(query)
+    if category_id:
+        clauses.append({'category_id': category_id})
+    return {'$or': clauses}
+
+def open_food_facts_product_url(api_url, barcode):
+    """Open Food Facts product lookup URL for a barcode"""
+    return f'{api_url}/product/{barcode}.json'
+
+def parse_open_food_facts_response(data):
+    """Return a normalized product from an OFF response body, or None if not found"""
+    if data.get('status') == 1 and data.get('product'):
+        return normalize_open_food_facts_product(data['product'])
+    return None
+
 def normalize_open_food_facts_product(product_data):
     """Normalize Open Food Facts product data"""
+    name = product_data.get('product_name', 'Unknown Product').strip()
+    brand = product_data.get('brands', 'Unknown Brand').strip()
+    categories = product_data.get('categories', '').strip()
     return {
         'barcode': product_data.get('code', ''),
-        'name': product_data.get('product_name', 'Unknown Product').strip(),
-        'brand': product_data.get('brands', 'Unknown Brand').strip(),
-        'category': product_data.get('categories', 'Uncategorized').strip(),
+        'name': name,
+        'brand': brand,
+        **category_fields(categories, name),
+        **similarity_fields(name, brand, product_data.get('quantity', '')),
+        'category_source': categories,
         'image_url': product_data.get('image_url'),
         'quantity': product_data.get('quantity', ''),
         'nutritional_info': product_data.get('nutriments', {}),
@@ -224,18 +403,25 @@ def normalize_open_food_facts_product(product_data):
         'source': 'open_food_facts'
     }
 
+def record_catalog_write(product, deleted=False):
+    """Put a product write on the catalog snapshot overlay, if a snapshot is configured"""
+    if current_app.catalog:
+        current_app.catalog.record_write(product, deleted=deleted)
+
 def format_product(product):
     """Format product data for response"""
     return {
-        'id': str(product['_id']),
+        'id': product['_id'],
         'barcode': product.get('barcode', ''),
         'name': product.get('name', ''),
         'brand': product.get('brand', ''),
         'category': product.get('category', ''),
+        'category_id': product.get('category_id'),
         'image_url': product.get('image_url'),
+        'thumbnail_url': thumbnail_path(product.get('_id'), product.get('image_url')),
         'quantity': product.get('quantity', ''),
         'nutritional_info': product.get('nutritional_info', {}),
-        'created_at': product.get('created_at', '').isoformat() if product.get('created_at') else None,
-        'updated_at': product.get('updated_at', '').isoformat() if product.get('updated_at') else None,
+        'created_at': product.get('created_at'),
+        'updated_at': product.get('updated_at'),
         'source': product.get('source', 'local')
     }
\ No newline at end of file
@@ -0,0 +1,126 @@
+"""Production server: gunicorn with the app preloaded and warmed before fork.
+
+    python server.py --workers 4 --threads 8 --bind 0.0.0.0:5000
+
+The master builds the app once with create_app(preload=True). It then loads
+everything that is read-only after startup: modules otherwise imported on
+first use, the mmap'd catalog snapshot (the hot product index), and the URL
+matcher, JSON provider and request hooks, warmed by a request that does not
+touch MongoDB. The categories automaton is compiled at import.
+
+The collector is disabled while this happens. gc.freeze() runs right before
+the workers are forked, and each worker re-enables the collector. Collections
+in a worker then never write to those objects, so their pages stay shared
+copy-on-write instead of being copied into every worker.
+
+MongoDB is never contacted in the master, so no sockets or monitor threads
+exist at fork. Each worker opens its own pool after fork. The connection
+starts in the background so the first request usually finds it ready. The
+first worker also runs the index build that create_app skips when
+preloading.
+
+Inventory streams (GET /api/inventory/stream) see writes from every worker.
+Each worker tails the shared inventory_changes log with a thread it starts on
+first use (see inventory_stream.py), so nothing is tailed in the master.
+Every open stream occupies one gthread thread until the client disconnects:
+with the defaults (4 workers x 8 threads) about 32 open dashboards leave no
+thread for API requests, so raise --threads with the number of dashboards.
+"""
+import argparse
+import gc
+import logging
+import os
+import threading
+import time
+
+from gunicorn.app.base import BaseApplication
+from pymongo.errors import PyMongoError
+
+from app import create_app
+from indexes import start_index_build
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up(app):
+    """Build in the master what every worker would otherwise build on its first requests"""
+    started = time.perf_counter()
+
+    # Imported lazily by the routes; shared by every worker once loaded here
+    import requests  # noqa: F401
+    from barcode.writer import ImageWriter  # noqa: F401
+    from PIL import Image, JpegImagePlugin, PngImagePlugin  # noqa: F401
+    from product_dedup import hash_family
+    hash_family()
+
+    products = app.catalog.warm() if app.catalog else 0
+
+    with app.test_client() as client:
+        client.get('/api/health')
+
+    logger.info('Warmed app in %.0f ms (%d catalog products)', (time.perf_counter() - started) * 1000, products)
+
+
+def open_pool(app):
+    """Connect this worker's MongoDB pool without holding up the worker"""
+    def connect():
+        try:
+            app.mongo.cx.admin.command('ping')
+        except PyMongoError:
+            logger.exception('Worker %d could not reach MongoDB yet', os.getpid())
+
+    threading.Thread(target=connect, name='mongo-connect', daemon=True).start()
+
+
+class PreforkServer(BaseApplication):
+    def __init__(self, options):
+        self.options = options
+        gc.disable()
+        self.application = create_app(preload=True)
+        warm_up(self.application)
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+        self.cfg.set('preload_app', True)
+        self.cfg.set('pre_fork', self.pre_fork)
+        self.cfg.set('post_fork', self.post_fork)
+
+    def load(self):
+        return self.application
+
+    def pre_fork(self, server, worker):
+        # Everything allocated so far is moved out of the collector's reach
+        gc.freeze()
+
+    def post_fork(self, server, worker):
+        gc.enable()
+        app = self.application
+        app.inventory_hub.after_fork()
+        open_pool(app)
+        if worker.age == 1 and app.config['ENSURE_INDEXES']:
+            start_index_build(app.mongo.db)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the Flask app under gunicorn with pre-fork warmup')
+    parser.add_argument('--bind', default=f"0.0.0.0:{os.getenv('PORT', '5000')}")
+    parser.add_argument('--workers', type=int, default=int(os.getenv('WEB_WORKERS', '4')))
+    parser.add_argument('--threads', type=int, default=int(os.getenv('WEB_THREADS', '8')))
+    parser.add_argument('--timeout', type=int, default=int(os.getenv('WEB_TIMEOUT', '30')))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    PreforkServer({
+        'bind': args.bind,
+        'workers': args.workers,
+        # Threads keep long-lived inventory streams from tying up a worker
+        'worker_class': 'gthread',
+        'threads': args.threads,
+        'timeout': args.timeout,
+    }).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+import pytest
+from flask_jwt_extended import create_access_token
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv('ENSURE_INDEXES', 'false')
+    from app import create_app
+
+    app = create_app()
+    app.testing = True
+    with app.app_context():
+        token = create_access_token(identity='507f1f77bcf86cd799439011')
+    client = app.test_client()
+    client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+    return client
+
+
+def test_sub_requests_run_through_the_app(client):
+    response = client.post('/api/batch', json={'requests': [
+        {'method': 'GET', 'path': '/api/health'},
+        {'method': 'GET', 'path': '/api/nowhere'},
+    ]})
+    assert response.status_code == 200
+    health, missing = response.get_json()['responses']
+    assert health['status'] == 200 and health['body']['status'] == 'healthy'
+    assert missing['status'] == 404
+
+
+@pytest.mark.parametrize('path', ['/api/batch', '/api/batch/', '/api/batch?x=1'])
+def test_nested_batches_are_rejected_up_front(client, path):
+    response = client.post('/api/batch', json={'requests': [{'method': 'POST', 'path': path}]})
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Batches cannot be nested'
+
+
+@pytest.mark.parametrize('path', ['/api/%62atch', '/api/%62%61%74%63%68', '/api/%62atch?x=1'])
+def test_nested_batches_behind_encoded_paths_are_rejected(client, path):
+    nested = {'requests': [{'method': 'GET', 'path': '/api/health'}]}
+    response = client.post('/api/batch', json={'requests': [{'method': 'POST', 'path': path, 'body': nested}]})
+    assert response.status_code == 200
+    assert response.get_json()['responses'] == [{'status': 400, 'body': {'error': 'Batches cannot be nested'}}]
@@ -0,0 +1,155 @@
+import pytest
+from bson import ObjectId
+
+import catalog_bundle
+from catalog_bundle import BUNDLE_FIELDS, bundle_for, build_bundle, decode, encode, make_delta
+
+
+def record(barcode, name):
+    return [str(ObjectId()), barcode, name, 'Brand', 'Dairy & Eggs', 'dairy-eggs', '1 L', None]
+
+
+def apply_delta(records, delta):
+    """What a client does with a delta"""
+    by_barcode = {entry[1]: entry for entry in records}
+    for entry in delta['upsert']:
+        by_barcode[entry[1]] = entry
+    for barcode in delta['remove']:
+        by_barcode.pop(barcode, None)
+    return sorted(by_barcode.values(), key=lambda entry: entry[1])
+
+
+@pytest.fixture(autouse=True)
+def empty_delta_cache():
+    catalog_bundle._delta_cache.clear()
+
+
+def test_encode_decode_round_trip():
+    records = [record('0001', 'Milk'), record('0002', 'Crème fraîche')]
+    header, body = decode(encode(7, 3, records, ['0003'], 1718000000.5))
+
+    assert header == {'version': 7, 'base_version': 3, 'built_at': 1718000000.5}
+    assert body == {'fields': list(BUNDLE_FIELDS), 'upsert': records, 'remove': ['0003']}
+
+
+def test_decode_rejects_other_data():
+    data = bytearray(encode(1, 0, [], [], 0.0))
+    data[:8] = b'NOTABNDL'
+    with pytest.raises(ValueError):
+        decode(bytes(data))
+
+
+def test_delta_brings_the_base_to_the_new_version():
+    kept, changed, removed = record('0001', 'Milk'), record('0002', 'Eggs'), record('0003', 'Bread')
+    added = record('0004', 'Butter')
+    base = [kept, changed, removed]
+    new = [kept, changed[:2] + ['Free range eggs'] + changed[3:], added]
+
+    delta = make_delta(encode(1, 0, base, [], 1.0), encode(2, 0, new, [], 2.0))
+    header, body = decode(delta)
+
+    assert header == {'version': 2, 'base_version': 1, 'built_at': 2.0}
+    assert sorted(entry[1] for entry in body['upsert']) == ['0002', '0004']
+    assert body['remove'] == ['0003']
+    assert apply_delta(base, body) == new
+
+
+def test_delta_between_equal_bundles_is_empty():
+    records = [record('0001', 'Milk')]
+    _, body = decode(make_delta(encode(1, 0, records, [], 1.0), encode(2, 0, records, [], 2.0)))
+    assert body['upsert'] == [] and body['remove'] == []
+
+
+class FakeCursor(list):
+    def sort(self, *args):
+        return self
+
+
+class FakeBundles:
+    def __init__(self, bundles=()):
+        self.bundles = {bundle['_id']: bundle for bundle in bundles}
+        self.finds = 0
+
+    def find_one(self, query, projection=None, sort=None):
+        return self.bundles[max(self.bundles)] if self.bundles else None
+
+    def find(self, query):
+        self.finds += 1
+        return FakeCursor(self.bundles[key] for key in query['_id']['$in'] if key in self.bundles)
+
+    def insert_one(self, document):
+        self.bundles[document['_id']] = document
+
+    def delete_many(self, query):
+        for key in [key for key in self.bundles if key <= query['_id']['$lte']]:
+            del self.bundles[key]
+
+
+class FakeProducts:
+    def __init__(self, products):
+        self.products = products
+
+    def find(self, query, projection):
+        return iter(self.products)
+
+
+class FakeInventory:
+    def __init__(self, products):
+        self.products = products
+
+    def aggregate(self, pipeline, allowDiskUse=False):
+        return iter({'_id': product['_id'], 'references': 1} for product in self.products)
+
+
+class FakeDb:
+    def __init__(self, bundles=(), products=()):
+        self.catalog_bundles = FakeBundles(bundles)
+        self.products = FakeProducts(products)
+        self.inventory = FakeInventory(products)
+
+
+def stored(version, records):
+    return {'_id': version, 'data': encode(version, 0, records, [], float(version))}
+
+
+def test_bundle_for_serves_deltas_full_bundles_and_nothing():
+    first, second = [record('0001', 'Milk')], [record('0001', 'Milk'), record('0002', 'Eggs')]
+    db = FakeDb([stored(1, first), stored(2, second)])
+
+    assert bundle_for(db, since_version=2) == (2, None)
+
+    version, payload = bundle_for(db, since_version=1)
+    header, body = decode(payload)
+    assert version == 2 and header['base_version'] == 1
+    assert apply_delta(first, body) == second
+
+    # Cached per (base, version) pair
+    finds = db.catalog_bundles.finds
+    assert bundle_for(db, since_version=1) == (version, payload)
+    assert db.catalog_bundles.finds == finds
+
+    for since_version in (0, 99):
+        version, payload = bundle_for(db, since_version=since_version)
+        header, body = decode(payload)
+        assert header['base_version'] == 0 and body['upsert'] == second
+
+    assert bundle_for(FakeDb(), since_version=0) == (None, None)
+
+
+def test_build_bundle_only_stores_changes():
+    products = [
+        {'_id': ObjectId(), 'barcode': '0002', 'name': 'Eggs'},
+        {'_id': ObjectId(), 'barcode': '0001', 'name': 'Milk'},
+    ]
+    db = FakeDb(products=products)
+
+    first = build_bundle(db)
+    assert first['version'] == 1 and first['products'] == 2 and first['changed']
+    _, body = decode(db.catalog_bundles.bundles[1]['data'])
+    assert [entry[1] for entry in body['upsert']] == ['0001', '0002']
+
+    assert build_bundle(db)['changed'] is False
+
+    products[0]['name'] = 'Free range eggs'
+    second = build_bundle(db)
+    assert second['version'] == 2 and second['changed']
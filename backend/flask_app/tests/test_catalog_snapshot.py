@@ -0,0 +1,130 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+
+import catalog_snapshot
+from catalog_snapshot import BARCODE_WIDTH, CatalogSnapshot, build_snapshot
+
+
+class FakeProducts:
+    def __init__(self, products):
+        self.products = products
+
+    def find(self, query, projection, batch_size=None):
+        return iter(self.products)
+
+
+def product(barcode, name, **fields):
+    return {'_id': ObjectId(), 'barcode': barcode, 'name': name, 'brand': 'Test', **fields}
+
+
+@pytest.fixture(autouse=True)
+def always_check_journal(monkeypatch):
+    monkeypatch.setattr(catalog_snapshot, 'CHECK_INTERVAL', 0.0)
+
+
+@pytest.fixture
+def products():
+    return [
+        product('3017620422003', 'Hazelnut Spread', category_id='snacks-sweets'),
+        product('123', 'Short Code'),
+        product('1234', 'Longer Code'),
+        product('', 'No Barcode'),
+        product('9' * (BARCODE_WIDTH + 1), 'Oversized Barcode'),
+    ] + [product(f'{index:013d}', f'Product {index}') for index in range(200)]
+
+
+@pytest.fixture
+def snapshot_path(tmp_path, products):
+    path = str(tmp_path / 'catalog.snapshot')
+    build_snapshot(SimpleNamespace(products=FakeProducts(products)), path)
+    return path
+
+
+def test_build_reports_counts(tmp_path, products):
+    path = str(tmp_path / 'catalog.snapshot')
+    result = build_snapshot(SimpleNamespace(products=FakeProducts(products)), path)
+    assert result['products'] == len(products)
+    assert result['bytes'] > 0
+
+
+def test_every_product_round_trips_by_id_and_barcode(snapshot_path, products):
+    catalog = CatalogSnapshot(snapshot_path)
+    for document in products:
+        record = catalog.by_id(document['_id'])
+        assert record['id'] == document['_id']
+        assert record['name'] == document['name']
+        if document['barcode'] and len(document['barcode']) <= BARCODE_WIDTH:
+            assert catalog.by_barcode(document['barcode'])['id'] == document['_id']
+    assert catalog.by_id(products[0]['_id'])['category_id'] == 'snacks-sweets'
+
+
+def test_lookups_miss_cleanly(snapshot_path, products):
+    catalog = CatalogSnapshot(snapshot_path)
+    # Bisect must not match a barcode that is only a prefix of another
+    assert catalog.by_barcode('12') is None
+    assert catalog.by_barcode('12345') is None
+    assert catalog.by_barcode('123')['name'] == 'Short Code'
+    assert catalog.by_barcode('0' * 14) is None
+    # Too long for the index: the caller falls back to MongoDB
+    assert catalog.by_barcode(products[4]['barcode']) is None
+    assert catalog.by_id(ObjectId()) is None
+    assert catalog.by_id('f' * 24) is None
+    # Keys sorting before the first and after the last entry
+    assert catalog.by_barcode('\0') is None
+    assert catalog.by_barcode('~') is None
+
+
+def test_missing_snapshot_defers_to_mongodb(tmp_path):
+    catalog = CatalogSnapshot(str(tmp_path / 'missing.snapshot'))
+    assert catalog.by_barcode('123') is None
+    assert catalog.warm() == 0
+
+
+def test_by_ids_leaves_out_unknown_ids(snapshot_path, products):
+    catalog = CatalogSnapshot(snapshot_path)
+    unknown = ObjectId()
+    records = catalog.by_ids([products[0]['_id'], unknown, products[1]['_id']])
+    assert set(records) == {products[0]['_id'], products[1]['_id']}
+
+
+def test_writes_reach_other_workers_through_the_journal(snapshot_path, products):
+    writer, reader = CatalogSnapshot(snapshot_path), CatalogSnapshot(snapshot_path)
+    assert reader.by_barcode('123')['name'] == 'Short Code'
+
+    renamed = dict(products[1], name='Renamed')
+    added = product('5000000000001', 'Added')
+    writer.record_write(renamed)
+    writer.record_write(added)
+    writer.record_write(products[2], deleted=True)
+
+    for catalog in (writer, reader):
+        assert catalog.by_barcode('123')['name'] == 'Renamed'
+        assert catalog.by_id(added['_id'])['barcode'] == '5000000000001'
+        # Tombstoned: not served from the snapshot any more
+        assert catalog.by_barcode('1234') is None
+        assert catalog.by_id(products[2]['_id']) is None
+
+
+def test_rebuild_is_picked_up_and_supersedes_older_journal_entries(snapshot_path, products, monkeypatch):
+    catalog = CatalogSnapshot(snapshot_path)
+    catalog.record_write(dict(products[1], name='Renamed'))
+    assert catalog.by_barcode('123')['name'] == 'Renamed'
+
+    time.sleep(0.01)
+    rebuilt = [dict(products[1], name='Rebuilt')] + products[2:]
+    build_snapshot(SimpleNamespace(products=FakeProducts(rebuilt)), snapshot_path)
+
+    # The rebuild contains the write; older journal entries only win within CLOCK_MARGIN
+    monkeypatch.setattr(catalog_snapshot, 'CLOCK_MARGIN', 0.0)
+    for reader in (catalog, CatalogSnapshot(snapshot_path)):
+        assert reader.by_barcode('123')['name'] == 'Rebuilt'
+        assert reader.by_id(products[0]['_id']) is None
+
+
+def test_rejects_files_that_are_not_snapshots(tmp_path):
+    path = tmp_path / 'catalog.snapshot'
+    path.write_bytes(b'\0' * 128)
+    assert CatalogSnapshot(str(path)).by_barcode('123') is None
@@ -0,0 +1,69 @@
+import pytest
+
+from categories import (
+    CATEGORIES,
+    CATEGORY_NAMES,
+    UNCATEGORIZED,
+    AhoCorasick,
+    category_fields,
+    category_id_for,
+    classify,
+)
+
+
+def test_automaton_reports_overlapping_matches():
+    matcher = AhoCorasick([('he', 'he'), ('she', 'she'), ('his', 'his'), ('hers', 'hers')])
+    assert sorted(matcher.iter_matches('ushers')) == [(1, 4, 'she'), (2, 4, 'he'), (2, 6, 'hers')]
+    assert list(matcher.iter_matches('')) == []
+    assert list(matcher.iter_matches('xyz')) == []
+
+
+@pytest.mark.parametrize('category_id, synonym', [
+    (category_id, synonym) for category_id, _, synonyms in CATEGORIES for synonym in synonyms
+])
+def test_every_synonym_classifies_to_its_category(category_id, synonym):
+    assert classify(synonym) == category_id
+
+
+@pytest.mark.parametrize('text, expected', [
+    # Leftmost-longest: the longer term wins over the one inside it
+    ('Frozen vegetables', 'frozen'),
+    ('Fruit juices', 'beverages'),
+    # Terms only match on word boundaries
+    ('Eggplant', 'fruits-vegetables'),
+    ('Hamster food pellets', UNCATEGORIZED),
+    ('en:cheeses', 'dairy-eggs'),
+    # Most matches wins; a tie goes to the later, more specific OFF category
+    ('Dairies, Fermented foods, Fermented milk products, Cheeses', 'dairy-eggs'),
+    ('Fruits, Frozen', 'frozen'),
+    ('Frozen, Fruits', 'fruits-vegetables'),
+    # Ignored roots consume their text instead of voting
+    ('Plant-based foods and beverages, Fruits', 'fruits-vegetables'),
+    ('Plant-based foods and beverages', UNCATEGORIZED),
+    ('FRESH FRUITS', 'fruits-vegetables'),
+])
+def test_classify(text, expected):
+    assert classify(text) == expected
+
+
+def test_classify_falls_through_to_the_next_text():
+    assert classify(None, '', 'Whole Milk') == 'dairy-eggs'
+    assert classify('Mystery item', 'Sourdough bread') == 'bakery-bread'
+    # The first text that matches anything decides, even if a later one would too
+    assert classify('Cheeses', 'Bread') == 'dairy-eggs'
+    assert classify() == UNCATEGORIZED
+    assert classify(None, '') == UNCATEGORIZED
+
+
+def test_category_id_for_accepts_ids_and_display_names():
+    assert category_id_for('dairy-eggs') == 'dairy-eggs'
+    assert category_id_for('  dairy & EGGS ') == 'dairy-eggs'
+    assert category_id_for(UNCATEGORIZED) == UNCATEGORIZED
+    assert category_id_for('Dairy') is None
+    assert category_id_for('') is None
+    assert category_id_for(None) is None
+
+
+def test_category_fields():
+    assert category_fields('Cheeses') == {'category_id': 'dairy-eggs', 'category': 'Dairy & Eggs'}
+    assert category_fields('') == {'category_id': UNCATEGORIZED, 'category': CATEGORY_NAMES[UNCATEGORIZED]}
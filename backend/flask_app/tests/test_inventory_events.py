@@ -0,0 +1,131 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from inventory_events import (
+    ROLLUP_LAG,
+    ROLLUP_STATE_ID,
+    consumption_forecast,
+    quantity_event,
+    record_quantity_change,
+    record_quantity_changes,
+    rollup_consumption,
+)
+
+NOW = datetime(2024, 6, 30, 12, 0)
+
+
+class FakeCursor(list):
+    def sort(self, key, direction):
+        return FakeCursor(sorted(self, key=lambda document: document[key], reverse=direction < 0))
+
+
+class FakeCollection:
+    def __init__(self, documents=()):
+        self.documents = list(documents)
+        self.pipelines = []
+
+    def insert_one(self, document):
+        self.documents.append(document)
+
+    def insert_many(self, documents, ordered=True):
+        self.documents.extend(documents)
+
+    def find(self, query, projection=None):
+        return FakeCursor(self.documents)
+
+    def find_one(self, query):
+        return next((document for document in self.documents if document['_id'] == query['_id']), None)
+
+    def update_one(self, query, update, upsert=False):
+        self.documents = [document for document in self.documents if document['_id'] != query['_id']]
+        self.documents.append({'_id': query['_id'], **update['$set']})
+
+    def aggregate(self, pipeline):
+        self.pipelines.append(pipeline)
+        return iter(())
+
+
+def fake_db(**collections):
+    names = ('inventory_events', 'inventory_daily', 'rollup_state')
+    return SimpleNamespace(**{name: collections.get(name, FakeCollection()) for name in names})
+
+
+def test_zero_deltas_are_not_recorded():
+    db = fake_db()
+    record_quantity_change(db, 'u', 'p', 'i', 0, 3, 'update')
+    record_quantity_changes(db, [quantity_event('u', 'p', 'i', 0, 3, 'update')])
+    assert db.inventory_events.documents == []
+
+    record_quantity_changes(db, [
+        quantity_event('u', 'p', 'i', 0, 3, 'update'),
+        quantity_event('u', 'p', 'i', -1, 2, 'consume', ts=NOW),
+    ])
+    assert db.inventory_events.documents == [{
+        'ts': NOW, 'meta': {'user_id': 'u', 'product_id': 'p'}, 'item_id': 'i',
+        'delta': -1.0, 'quantity': 2.0, 'reason': 'consume',
+    }]
+
+
+def test_rollup_reads_from_the_checkpoint_and_advances_it():
+    start = NOW - timedelta(hours=1)
+    db = fake_db(rollup_state=FakeCollection([{'_id': ROLLUP_STATE_ID, 'last_ts': start}]))
+
+    window = rollup_consumption(db, now=NOW)
+
+    assert window == {'from': start, 'to': NOW - ROLLUP_LAG}
+    match = db.inventory_events.pipelines[0][0]['$match']
+    assert match == {'ts': {'$gt': start, '$lte': NOW - ROLLUP_LAG}}
+    assert db.rollup_state.find_one({'_id': ROLLUP_STATE_ID})['last_ts'] == NOW - ROLLUP_LAG
+
+
+def test_rollup_inside_the_lag_does_nothing():
+    start = NOW - ROLLUP_LAG / 2
+    db = fake_db(rollup_state=FakeCollection([{'_id': ROLLUP_STATE_ID, 'last_ts': start}]))
+    assert rollup_consumption(db, now=NOW) == {'from': start, 'to': start}
+    assert db.inventory_events.pipelines == []
+
+
+def test_rollup_keeps_deletions_out_of_consumption():
+    db = fake_db()
+    rollup_consumption(db, now=NOW)
+    group = db.inventory_events.pipelines[0][2]['$group']
+    is_removal = {'$in': ['$reason', ['delete']]}
+    assert group['consumed']['$sum']['$cond'][0]['$and'][1] == {'$not': [is_removal]}
+    assert group['removed']['$sum']['$cond'][0]['$and'][1] == is_removal
+
+
+def daily(days_ago, added=0.0, consumed=0.0):
+    return {'day': datetime(2024, 6, 30) - timedelta(days=days_ago), 'added': added, 'consumed': consumed}
+
+
+def test_forecast_without_history():
+    db = fake_db()
+    assert consumption_forecast(db, 'u', 'p', 5, now=NOW) == {
+        'history_days': 0, 'daily_consumption': None, 'restock_interval_days': None, 'run_out_date': None
+    }
+
+
+def test_forecast_from_daily_rollups():
+    db = fake_db(inventory_daily=FakeCollection([
+        daily(0, consumed=2),
+        daily(10, added=6, consumed=3),
+        daily(5, consumed=5),
+        daily(20, added=6),
+    ]))
+
+    forecast = consumption_forecast(db, 'u', 'p', 4, now=NOW)
+
+    assert forecast['history_days'] == 20
+    assert forecast['daily_consumption'] == pytest.approx(0.5)
+    assert forecast['restock_interval_days'] == 10.0
+    assert forecast['run_out_date'] == NOW + timedelta(days=8)
+
+
+def test_forecast_without_consumption_has_no_run_out_date():
+    db = fake_db(inventory_daily=FakeCollection([daily(3, added=2)]))
+    forecast = consumption_forecast(db, 'u', 'p', 2, now=NOW)
+    assert forecast['daily_consumption'] == 0
+    assert forecast['restock_interval_days'] is None
+    assert forecast['run_out_date'] is None
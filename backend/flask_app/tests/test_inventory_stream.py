@@ -0,0 +1,89 @@
+import pytest
+from bson import ObjectId
+from pymongo.errors import CollectionInvalid
+
+import inventory_stream
+from inventory_stream import RESET_EVENT, InventoryHub
+
+
+class FakeCursor:
+    """Returns what is in the log when opened, then dies like a tailable cursor on a quiet log"""
+
+    def __init__(self, documents):
+        self.documents = list(documents)
+        self.alive = True
+
+    def max_await_time_ms(self, milliseconds):
+        return self
+
+    def __iter__(self):
+        yield from self.documents
+        self.alive = False
+
+
+class FakeDatabase:
+    def create_collection(self, name, **options):
+        raise CollectionInvalid(name)
+
+
+class FakeChangeLog:
+    name = 'inventory_changes'
+    database = FakeDatabase()
+
+    def __init__(self, documents=()):
+        self.documents = list(documents)
+
+    def find(self, cursor_type=None):
+        return FakeCursor(self.documents)
+
+    def insert_one(self, document):
+        self.documents.append(dict(document, _id=ObjectId()))
+
+
+def change(user_id, item):
+    return {'_id': ObjectId(), 'user_id': user_id, 'event': 'inventory-changed', 'data': {'item': item}}
+
+
+@pytest.fixture(autouse=True)
+def fast_retry(monkeypatch):
+    monkeypatch.setattr(inventory_stream, 'TAIL_RETRY_SECONDS', 0.01)
+
+
+def test_new_streams_do_not_receive_the_logged_backlog():
+    backlog = [change('u1', index) for index in range(3)]
+    hub = InventoryHub(FakeChangeLog(backlog))
+
+    subscription, replay = hub.subscribe('u1')
+
+    assert replay == []
+    assert subscription.next_frames(0.2) == []
+
+    hub.publish('u1', {'item': 'new'})
+    frames = subscription.next_frames(2.0)
+    assert len(frames) == 1 and b'"new"' in frames[0]
+
+
+def test_resume_replays_the_users_events_after_last_event_id():
+    backlog = [change('u1', 0), change('u2', 1), change('u1', 2), change('u1', 3)]
+    hub = InventoryHub(FakeChangeLog(backlog))
+
+    _, replay = hub.subscribe('u1', last_event_id=str(backlog[0]['_id']))
+    assert [frame.split(b'\n', 1)[0] for frame in replay] == [
+        b'id: %s' % str(backlog[2]['_id']).encode(),
+        b'id: %s' % str(backlog[3]['_id']).encode(),
+    ]
+
+    _, replay = hub.subscribe('u1', last_event_id=str(ObjectId()))
+    assert len(replay) == 1 and b'event: ' + RESET_EVENT.encode() in replay[0]
+
+
+def test_events_go_only_to_their_users_streams():
+    hub = InventoryHub(FakeChangeLog())
+    mine, _ = hub.subscribe('u1')
+    theirs, _ = hub.subscribe('u2')
+
+    hub.publish('u1', {'item': 'milk'})
+
+    assert len(mine.next_frames(2.0)) == 1
+    assert theirs.next_frames(0.2) == []
+    assert hub.subscriber_count() == 2
@@ -0,0 +1,40 @@
+from metrics import Counter, Histogram, _format_labels
+
+
+def test_counter_renders_one_line_per_label_set():
+    counter = Counter('requests_total', 'Requests', ('endpoint', 'status'))
+    counter.inc(('b', '200'))
+    counter.inc(('a', '500'), 2)
+    counter.inc(('b', '200'))
+
+    assert counter.render() == [
+        '# HELP requests_total Requests',
+        '# TYPE requests_total counter',
+        'requests_total{endpoint="a",status="500"} 2',
+        'requests_total{endpoint="b",status="200"} 2',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('latency_seconds', 'Latency', ('endpoint',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(('search',), value)
+
+    lines = histogram.render()
+    assert lines[2:] == [
+        'latency_seconds_bucket{endpoint="search",le="0.1"} 2',
+        'latency_seconds_bucket{endpoint="search",le="1.0"} 3',
+        'latency_seconds_bucket{endpoint="search",le="+Inf"} 4',
+        'latency_seconds_sum{endpoint="search"} 3.65',
+        'latency_seconds_count{endpoint="search"} 4',
+    ]
+
+
+def test_histogram_without_observations_renders_only_headers():
+    histogram = Histogram('latency_seconds', 'Latency', ('endpoint',))
+    assert histogram.render() == ['# HELP latency_seconds Latency', '# TYPE latency_seconds histogram']
+
+
+def test_label_values_are_escaped():
+    assert _format_labels(('path',), ('a"b\\c\nd',)) == '{path="a\\"b\\\\c\\nd"}'
+    assert _format_labels((), ()) == ''
@@ -0,0 +1,176 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+from bson import ObjectId
+
+from product_dedup import (
+    BANDS,
+    NUM_PERM,
+    band_keys,
+    compatible,
+    estimated_similarity,
+    find_clusters,
+    has_generated_barcode,
+    inventory_merge_ops,
+    jaccard,
+    normalize_text,
+    product_text,
+    shingles,
+    signature,
+    similarity_fields,
+)
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('Whole Milk 1 L', 'whole milk 1000ml'),
+    ('Whole milk 1000ml', 'whole milk 1000ml'),
+    ('Crème Fraîche 0,2kg', 'creme fraiche 200g'),
+    ('Pasta 16 oz', 'pasta 453.6g'),
+    ('The Best of Bread, with Seeds!', 'best bread seeds'),
+    # Units only count as units when they are the whole word
+    ('7 lives chips', '7 lives chips'),
+])
+def test_normalize_text(text, expected):
+    assert normalize_text(text) == expected
+
+
+def test_normalize_text_skips_missing_parts():
+    assert normalize_text('Brand', None, '', 'Name') == 'brand name'
+    assert normalize_text() == ''
+
+
+def test_product_text_drops_placeholder_brands():
+    assert product_text({'brand': 'Unknown Brand', 'name': 'Milk'}) == 'milk'
+    assert product_text({'brand': 'Acme', 'name': 'Milk', 'quantity': '1l'}) == 'acme milk 1000ml'
+
+
+def test_shingles_and_jaccard():
+    assert shingles('') == set()
+    assert shingles('ab') == {'ab'}
+    assert shingles('abcd') == {'abc', 'bcd'}
+    assert jaccard({'a', 'b'}, {'b', 'c'}) == pytest.approx(1 / 3)
+    assert jaccard(set(), {'a'}) == 0.0
+
+
+def test_compatible_needs_same_quantities_and_no_brand_conflict():
+    milk = {'brand': 'Acme', 'name': 'Whole Milk', 'quantity': '1 L'}
+    assert compatible(milk, {'brand': 'ACME', 'name': 'Whole milk', 'quantity': '1000 ml'})
+    assert compatible(milk, {'brand': 'Unknown brand', 'name': 'Whole milk 1l'})
+    assert compatible(milk, {'name': 'Whole milk', 'quantity': '1l'})
+    assert not compatible(milk, {'brand': 'Other', 'name': 'Whole Milk', 'quantity': '1 L'})
+    assert not compatible(milk, {'brand': 'Acme', 'name': 'Whole Milk', 'quantity': '2 L'})
+
+
+def test_signature_is_deterministic_uint32():
+    values = signature('acme whole milk 1000ml')
+    assert values.dtype == np.uint32 and values.shape == (NUM_PERM,)
+    assert np.array_equal(values, signature('acme whole milk 1000ml'))
+    assert (signature('') == np.iinfo(np.uint32).max).all()
+
+
+def test_estimated_similarity_tracks_jaccard():
+    texts = ('acme whole milk 1000ml', 'acme whole milk organic 1000ml', 'crunchy peanut butter 500g')
+    fields = [similarity_fields(text) for text in texts]
+
+    same = estimated_similarity(fields[0]['minhash'], fields[0]['minhash'])
+    close = estimated_similarity(fields[0]['minhash'], fields[1]['minhash'])
+    far = estimated_similarity(fields[0]['minhash'], fields[2]['minhash'])
+
+    assert same == 1.0
+    assert close == pytest.approx(jaccard(shingles(texts[0]), shingles(texts[1])), abs=0.2)
+    assert far < 0.2
+
+
+def test_band_keys_change_only_for_the_band_that_differs():
+    values = signature('acme whole milk 1000ml')
+    keys = band_keys(values)
+    assert len(keys) == BANDS and len(set(keys)) == BANDS
+    assert all(-2 ** 63 <= key < 2 ** 63 for key in keys)
+
+    changed = values.copy()
+    changed[NUM_PERM - 1] ^= 1
+    other = band_keys(changed)
+    assert other[:-1] == keys[:-1] and other[-1] != keys[-1]
+
+
+def test_identical_rows_in_different_bands_get_different_keys():
+    # The band number salts the hash, so equal rows do not collide across bands
+    keys = band_keys(np.zeros(NUM_PERM, dtype=np.uint32))
+    assert len(set(keys)) == BANDS
+
+
+def test_similarity_fields_are_stored_little_endian():
+    fields = similarity_fields('Whole Milk', brand='Acme', quantity='1 L')
+    values = signature('acme whole milk 1000ml')
+    assert bytes(fields['minhash']) == values.astype('<u4').tobytes()
+    assert fields['lsh_bands'] == band_keys(values)
+
+
+def test_has_generated_barcode():
+    assert has_generated_barcode({'barcode': '0123456789ab', 'barcode_generated': True})
+    # Only the flag counts: a real 12-digit UPC-A looks just like a generated code
+    assert not has_generated_barcode({'barcode': '737628064502'})
+    assert not has_generated_barcode({'barcode': '0123456789ab'})
+    assert not has_generated_barcode({'barcode': '3017620422003'})
+    assert not has_generated_barcode({})
+
+
+def test_find_clusters_never_merges_away_real_barcodes(monkeypatch):
+    def milk(barcode, created_at, **fields):
+        return {
+            '_id': ObjectId(), 'barcode': barcode, 'name': 'Whole Milk', 'brand': 'Acme', 'quantity': '1 L',
+            'created_at': created_at, 'minhash': similarity_fields('Whole Milk', 'Acme', '1 L')['minhash'],
+            **fields,
+        }
+
+    upc = milk('737628064502', datetime(2024, 1, 2))
+    ean = milk('3017620422003', datetime(2024, 1, 3))
+    custom = milk('0123456789ab', datetime(2024, 1, 1), barcode_generated=True)
+    products = [upc, ean, custom]
+
+    class Products:
+        def find(self, query, projection):
+            return iter(products)
+
+    monkeypatch.setattr('product_dedup.candidate_buckets', lambda db: [{'ids': [p['_id'] for p in products]}])
+    clusters = find_clusters(type('Db', (), {'products': Products()})())
+
+    # The oldest real barcode is canonical; only the made-up code goes
+    assert [(canonical['_id'], [d['_id'] for d in duplicates]) for canonical, duplicates in clusters] == [
+        (upc['_id'], [custom['_id']])
+    ]
+
+
+def item(user_id, product_id, quantity, status='active', expiry_date=None):
+    return {
+        '_id': ObjectId(), 'user_id': user_id, 'product_id': product_id,
+        'quantity': quantity, 'status': status, 'expiry_date': expiry_date,
+    }
+
+
+def test_inventory_merge_combines_each_users_active_items():
+    canonical, duplicate = ObjectId(), ObjectId()
+    alice, bob = ObjectId(), ObjectId()
+    alice_duplicate = item(alice, duplicate, 2, expiry_date=datetime(2024, 7, 1))
+    alice_canonical = item(alice, canonical, 1, expiry_date=datetime(2024, 7, 9))
+    bob_duplicate = item(bob, duplicate, 3)
+    consumed = item(bob, duplicate, 1, status='consumed')
+
+    ops = inventory_merge_ops([alice_duplicate, bob_duplicate, consumed, alice_canonical], canonical)
+    by_target = {(type(op).__name__, op._filter['_id']): getattr(op, '_doc', None) for op in ops}
+
+    # Alice's canonical item absorbs her duplicate, keeping the earliest expiry
+    assert by_target[('UpdateOne', alice_canonical['_id'])] == {
+        '$inc': {'quantity': 2}, '$set': {'expiry_date': datetime(2024, 7, 1)}
+    }
+    assert ('DeleteOne', alice_duplicate['_id']) in by_target
+    # Bob's only active item and his history are repointed
+    assert by_target[('UpdateOne', bob_duplicate['_id'])] == {'$set': {'product_id': canonical}}
+    assert by_target[('UpdateOne', consumed['_id'])] == {'$set': {'product_id': canonical}}
+    assert len(ops) == 4
+
+
+def test_inventory_merge_without_duplicates_is_a_no_op():
+    canonical = ObjectId()
+    assert inventory_merge_ops([item(ObjectId(), canonical, 1)], canonical) == []
@@ -0,0 +1,79 @@
+import threading
+
+import pytest
+
+from rate_limit import EXPENSIVE_ENDPOINTS, SLOTS_PER_GROUP, TokenBucketTable, check_request
+
+
+@pytest.fixture
+def table_path(tmp_path):
+    return str(tmp_path / 'ratelimit')
+
+
+def test_bucket_allows_capacity_then_reports_retry_after(table_path):
+    table = TokenBucketTable(table_path, slots=64, capacity=3, refill_per_second=0.5)
+    assert [table.consume('ip:1', now=100.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert table.consume('ip:1', now=100.0) == pytest.approx(2.0)
+
+
+def test_bucket_refills_over_time_up_to_capacity(table_path):
+    table = TokenBucketTable(table_path, slots=64, capacity=2, refill_per_second=1.0)
+    table.consume('ip:1', cost=2, now=100.0)
+    assert table.consume('ip:1', now=100.5) == pytest.approx(0.5)
+    assert table.consume('ip:1', now=101.0) == 0.0
+    # A long idle period does not bank more than capacity
+    assert table.consume('ip:1', cost=2, now=1000.0) == 0.0
+    assert table.consume('ip:1', now=1000.0) > 0
+
+
+def test_cost_above_capacity_is_capped(table_path):
+    table = TokenBucketTable(table_path, slots=64, capacity=5, refill_per_second=1.0)
+    assert table.consume('ip:1', cost=50, now=100.0) == 0.0
+
+
+def test_keys_have_separate_buckets(table_path):
+    table = TokenBucketTable(table_path, slots=64, capacity=1, refill_per_second=1.0)
+    assert table.consume('user:a', now=100.0) == 0.0
+    assert table.consume('user:b', now=100.0) == 0.0
+    assert table.consume('user:a', now=100.0) > 0
+
+
+def test_tables_on_the_same_file_share_buckets(table_path):
+    # Two mappings of one file stand in for two worker processes
+    first = TokenBucketTable(table_path, slots=64, capacity=2, refill_per_second=1.0)
+    second = TokenBucketTable(table_path, slots=64, capacity=2, refill_per_second=1.0)
+    first.consume('ip:1', cost=2, now=100.0)
+    assert second.consume('ip:1', now=100.0) == pytest.approx(1.0)
+
+
+def test_full_group_reuses_least_recently_used_slot(table_path):
+    table = TokenBucketTable(table_path, slots=SLOTS_PER_GROUP, capacity=1, refill_per_second=0.001)
+    keys = [f'ip:{index}' for index in range(SLOTS_PER_GROUP + 1)]
+    for offset, key in enumerate(keys[:-1]):
+        assert table.consume(key, now=100.0 + offset) == 0.0
+
+    # One more key evicts keys[0], which then starts over with a full bucket
+    assert table.consume(keys[-1], now=200.0) == 0.0
+    assert table.consume(keys[0], now=200.0) == 0.0
+    assert table.consume(keys[-1], now=200.0) > 0
+
+
+def test_no_refill_rate_blocks_for_an_hour(table_path):
+    table = TokenBucketTable(table_path, slots=64, capacity=1, refill_per_second=0)
+    table.consume('ip:1', now=100.0)
+    assert table.consume('ip:1', now=100.0) == 3600.0
+
+
+def test_check_request_rejections(table_path):
+    table = TokenBucketTable(table_path, slots=64, capacity=10, refill_per_second=1.0)
+    expensive = threading.BoundedSemaphore(1)
+    endpoint = EXPENSIVE_ENDPOINTS[0]
+
+    assert check_request(table, expensive, 'ip:1', endpoint) is None
+    status, payload, retry_after = check_request(table, expensive, 'ip:2', endpoint)
+    assert (status, retry_after) == (503, 1)
+
+    expensive.release()
+    status, payload, retry_after = check_request(table, expensive, 'ip:1', 'inventory.export_inventory')
+    assert status == 429
+    assert payload['retry_after'] == retry_after >= 1
@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from bson import ObjectId
+
+from restock_forecast import LOW_STOCK_QUANTITY, forecast, load_partition, smooth, suggestion_updates
+
+NOW = datetime(2024, 6, 30, 3, 0)
+
+
+def test_smooth_matches_the_scalar_recurrence():
+    consumption = np.array([[4.0, 0.0, 2.0, 1.0], [1.0, 1.0, 1.0, 1.0]])
+    level = 4.0
+    for value in (0.0, 2.0, 1.0):
+        level = 0.3 * value + 0.7 * level
+
+    assert smooth(consumption) == pytest.approx([level, 1.0])
+
+
+def test_smooth_single_day_is_that_day():
+    assert smooth(np.array([[3.0], [0.0]])) == pytest.approx([3.0, 0.0])
+
+
+def test_forecast_restocks_series_running_out_within_the_horizon():
+    consumption = np.ones((3, 5))
+    result = forecast(consumption, [3, 7, 30], horizon=7, cover=14)
+
+    assert result['days_left'] == pytest.approx([3, 7, 30])
+    assert result['restock'].tolist() == [True, True, False]
+    assert result['suggested_quantity'].tolist() == [11, 7, 0]
+
+
+def test_forecast_without_history_falls_back_to_low_stock():
+    consumption = np.zeros((2, 5))
+    result = forecast(consumption, [LOW_STOCK_QUANTITY, LOW_STOCK_QUANTITY + 1])
+
+    assert np.isinf(result['days_left']).all()
+    assert result['restock'].tolist() == [True, False]
+    assert result['suggested_quantity'].tolist() == [0, 0]
+
+
+def test_forecast_suggests_whole_units():
+    result = forecast(np.full((1, 3), 0.25), [1], cover=14)
+    assert result['suggested_quantity'].tolist() == [3]
+
+
+class FakeCursor(list):
+    def batch_size(self, size):
+        return self
+
+
+def test_load_partition_builds_the_consumption_matrix():
+    # Trailing zero bytes must survive the fixed-width numpy keys
+    user = ObjectId(b'user00000\0\0\0')
+    milk, eggs = ObjectId(b'milk00000\0\0\0'), ObjectId(b'eggs00000001')
+    since = datetime(2024, 6, 2)
+    db = SimpleNamespace(
+        inventory=SimpleNamespace(aggregate=lambda pipeline: iter([
+            {'_id': {'user_id': user, 'product_id': milk}, 'quantity': 2},
+        ])),
+        inventory_daily=SimpleNamespace(find=lambda query, projection: FakeCursor([
+            {'user_id': user, 'product_id': milk, 'day': since, 'consumed': 1.0},
+            {'user_id': user, 'product_id': milk, 'day': since + timedelta(days=3), 'consumed': 2.0},
+            {'user_id': user, 'product_id': eggs, 'day': since + timedelta(days=1), 'consumed': 6.0},
+            # Outside the window
+            {'user_id': user, 'product_id': eggs, 'day': since + timedelta(days=40), 'consumed': 6.0},
+        ])),
+    )
+
+    keys, consumption, quantity = load_partition(db, [user], since, window=4)
+
+    series = {bytes(key).ljust(24, b'\0'): index for index, key in enumerate(keys)}
+    milk_row, eggs_row = series[user.binary + milk.binary], series[user.binary + eggs.binary]
+    assert consumption[milk_row].tolist() == [1, 0, 0, 2]
+    assert consumption[eggs_row].tolist() == [0, 6, 0, 0]
+    assert quantity[milk_row] == 2 and quantity[eggs_row] == 0
+
+    result = forecast(consumption, quantity)
+    updates = suggestion_updates(keys, result, quantity, NOW, 'run')
+    filters = sorted((update._filter['product_id'], update._doc['$set']['restock']) for update in updates)
+    assert filters == sorted([(milk, True), (eggs, True)])
@@ -0,0 +1,87 @@
+import threading
+import time
+
+import pytest
+from bson import ObjectId
+
+import routes.inventory
+from routes.inventory import resolve_barcodes
+
+
+class FakeProducts:
+    def __init__(self):
+        self.upserted = []
+
+    def find(self, query, projection):
+        return iter(())
+
+    def find_one_and_update(self, query, update, upsert, return_document):
+        self.upserted.append(query['barcode'])
+        return dict(update['$setOnInsert'], _id=ObjectId(), barcode=query['barcode'])
+
+
+class FakeDb:
+    def __init__(self):
+        self.products = FakeProducts()
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setenv('ENSURE_INDEXES', 'false')
+    monkeypatch.setenv('SCAN_LOOKUP_WORKERS', '4')
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        yield app
+    app.lookup_executor.shutdown(wait=False, cancel_futures=True)
+
+
+def slow_lookup(seconds, calls):
+    def fetch(barcode, timeout=10):
+        calls.append((barcode, threading.current_thread().name, timeout))
+        time.sleep(min(seconds, timeout))
+        return {'name': f'Product {barcode}', 'barcode': barcode}
+    return fetch
+
+
+def test_lookups_are_limited_and_run_in_parallel(app, monkeypatch):
+    calls = []
+    monkeypatch.setattr(routes.inventory, 'fetch_open_food_facts_product', slow_lookup(0.2, calls))
+    db = FakeDb()
+    barcodes = {f'{index:013d}' for index in range(30)}
+
+    started = time.monotonic()
+    products = resolve_barcodes(db, barcodes, max_lookups=4, budget=5)
+
+    # Four lookups at once: about one lookup's time, not four
+    assert time.monotonic() - started < 0.6
+    assert len(calls) == 4 and len(products) == 4
+    assert {name for _, name, _ in calls} != {threading.current_thread().name}
+    assert all(product['name'] == f'Product {barcode}' for barcode, product in products.items())
+
+
+def test_lookups_share_one_budget(app, monkeypatch):
+    calls = []
+    monkeypatch.setattr(routes.inventory, 'fetch_open_food_facts_product', slow_lookup(2, calls))
+
+    started = time.monotonic()
+    products = resolve_barcodes(FakeDb(), {f'{index:013d}' for index in range(10)}, max_lookups=10, budget=0.3)
+
+    assert time.monotonic() - started < 1.0
+    assert products == {}
+    # Each lookup's own timeout is capped by the budget too
+    assert all(timeout == 0.3 for _, _, timeout in calls)
+
+
+def test_failed_lookups_are_left_out(app, monkeypatch):
+    import requests
+
+    def fetch(barcode, timeout=10):
+        if barcode == 'bad':
+            raise requests.exceptions.ConnectionError('down')
+        return None if barcode == 'unknown' else {'name': 'Milk', 'barcode': barcode}
+
+    monkeypatch.setattr(routes.inventory, 'fetch_open_food_facts_product', fetch)
+    products = resolve_barcodes(FakeDb(), {'bad', 'unknown', 'good'})
+    assert list(products) == ['good']
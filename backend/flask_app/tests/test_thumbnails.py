@@ -0,0 +1,82 @@
+import threading
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from thumbnails import (
+    DiskLRUCache,
+    HttpFetcher,
+    ThumbnailError,
+    ThumbnailService,
+    ThumbnailTimeout,
+    image_url_allowed,
+)
+
+
+def source_image():
+    buffer = BytesIO()
+    Image.new('RGB', (400, 300), 'orange').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize('url, allowed', [
+    ('https://images.openfoodfacts.org/images/products/1.jpg', True),
+    ('http://openfoodfacts.org/1.jpg', True),
+    ('https://openfoodfacts.org.evil.example/1.jpg', False),
+    ('https://evilopenfoodfacts.org/1.jpg', False),
+    ('ftp://openfoodfacts.org/1.jpg', False),
+    ('file:///etc/passwd', False),
+    ('not a url', False),
+])
+def test_image_url_allowed(url, allowed):
+    assert image_url_allowed(url, ('openfoodfacts.org',)) is allowed
+
+
+def test_empty_allowlist_allows_any_http_host():
+    assert image_url_allowed('https://example.com/1.jpg', ())
+    assert not image_url_allowed('gopher://example.com/1.jpg', ())
+
+
+@pytest.mark.parametrize('url', [
+    'http://127.0.0.1/1.jpg',
+    'http://169.254.169.254/latest/meta-data',
+    'http://10.0.0.1/1.jpg',
+    'http://[::1]/1.jpg',
+])
+def test_fetcher_refuses_private_addresses(url):
+    with pytest.raises(ThumbnailError):
+        HttpFetcher(allowed_hosts=()).check(url)
+
+
+def test_thumbnails_are_resized_and_cached(tmp_path):
+    fetches = []
+
+    def fetcher(url):
+        fetches.append(url)
+        return source_image()
+
+    service = ThumbnailService(DiskLRUCache(str(tmp_path), 10 * 1024 * 1024), fetcher)
+    first = service.get('https://openfoodfacts.org/1.png', 64)
+    assert Image.open(BytesIO(first)).size == (64, 48)
+    assert service.get('https://openfoodfacts.org/1.png', 64) == first
+    service.get('https://openfoodfacts.org/1.png', 128)
+    assert len(fetches) == 1
+
+
+def test_slow_renders_raise_thumbnail_timeout(tmp_path):
+    release = threading.Event()
+
+    def fetcher(url):
+        release.wait(5)
+        return source_image()
+
+    service = ThumbnailService(DiskLRUCache(str(tmp_path), 10 * 1024 * 1024), fetcher, timeout=0.05)
+    with pytest.raises(ThumbnailTimeout) as raised:
+        service.get('https://openfoodfacts.org/1.png', 64)
+    assert isinstance(raised.value, ThumbnailError)
+
+    # The render carries on and a later request gets its result
+    release.set()
+    service.timeout = 5
+    assert Image.open(BytesIO(service.get('https://openfoodfacts.org/1.png', 64))).size == (64, 48)
@@ -0,0 +1,295 @@
+"""Product thumbnail proxy: fetch once, resize on a worker pool, cache on disk.
+
+Thumbnails are keyed by source URL and size. ``ThumbnailService.get`` first
+looks in a size-bounded on-disk cache. On a miss it fetches the source image
+through a pluggable fetcher (HttpFetcher in production, DirectoryFetcher for
+local development and benchmarks), also caching the source so other sizes
+reuse it. The resize runs on a small thread pool so Pillow work is bounded
+no matter how many request threads ask at once. Concurrent misses for the
+same key share one in-flight job.
+
+Product image URLs are user input, so HttpFetcher only fetches http(s) URLs
+on THUMBNAIL_ALLOWED_HOSTS (Open Food Facts by default) whose addresses are
+all public. Redirects are followed by hand and every hop is checked again.
+
+Cache files are written atomically and touched on every hit. Once the
+cache directory grows past its byte budget, the least recently used files
+are deleted. The budget covers every worker process sharing the directory.
+"""
+import fcntl
+import hashlib
+import ipaddress
+import os
+import socket
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from io import BytesIO
+from urllib.parse import urljoin, urlparse
+
+from metrics import upstream_timer
+
+THUMBNAIL_SIZES = (64, 128, 256, 512)
+DEFAULT_SIZE = 128
+CONTENT_TYPE = 'image/jpeg'
+JPEG_QUALITY = 85
+MAX_SOURCE_BYTES = 10 * 1024 * 1024
+MAX_REDIRECTS = 3
+DEFAULT_ALLOWED_HOSTS = ('openfoodfacts.org',)
+
+
+class ThumbnailError(Exception):
+    """The source image could not be fetched or decoded"""
+
+
+class ThumbnailTimeout(ThumbnailError):
+    """The thumbnail was not ready within ThumbnailService.timeout"""
+
+
+def default_cache_dir():
+    return os.path.join(tempfile.gettempdir(), 'grocerstock-thumbnails')
+
+
+def image_version(image_url):
+    """Short digest of the source URL, used to make thumbnail URLs immutable"""
+    return hashlib.sha1(image_url.encode()).hexdigest()[:12]
+
+
+def thumbnail_path(product_id, image_url, size=DEFAULT_SIZE):
+    """Versioned, cacheable thumbnail path for a product, or None without an image"""
+    if not image_url or not product_id:
+        return None
+    return f'/api/products/{product_id}/thumbnail?size={size}&v={image_version(image_url)}'
+
+
+def image_url_allowed(url, allowed_hosts):
+    """Whether url is http(s) on one of allowed_hosts or a subdomain; any host if allowed_hosts is empty"""
+    parsed = urlparse(url)
+    host = (parsed.hostname or '').lower()
+    if parsed.scheme not in ('http', 'https') or not host:
+        return False
+    return not allowed_hosts or any(host == allowed or host.endswith('.' + allowed) for allowed in allowed_hosts)
+
+
+def resolves_to_public(url):
+    """Whether every address the url's host resolves to is globally routable"""
+    parsed = urlparse(url)
+    try:
+        addresses = socket.getaddrinfo(parsed.hostname, parsed.port or 443, proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError):
+        return False
+    # Rejects private, loopback, link-local (cloud metadata) and reserved ranges
+    return bool(addresses) and all(
+        ipaddress.ip_address(address[4][0].split('%')[0]).is_global for address in addresses
+    )
+
+
+class HttpFetcher:
+    """Fetch source images over HTTP with a size cap, from allowed public hosts only"""
+
+    def __init__(self, allowed_hosts=DEFAULT_ALLOWED_HOSTS, timeout=10, max_bytes=MAX_SOURCE_BYTES):
+        self.allowed_hosts = tuple(allowed_hosts)
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+
+    def check(self, url):
+        if not image_url_allowed(url, self.allowed_hosts) or not resolves_to_public(url):
+            raise ThumbnailError(f'Image host not allowed: {urlparse(url).hostname}')
+
+    def __call__(self, url):
+        import requests
+
+        try:
+            with upstream_timer('product_images') as timer:
+                for _ in range(MAX_REDIRECTS + 1):
+                    self.check(url)
+                    with requests.get(url, timeout=self.timeout, stream=True, allow_redirects=False) as response:
+                        timer.outcome = response.status_code
+                        if response.is_redirect:
+                            url = urljoin(url, response.headers['Location'])
+                            continue
+                        response.raise_for_status()
+                        data = bytearray()
+                        for piece in response.iter_content(65536):
+                            data.extend(piece)
+                            if len(data) > self.max_bytes:
+                                raise ThumbnailError(f'Source image larger than {self.max_bytes} bytes')
+                        return bytes(data)
+                raise ThumbnailError(f'More than {MAX_REDIRECTS} redirects')
+        except requests.exceptions.RequestException as e:
+            raise ThumbnailError(str(e)) from e
+
+
+class DirectoryFetcher:
+    """Serve source images from a local directory by URL file name (stub for development)"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def __call__(self, url):
+        path = os.path.join(self.directory, os.path.basename(urlparse(url).path))
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError as e:
+            raise ThumbnailError(str(e)) from e
+
+
+class DiskLRUCache:
+    """Byte-bounded file cache with least-recently-used eviction
+
+    Worker processes share the directory, so the size is measured on disk
+    rather than tracked per process. Every put re-scans the directory under
+    an fcntl lock and deletes the files with the oldest modification times,
+    which get() refreshes. Puts only happen after a fetch and resize, which
+    cost far more than the scan.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        # fcntl locks belong to the process, so a descriptor inherited across fork still excludes other workers
+        self._lock_fd = os.open(os.path.join(directory, '.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+
+    @staticmethod
+    def file_name(key):
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def get(self, key):
+        path = os.path.join(self.directory, self.file_name(key))
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, key, data):
+        name = self.file_name(key)
+        fd, tmp_path = tempfile.mkstemp(prefix='.tmp', dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, os.path.join(self.directory, name))
+
+        with self._lock:
+            fcntl.lockf(self._lock_fd, fcntl.LOCK_EX)
+            try:
+                self._evict(keep=name)
+            finally:
+                fcntl.lockf(self._lock_fd, fcntl.LOCK_UN)
+
+    def _files(self):
+        files = []
+        for entry in os.scandir(self.directory):
+            # Skips the lock file and other writers' temporary files
+            if entry.name.startswith('.'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, entry.name, stat.st_size))
+        return files
+
+    def _evict(self, keep):
+        files = self._files()
+        total = sum(size for _, _, size in files)
+        for _, name, size in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    @property
+    def total_bytes(self):
+        return sum(size for _, _, size in self._files())
+
+
+def resize_image(data, size):
+    """Fit an image into a size x size box and encode it as JPEG"""
+    # Pillow is only needed once a thumbnail is actually rendered
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        image = Image.open(BytesIO(data))
+        image.draft('RGB', (size, size))
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        raise ThumbnailError(f'Unreadable source image: {e}') from e
+
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+class ThumbnailService:
+    def __init__(self, cache, fetcher, workers=2, timeout=30):
+        self.cache = cache
+        self.fetcher = fetcher
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='thumbnail')
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    def get(self, image_url, size):
+        """JPEG thumbnail bytes for image_url, rendering it on a miss"""
+        key = f'{size}|{image_url}'
+        data = self.cache.get(key)
+        if data is not None:
+            return data
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is None:
+                future = self._pool.submit(self._render, image_url, size, key)
+                self._in_flight[key] = future
+                future.add_done_callback(lambda _: self._forget(key))
+        try:
+            return future.result(timeout=self.timeout)
+        except FuturesTimeoutError as e:
+            # The render keeps going and caches its result for the next request
+            raise ThumbnailTimeout(f'Thumbnail not ready after {self.timeout}s') from e
+
+    def _forget(self, key):
+        with self._lock:
+            self._in_flight.pop(key, None)
+
+    def _render(self, image_url, size, key):
+        source_key = f'source|{image_url}'
+        source = self.cache.get(source_key)
+        if source is None:
+            source = self.fetcher(image_url)
+            self.cache.put(source_key, source)
+
+        data = resize_image(source, size)
+        self.cache.put(key, data)
+        return data
+
+
+def create_thumbnail_service(app):
+    if app.config['THUMBNAIL_SOURCE_DIR']:
+        fetcher = DirectoryFetcher(app.config['THUMBNAIL_SOURCE_DIR'])
+    else:
+        fetcher = HttpFetcher(app.config['THUMBNAIL_ALLOWED_HOSTS'])
+    cache = DiskLRUCache(app.config['THUMBNAIL_CACHE_DIR'], app.config['THUMBNAIL_CACHE_MAX_MB'] * 1024 * 1024)
+    return ThumbnailService(cache, fetcher, workers=app.config['THUMBNAIL_WORKERS'])
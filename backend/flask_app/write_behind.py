@@ -0,0 +1,139 @@
+import atexit
+import logging
+import os
+import threading
+import time
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    """Coalesce non-critical updates in memory and flush them in batches.
+
+    Updates are keyed by (collection, _id). Repeated ``$set``/``$max`` writes to
+    the same document keep only the latest value, ``$inc`` writes are summed.
+    Everything pending is sent as one unordered ``bulk_write`` per collection
+    every ``flush_interval`` seconds, when ``max_entries`` documents are
+    pending, and at interpreter shutdown.
+
+    Only use this for data that can be lost on a crash (last-seen timestamps,
+    popularity counters); a failed flush is logged and dropped.
+    """
+
+    OPERATORS = ('$set', '$max', '$inc')
+
+    def __init__(self, db, flush_interval=5.0, max_entries=500):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.max_entries = max_entries
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+        self._pid = None
+        atexit.register(self.stop)
+
+    def set(self, collection, doc_id, fields):
+        """Record a $set; the latest value per field wins"""
+        self._record(collection, doc_id, '$set', fields)
+
+    def max(self, collection, doc_id, fields):
+        """Record a $max; useful for timestamps so late flushes never go backwards"""
+        self._record(collection, doc_id, '$max', fields)
+
+    def inc(self, collection, doc_id, fields):
+        """Record an $inc; amounts for the same field are summed"""
+        self._record(collection, doc_id, '$inc', fields)
+
+    def _record(self, collection, doc_id, operator, fields):
+        if self._stopped:
+            self.db[collection].update_one({'_id': doc_id}, {operator: fields})
+            return
+
+        self._ensure_flusher()
+
+        with self._lock:
+            update = self._pending.setdefault((collection, doc_id), {})
+            current = update.setdefault(operator, {})
+            for field, value in fields.items():
+                if operator == '$inc':
+                    current[field] = current.get(field, 0) + value
+                elif operator == '$max' and field in current:
+                    current[field] = value if value > current[field] else current[field]
+                else:
+                    current[field] = value
+            full = len(self._pending) >= self.max_entries
+
+        if full:
+            self._wakeup.set()
+
+    def _ensure_flusher(self):
+        # The flusher thread is started lazily so that a buffer created in a
+        # pre-fork master gets its own thread in every worker process.
+        pid = os.getpid()
+        if self._pid == pid and self._thread is not None and self._thread.is_alive():
+            return
+
+        with self._lock:
+            if self._pid != pid:
+                self._pending = {}
+                self._flush_lock = threading.Lock()
+                self._pid = pid
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='write-behind-flusher', daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """Send every pending update; returns the number of documents written"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+
+            if not pending:
+                return 0
+
+            by_collection = {}
+            for (collection, doc_id), update in pending.items():
+                by_collection.setdefault(collection, []).append(
+                    UpdateOne({'_id': doc_id}, update)
+                )
+
+            written = 0
+            for collection, operations in by_collection.items():
+                started = time.perf_counter()
+                try:
+                    self.db[collection].bulk_write(operations, ordered=False)
+                    written += len(operations)
+                except Exception:
+                    logger.exception(
+                        'Write-behind flush to %s failed, dropped %d updates',
+                        collection, len(operations)
+                    )
+                    continue
+                logger.debug(
+                    'Write-behind flushed %d updates to %s in %.1f ms',
+                    len(operations), collection, (time.perf_counter() - started) * 1000
+                )
+            return written
+
+    def stop(self):
+        """Flush remaining updates and stop the background thread"""
+        if self._stopped:
+            return
+        self._stopped = True
+        self._wakeup.set()
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            self._thread.join(timeout=self.flush_interval)
+        self.flush()
@@ -6,6 +6,9 @@ db.createCollection('products');
 db.createCollection('inventory');
 db.createCollection('generated_barcodes');
 
+// Indexes are also declared in backend/flask_app/indexes.py, which the Flask
+// app applies at startup; keep the two in sync.
+
 // Create indexes for users collection
 db.users.createIndex({ "email": 1 }, { unique: true });
 db.users.createIndex({ "username": 1 }, { unique: true });
@@ -13,34 +16,47 @@ db.users.createIndex({ "created_at": -1 });
 
 // Create indexes for products collection
 db.products.createIndex({ "barcode": 1 }, { unique: true });
-db.products.createIndex({ "category": 1 });
+db.products.createIndex({ "category_id": 1 });
 db.products.createIndex({ "name": "text", "brand": "text" });
 db.products.createIndex({ "created_at": -1 });
+db.products.createIndex({ "lsh_bands": 1 });
 
 // Create indexes for inventory collection
-db.inventory.createIndex({ "user_id": 1, "product_id": 1 });
-db.inventory.createIndex({ "expiry_date": 1 });
-db.inventory.createIndex({ "status": 1 });
-db.inventory.createIndex({ "user_id": 1, "expiry_date": 1 });
-db.inventory.createIndex({ "created_at": -1 });
+db.inventory.createIndex({ "user_id": 1, "product_id": 1, "status": 1 });
+db.inventory.createIndex({ "user_id": 1, "status": 1, "expiry_date": 1 });
+db.inventory.createIndex({ "user_id": 1, "status": 1, "category_id": 1, "expiry_date": 1 });
+db.inventory.createIndex({ "product_id": 1 });
 
 // Create indexes for generated_barcodes collection
 db.generated_barcodes.createIndex({ "custom_barcode": 1 }, { unique: true });
-db.generated_barcodes.createIndex({ "user_id": 1 });
-db.generated_barcodes.createIndex({ "created_at": -1 });
+db.generated_barcodes.createIndex({ "user_id": 1, "created_at": -1 });
+
+// Quantity change history (time-series) and its daily rollups
+db.createCollection("inventory_events", {
+  timeseries: { timeField: "ts", metaField: "meta", granularity: "hours" }
+});
+db.inventory_events.createIndex({ "meta.user_id": 1, "meta.product_id": 1, "ts": 1 });
+db.inventory_daily.createIndex({ "user_id": 1, "product_id": 1, "day": 1 }, { unique: true });
+
+// Capped log every Flask worker tails for GET /api/inventory/stream
+db.createCollection("inventory_changes", { capped: true, size: 8388608, max: 1000 });
+
+// Create indexes for restock_suggestions collection
+db.restock_suggestions.createIndex({ "user_id": 1, "product_id": 1 }, { unique: true });
+db.restock_suggestions.createIndex({ "user_id": 1, "restock": 1, "run_out_date": 1 });
 
 // Insert sample categories for reference
 db.categories.insertMany([
-  { name: "Fruits & Vegetables", description: "Fresh fruits and vegetables" },
-  { name: "Dairy & Eggs", description: "Milk, cheese, eggs, and dairy products" },
-  { name: "Meat & Seafood", description: "Fresh meat, poultry, and seafood" },
-  { name: "Bakery & Bread", description: "Bread, pastries, and baked goods" },
-  { name: "Pantry & Dry Goods", description: "Canned goods, pasta, rice, etc." },
-  { name: "Beverages", description: "Drinks, juices, water, etc." },
-  { name: "Frozen Foods", description: "Frozen vegetables, meals, ice cream" },
-  { name: "Snacks & Sweets", description: "Chips, cookies, candy, etc." },
-  { name: "Household & Cleaning", description: "Cleaning supplies, paper products" },
-  { name: "Personal Care", description: "Toiletries, hygiene products" }
+  { id: "fruits-vegetables", name: "Fruits & Vegetables", description: "Fresh fruits and vegetables" },
+  { id: "dairy-eggs", name: "Dairy & Eggs", description: "Milk, cheese, eggs, and dairy products" },
+  { id: "meat-seafood", name: "Meat & Seafood", description: "Fresh meat, poultry, and seafood" },
+  { id: "bakery-bread", name: "Bakery & Bread", description: "Bread, pastries, and baked goods" },
+  { id: "pantry", name: "Pantry & Dry Goods", description: "Canned goods, pasta, rice, etc." },
+  { id: "beverages", name: "Beverages", description: "Drinks, juices, water, etc." },
+  { id: "frozen", name: "Frozen Foods", description: "Frozen vegetables, meals, ice cream" },
+  { id: "snacks-sweets", name: "Snacks & Sweets", description: "Chips, cookies, candy, etc." },
+  { id: "household", name: "Household & Cleaning", description: "Cleaning supplies, paper products" },
+  { id: "personal-care", name: "Personal Care", description: "Toiletries, hygiene products" }
 ]);
 
 print('GrocerStock database initialized successfully');
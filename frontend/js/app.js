@@ -5,6 +5,9 @@ class GrocerStockApp {
         this.currentPage = 'dashboard';
         this.inventory = [];
         this.socket = null;
+        this.inventoryStream = null;
+        this.lastWrite = null;
+        this.offlineCatalog = null;
         this.init();
     }
 
@@ -14,6 +17,7 @@ class GrocerStockApp {
         this.setupEventListeners();
         this.setupNavigation();
         this.setupRealTimeConnection();
+        this.syncOfflineCatalog();
         
         // Hide splash screen after 2 seconds
         setTimeout(() => {
@@ -309,6 +313,7 @@ class GrocerStockApp {
                 localStorage.setItem('authToken', data.access_token);
                 this.currentUser = data.user;
                 this.showAuthenticatedUI();
+                this.syncOfflineCatalog();
                 this.showNotification('Login successful!', 'success');
             } else {
                 const error = await response.json();
@@ -367,6 +372,8 @@ class GrocerStockApp {
         this.currentUser = null;
         this.socket?.disconnect();
         this.socket = null;
+        this.inventoryStream?.close();
+        this.inventoryStream = null;
         this.showLoginPage();
         this.showNotification('Logged out successfully', 'success');
     }
@@ -474,11 +481,21 @@ class GrocerStockApp {
             headers['Authorization'] = `Bearer ${token}`;
         }
 
+        // Lets the server keep our reads off secondaries that may not have our last write yet
+        if (this.lastWrite) {
+            headers['X-Read-After'] = this.lastWrite;
+        }
+
         const response = await fetch(url, {
             ...options,
             headers
         });
 
+        const lastWrite = response.headers.get('X-Last-Write');
+        if (lastWrite) {
+            this.lastWrite = lastWrite;
+        }
+
         if (response.status === 401) {
             this.logout();
             throw new Error('Authentication required');
@@ -505,23 +522,88 @@ class GrocerStockApp {
         throw new Error('Failed to fetch barcodes');
     }
 
+    // Offline catalog: the most-stocked products, so most scans resolve without the network
+    async syncOfflineCatalog() {
+        if (!this.currentUser) return;
+
+        try {
+            const stored = JSON.parse(localStorage.getItem('offlineCatalog') || 'null');
+            const catalog = stored || { version: 0, products: {} };
+            const response = await this.fetchWithAuth(`/api/products/catalog?since_version=${catalog.version}`);
+            if (response.status === 200) {
+                const { header, body } = await this.decodeCatalogBundle(response);
+                const barcodeField = body.fields.indexOf('barcode');
+                // A full bundle (base version 0) replaces whatever we had
+                const products = header.baseVersion === 0 ? {} : catalog.products;
+                for (const record of body.upsert) {
+                    products[record[barcodeField]] = Object.fromEntries(body.fields.map((field, i) => [field, record[i]]));
+                }
+                body.remove.forEach((barcode) => delete products[barcode]);
+                catalog.version = header.version;
+                catalog.products = products;
+                localStorage.setItem('offlineCatalog', JSON.stringify(catalog));
+            }
+            this.offlineCatalog = catalog;
+        } catch (error) {
+            // Offline or no bundle built yet: keep whatever we have
+            console.warn('Offline catalog sync failed:', error);
+            this.offlineCatalog = JSON.parse(localStorage.getItem('offlineCatalog') || 'null');
+        }
+    }
+
+    async decodeCatalogBundle(response) {
+        // Header layout: see catalog_bundle.py (magic, version, base version, upserts, removals, built_at)
+        const data = await response.arrayBuffer();
+        const view = new DataView(data);
+        const header = {
+            version: view.getUint32(8, true),
+            baseVersion: view.getUint32(12, true)
+        };
+        const stream = new Blob([data.slice(32)]).stream().pipeThrough(new DecompressionStream('deflate'));
+        const body = JSON.parse(await new Response(stream).text());
+        return { header, body };
+    }
+
+    async resolveBarcode(barcode) {
+        const product = this.offlineCatalog?.products[barcode];
+        if (product) {
+            return { found: true, source: 'offline', product };
+        }
+        const response = await this.fetchWithAuth(`/api/products/search?barcode=${encodeURIComponent(barcode)}`);
+        if (response.ok) {
+            return response.json();
+        }
+        throw new Error('Failed to look up barcode');
+    }
+
     // Real-time setup
     setupRealTimeConnection() {
         if (!this.currentUser) return;
 
+        // Inventory changes come straight from the Flask write paths;
+        // EventSource reconnects by itself and resumes from the last event
+        const token = localStorage.getItem('authToken');
+        this.inventoryStream = new EventSource(`/api/inventory/stream?jwt=${encodeURIComponent(token)}`);
+
+        this.inventoryStream.addEventListener('inventory-changed', (event) => {
+            const data = JSON.parse(event.data);
+            this.lastWrite = String(Math.max(Number(this.lastWrite) || 0, data.written_at));
+            this.handleInventoryUpdate(data);
+        });
+
+        this.inventoryStream.addEventListener('reset', () => {
+            // Missed changes are no longer in the server's history
+            this.handleInventoryUpdate(null);
+        });
+
         try {
             this.socket = io('http://localhost:3000');
             
             this.socket.on('connect', () => {
                 console.log('Connected to real-time service');
-                this.socket.emit('join-inventory', this.currentUser.id);
                 this.socket.emit('subscribe-expiry', this.currentUser.id);
             });
 
-            this.socket.on('inventory-changed', (data) => {
-                this.handleInventoryUpdate(data);
-            });
-
             this.socket.on('expiry-alert', (data) => {
                 this.handleExpiryAlert(data);
             });